@@ -1,37 +1,198 @@
 """
 图书馆管理系统 - Flask后端API服务
 """
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from datetime import datetime, timedelta
-import hashlib
+from bisect import bisect_right
+from functools import wraps
+from itertools import islice
+import base64
+import cProfile
+import gzip
+import io
 import json
+import math
+import operator
 import os
+import pstats
+import random
+import time
+import zlib
+
+from auth import RevocationList, TokenError, TokenSigner, legacy_hash, load_secret, make_password, needs_upgrade, verify_password
+from bulk import FORMATS, clean_book, clean_price, clean_total, export_rows, read_rows
+from cache import ResponseCache
+from denorm import propagate, references
+from holds import ACTIVE_STATUSES, HOLD_PICKUP_DAYS, HoldQueue
+from metrics import Metrics
+from models import MODELS, Record, due_at, record_json
+from recommend import Recommender
+from repository import DEFAULT_COLLECTIONS, Repository
+from scheduler import DueDateScheduler, compute_fine
+from search import SearchIndex
+from stats import GRANULARITIES, BorrowTimeline, StatisticsEngine
+from storage import JsonStorage, Journal, SqliteStorage
+
+
+
+class RecordJSONProvider(DefaultJSONProvider):
+    """响应中的记录对象（models.Record）按字典输出"""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, Record):
+            return o.to_dict()
+        return DefaultJSONProvider.default(o)
+
 
 app = Flask(__name__)
+app.json = RecordJSONProvider(app)
 CORS(app)
 
-# 数据存储路径
-DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+# 数据存储路径（可用 LIBRARY_DATA_DIR 指定其他目录，例如性能测试使用的临时数据）
+DATA_DIR = os.environ.get('LIBRARY_DATA_DIR') or os.path.join(os.path.dirname(__file__), 'data')
 os.makedirs(DATA_DIR, exist_ok=True)
 
+# 存储模式：json 每次提交重写整个文件；journal 只向日志追加变更，定期压缩回快照；
+# sqlite 使用本地 SQLite 数据库（先用 manage.py migrate-sqlite 导入已有的 JSON 数据）
+STORAGE_BACKEND = os.environ.get('LIBRARY_STORAGE', 'json')
+SQLITE_PATH = os.environ.get('LIBRARY_SQLITE_PATH', os.path.join(DATA_DIR, 'library.db'))
+# JSON 数据文件格式：pretty（默认，缩进排版）、compact（紧凑）、columnar（按列存储），见 storage.JSON_FORMATS
+DATA_FORMAT = os.environ.get('LIBRARY_DATA_FORMAT', 'pretty')
+
+# 进程级数据仓库（各集合常驻内存，数据变化时自动重新加载）
+# 写操作在 repo.transaction() 中进行，数据目录下的文件锁保证多个 worker 进程之间互斥
+if STORAGE_BACKEND == 'journal':
+    repo = Repository(JsonStorage(DATA_DIR, DATA_FORMAT), journal=Journal(os.path.join(DATA_DIR, 'journal.log')),
+                      lock_dir=DATA_DIR, models=MODELS)
+elif STORAGE_BACKEND == 'sqlite':
+    repo = Repository(SqliteStorage(SQLITE_PATH), lock_dir=os.path.dirname(SQLITE_PATH), models=MODELS)
+else:
+    repo = Repository(JsonStorage(DATA_DIR, DATA_FORMAT), lock_dir=DATA_DIR, models=MODELS)
+
+# 数据文件与配置的格式不同时（例如切换格式后的旧文件），启动时整体改写一次
+if isinstance(repo.storage, JsonStorage) and \
+        any(repo.storage.file_format(name) not in (None, DATA_FORMAT) for name in DEFAULT_COLLECTIONS):
+    for name in DEFAULT_COLLECTIONS:
+        repo.collection(name)
+    repo.compact()
+
+# 图书检索索引（随 books 集合增量更新）
+book_index = SearchIndex()
+repo.subscribe('books', book_index)
+books_by_id = repo.create_ordered_index('books', 'id')
+books_by_isbn = repo.create_index('books', 'isbn')
+
+def publish_year(book):
+    """出版年份（publishDate 的前四位），没有时返回 None"""
+    year = (book.get('publishDate') or '')[:4]
+    return year if year.isdigit() else None
+
+# 分面：分类、出版社、出版年份 -> 图书 id 集合，用于筛选和统计各取值的图书数（空值不计入）
+book_facets = {
+    'category': repo.create_index('books', lambda b: b.get('category'), where=lambda b: b.get('category')),
+    'publisher': repo.create_index('books', lambda b: b.get('publisher'), where=lambda b: b.get('publisher')),
+    'year': repo.create_index('books', publish_year, where=publish_year),
+}
+
+# 登录令牌（签名密钥和已注销的令牌保存在数据目录，多个 worker 进程共用）；
+# LIBRARY_AUTH_REQUIRED=1 时除登录、注册和图书目录外的接口都必须携带令牌
+token_signer = TokenSigner(load_secret(os.path.join(DATA_DIR, '.secret_key')),
+                           revoked=RevocationList(os.path.join(DATA_DIR, '.revoked_tokens')))
+AUTH_REQUIRED = os.environ.get('LIBRARY_AUTH_REQUIRED', '0') == '1'
+
+# 用户名索引（登录、注册时按用户名查找用户）
+users_by_name = repo.create_index('users', 'username')
+
+# 借阅记录二级索引：按用户、图书、状态，以及每个用户未归还（含逾期）的 (userId, bookId)
+records_by_user = repo.create_index('borrow_records', 'userId')
+records_by_book = repo.create_index('borrow_records', 'bookId')
+records_by_status = repo.create_index('borrow_records', 'status')
+open_loans = repo.create_index('borrow_records', lambda r: (r['userId'], r['bookId']),
+                               where=lambda r: r['status'] != 'returned')
+# 借阅记录按借阅时间排序（全部记录，以及按用户、图书、状态分组各一份），分页时直接定位，不再每次排序
+records_by_date = repo.create_ordered_index('borrow_records', 'borrowDate')
+records_by_user_date = repo.create_ordered_index('borrow_records', 'borrowDate', group='userId')
+records_by_book_date = repo.create_ordered_index('borrow_records', 'borrowDate', group='bookId')
+records_by_status_date = repo.create_ordered_index('borrow_records', 'borrowDate', group='status')
+
+# 到期调度：未归还的借阅按应还日期排成最小堆，到期后标记为逾期
+due_scheduler = DueDateScheduler()
+repo.subscribe('borrow_records', due_scheduler)
+
+# 借阅统计计数器（随借阅/归还事件增量更新）
+stats_engine = StatisticsEngine()
+stats_engine.attach(repo)
+# 按天的借阅次数（全部/分类/用户），供任意日期区间的趋势查询
+borrow_timeline = BorrowTimeline()
+borrow_timeline.attach(repo)
+# 趋势查询一次最多返回的时间段数
+MAX_TIMELINE_BUCKETS = 1000
+# 图书推荐：借阅历史中的共现关系，各书的相关图书计算一次后随借阅增量更新
+recommender = Recommender()
+repo.subscribe('borrow_records', recommender)
+
+# 预约队列：库存为 0 的图书按预约先后排队，还书时这一册直接分配给队首
+hold_queue = HoldQueue()
+repo.subscribe('holds', hold_queue)
+holds_by_user = repo.create_index('holds', 'userId')
+holds_by_book = repo.create_index('holds', 'bookId')
+active_holds = repo.create_index('holds', lambda h: (h['userId'], h['bookId']),
+                                 where=lambda h: h['status'] in ACTIVE_STATUSES)
+# 等待到书的长轮询最长时间（秒）；等待期间每隔 HOLD_POLL_INTERVAL 秒重新检查一次（同步其他 worker 的变更）
+# 每个等待中的请求占用一个 worker 线程，所以只等几秒，超时返回后由前端立即再次请求（线程数的配置见 serve.py）
+MAX_HOLD_WAIT = 5
+HOLD_POLL_INTERVAL = 1
+
+# 借阅记录、预约中冗余的书名和姓名按外键索引同步（见 denorm.py）
+reference_indexes = {
+    ('borrow_records', 'bookId'): records_by_book,
+    ('borrow_records', 'userId'): records_by_user,
+    ('holds', 'bookId'): holds_by_book,
+    ('holds', 'userId'): holds_by_user,
+}
+
+# 只读接口的响应缓存（集合版本变化后自动失效）
+response_cache = ResponseCache()
+
+# 响应压缩：客户端接受 gzip/deflate 且响应体不小于 COMPRESS_MIN_SIZE 字节时压缩；
+# 级别 3 压缩 100KB 的 JSON 约 1ms，体积比默认级别 6 只大约 15%，耗时不到一半
+COMPRESS_MIN_SIZE = 1024
+COMPRESS_LEVEL = 3
+COMPRESSIBLE_TYPES = ('application/json', 'text/plain', 'text/csv')
+
+# 列表接口 compact=1 时默认输出的字段（图书列表不含简介等长文本）
+LIST_FIELDS = {
+    'books': ('id', 'isbn', 'title', 'author', 'publisher', 'category', 'price', 'stock', 'total'),
+    'borrow_records': MODELS['borrow_records'].FIELDS,
+}
+
+# 运行指标：接口延迟、存储读写开销，通过 /api/metrics 输出
+# LIBRARY_SLOW_REQUEST_MS 设置慢请求日志的阈值（毫秒，0 为关闭）；
+# LIBRARY_PROFILE_SAMPLE 为用 cProfile 分析的请求比例（0~1），分析结果随慢请求日志输出
+metrics = Metrics()
+repo.storage.observer = metrics.observe_storage
+if repo.journal is not None:
+    repo.journal.observer = metrics.observe_storage
+SLOW_REQUEST_MS = float(os.environ.get('LIBRARY_SLOW_REQUEST_MS', 0))
+PROFILE_SAMPLE_RATE = float(os.environ.get('LIBRARY_PROFILE_SAMPLE', 0))
+
 # 工具函数
 def load_data(filename):
-    filepath = os.path.join(DATA_DIR, filename)
-    if os.path.exists(filepath):
-        with open(filepath, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return []
+    """读取整个集合，返回副本（修改后需调用 save_data 保存）"""
+    return [dict(item) for item in repo.collection(os.path.splitext(filename)[0]).all()]
 
 def save_data(filename, data):
-    filepath = os.path.join(DATA_DIR, filename)
-    with open(filepath, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    """用给定列表覆盖整个集合"""
+    name = os.path.splitext(filename)[0]
+    with repo.transaction(name):
+        repo.collection(name).replace(data)
 
 def hash_password(password):
-    """密码哈希"""
-    salt = 'library_system_salt_2024'
-    return hashlib.sha256((password + salt).encode()).hexdigest()
+    """旧版密码哈希（SHA-256 + 固定盐），新密码使用 auth.make_password"""
+    return legacy_hash(password)
 
 def get_next_id(data_list):
     """获取下一个ID"""
@@ -39,213 +200,659 @@ def get_next_id(data_list):
         return 1
     return max(item['id'] for item in data_list) + 1
 
+def require_auth(role=None):
+    """校验 Authorization: Bearer 令牌，通过后载荷保存在 g.user（只校验签名，不读取用户数据）
+
+    未开启 AUTH_REQUIRED 时允许不带令牌访问（兼容尚未使用令牌的客户端），但令牌无效时仍然拒绝。
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            g.user = None
+            header = request.headers.get('Authorization', '')
+            if header.startswith('Bearer '):
+                try:
+                    g.user = token_signer.verify(header[len('Bearer '):])
+                except TokenError as e:
+                    return jsonify({'code': 401, 'message': f'登录已失效：{e}'}), 401
+            elif AUTH_REQUIRED:
+                return jsonify({'code': 401, 'message': '请先登录'}), 401
+            if role and g.user and g.user['role'] != role:
+                return jsonify({'code': 403, 'message': '没有权限'}), 403
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def acts_for(actor, user_id):
+    """令牌用户能否代表 user_id 操作（本人或管理员；没有令牌时不限制）"""
+    return actor is None or actor['role'] == 'admin' or actor['uid'] == user_id
+
+def require_owner(user_id_of):
+    """只允许本人或管理员访问：user_id_of(kwargs) 返回被访问的用户 id（为 None 时不限制）
+
+    放在 require_auth 之后、cached_response 之前，缓存命中时也先检查权限。
+    参数格式错误（ValueError）时不拦截，由接口自己返回 400。
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                user_id = user_id_of(kwargs)
+            except ValueError:
+                user_id = None
+            if user_id is not None and not acts_for(g.user, user_id):
+                return jsonify({'code': 403, 'message': '没有权限'}), 403
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def user_display_name(user_id, supplied, actor=None):
+    """借阅记录、预约中保存的借阅人姓名：取用户资料中的姓名，用户不存在时才使用令牌或请求中的值"""
+    user = repo.users.get(user_id)
+    if user is not None:
+        return user['name']
+    if actor is not None and actor['uid'] == user_id:
+        return actor['name']
+    return supplied
+
+def sync_references(source, old, new):
+    """图书改名、用户改姓名后，同步引用它的借阅记录和预约（需在相关集合的事务中调用）
+
+    通过外键索引只修改引用了这条记录的借阅记录和预约，不遍历整个集合。
+    """
+    for name, field, key, source_field in references(source):
+        if new.get(source_field) != old.get(source_field):
+            ids = reference_indexes[name, key].get(new['id'])
+            propagate(repo.collection(name), ids, field, new[source_field])
+
+def mark_overdue(now):
+    """把已过应还日期的借阅记录标记为逾期并保存，返回标记的记录数
+
+    没有到期的借阅时只需查看堆顶，不需要加锁。
+    """
+    next_due = due_scheduler.next_due()
+    if next_due is None or next_due >= now:
+        return 0
+    with repo.transaction('borrow_records'):
+        records = repo.borrow_records
+        record_ids = due_scheduler.due(now)
+        for record_id in record_ids:
+            records.update(record_id, {'status': 'overdue'})
+    return len(record_ids)
+
+def cached_response(*names, state=None):
+    """缓存接口的响应，依赖的集合有变化（version 增加）时重新生成
+
+    state 返回除集合外影响结果的其他因素（例如当天日期）。响应带 ETag，
+    客户端用 If-None-Match 再次请求且内容未变时返回 304。
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            extra = state() if state is not None else None
+            version = tuple(repo.collection(name).version for name in names) + (extra,)
+            key = (request.path, tuple(sorted(request.args.items(multi=True))))
+            entry = response_cache.get(key, version)
+            if entry is None:
+                response = app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                entry = response_cache.put(key, version, response.get_data())
+            body, etag = entry
+            encoding = accepted_encoding() if len(body) >= COMPRESS_MIN_SIZE else None
+            if encoding is not None:
+                # 压缩结果随响应一起缓存；同一内容的不同编码使用不同的 ETag
+                body = response_cache.encoded(key, version, encoding, lambda data: compress(data, encoding)) \
+                    or compress(body, encoding)
+                etag = f'{etag}-{encoding}'
+            response = Response(body, mimetype='application/json')
+            if encoding is not None:
+                response.headers['Content-Encoding'] = encoding
+            response.vary.add('Accept-Encoding')
+            response.set_etag(etag)
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
+
+def accepted_encoding():
+    """客户端接受的压缩编码（gzip 优先），都不接受时返回 None"""
+    return request.accept_encodings.best_match(('gzip', 'deflate'))
+
+def compress(body, encoding):
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=COMPRESS_LEVEL, mtime=0)
+    return zlib.compress(body, COMPRESS_LEVEL)
+
+def list_fields(name):
+    """列表接口输出的字段：fields 参数（逗号分隔，总是包含 id），compact=1 且未指定时取 LIST_FIELDS，
+    否则为 None（全部字段）；有未知字段时抛出 ValueError
+    """
+    value = request.args.get('fields', '').strip()
+    if not value:
+        return LIST_FIELDS[name] if request.args.get('compact') == '1' else None
+    fields = tuple(dict.fromkeys(['id'] + [key.strip() for key in value.split(',') if key.strip()]))
+    unknown = [key for key in fields if key not in MODELS[name].FIELDS]
+    if unknown:
+        raise ValueError(f'未知字段：{", ".join(unknown)}')
+    return fields
+
+def list_response(items, fields, data):
+    """列表接口的响应：每条记录的 JSON 文本缓存在记录上，这里直接拼接（不再逐条序列化）
+
+    compact=1 时不输出 list，改为 columns（字段名）+ rows（按字段排列的值数组），字段名不再每条重复。
+    data 为响应中的其他内容（total 等）。
+    """
+    if request.args.get('compact') == '1':
+        rows = ','.join(record_json(item, fields, row=True) for item in items)
+        head = f'"columns":{json.dumps(fields)},"rows":[{rows}]'
+    else:
+        head = f'"list":[{",".join(record_json(item, fields) for item in items)}]'
+    rest = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+    body = '{"code":200,"data":{' + head + (',' + rest[1:] if data else '}') + '}'
+    return Response(body, mimetype='application/json')
+
+def encode_cursor(position):
+    """把分页位置编码成不透明的游标字符串"""
+    data = json.dumps(position, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+def decode_cursor(cursor, types):
+    """解析游标，空游标表示从第一条开始；格式与 types 不符时抛出 ValueError"""
+    if not cursor:
+        return None
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        position = json.loads(data)
+    except (ValueError, TypeError):
+        raise ValueError('invalid cursor')
+    if not isinstance(position, list) or len(position) != len(types) or \
+            not all(type(value) is t for value, t in zip(position, types)):
+        raise ValueError('invalid cursor')
+    return position
+
+def invalid_cursor():
+    return jsonify({'code': 400, 'message': '无效的分页游标'}), 400
+
+def page_args():
+    """分页参数 (page, pageSize)：page 从 1 开始，pageSize 不小于 0，否则抛出 ValueError"""
+    page = int(request.args.get('page', 1))
+    page_size = int(request.args.get('pageSize', 10))
+    if page < 1 or page_size < 0:
+        raise ValueError('invalid page')
+    return page, page_size
+
+def invalid_page():
+    return jsonify({'code': 400, 'message': '无效的分页参数'}), 400
+
+# ==================== 运行指标 ====================
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    g.profiler = None
+    if PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # 其他分析工具正在运行
+            return
+        g.profiler = profiler
+
+@app.after_request
+def record_request_metrics(response):
+    start = g.pop('request_start', None)
+    if start is None:
+        return response
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+    elapsed = time.perf_counter() - start
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.observe_request(request.method, route, response.status_code, elapsed)
+    slow = SLOW_REQUEST_MS and elapsed * 1000 >= SLOW_REQUEST_MS
+    if slow or (profiler is not None and not SLOW_REQUEST_MS):
+        message = f'慢请求 {request.method} {request.full_path} {response.status_code} 耗时 {elapsed * 1000:.1f}ms'
+        if profiler is not None:
+            out = io.StringIO()
+            pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(20)
+            message += '\n' + out.getvalue()
+        app.logger.warning(message)
+    return response
+
+@app.after_request
+def compress_response(response):
+    """客户端接受 gzip/deflate 时压缩较大的响应（cached_response 的响应已按缓存压缩，这里跳过）"""
+    if response.status_code != 200 or response.direct_passthrough or response.is_streamed \
+            or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE_TYPES:
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = accepted_encoding()
+    if encoding is None or (response.content_length or 0) < COMPRESS_MIN_SIZE:
+        return response
+    response.set_data(compress(response.get_data(), encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """运行指标（Prometheus 文本格式）"""
+    names = ('users', 'books', 'borrow_records')
+    gauges = [
+        ('library_collection_records', '集合记录数', {(('collection', name),): len(repo.collection(name)) for name in names}),
+        ('library_response_cache_entries', '响应缓存条目数', {(): len(response_cache)}),
+        ('library_response_cache_hits', '响应缓存命中次数', {(): response_cache.hits}),
+        ('library_response_cache_misses', '响应缓存未命中次数', {(): response_cache.misses}),
+    ]
+    return Response(metrics.render(gauges), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/health', methods=['GET'])
+def health():
+    """健康检查（负载均衡、容器探针使用）：各集合能正常读取即为可用，否则返回 503"""
+    try:
+        counts = {name: len(repo.collection(name)) for name in DEFAULT_COLLECTIONS}
+    except Exception as e:
+        return jsonify({'code': 503, 'message': f'存储不可用：{e}'}), 503
+    return jsonify({'code': 200, 'data': {'status': 'ok', 'pid': os.getpid(), 'storage': STORAGE_BACKEND,
+                                          'collections': counts}})
+
 # 初始化数据
 def init_data():
+    """集合为空时写入初始数据（在事务中检查，多个进程同时启动时也只写入一次）"""
     # 初始化管理员
-    users = load_data('users.json')
-    if not users:
-        users = [{
-            'id': 1,
-            'username': 'admin',
-            'password': hash_password('admin123'),
-            'role': 'admin',
-            'name': '系统管理员',
-            'email': 'admin@library.com',
-            'phone': '13800000000',
-            'createTime': datetime.now().isoformat()
-        }]
-        save_data('users.json', users)
+    with repo.transaction('users'):
+        if not len(repo.users):
+            users = [{
+                'id': 1,
+                'username': 'admin',
+                'password': make_password('admin123'),
+                'role': 'admin',
+                'name': '系统管理员',
+                'email': 'admin@library.com',
+                'phone': '13800000000',
+                'createTime': datetime.now().isoformat()
+            }]
+            repo.users.replace(users)
     
     # 初始化图书
-    books = load_data('books.json')
-    if not books:
-        books = [
-            {'id': 1, 'isbn': '978-7-111-42175-2', 'title': 'JavaScript高级程序设计', 'author': 'Nicholas C. Zakas', 'publisher': '机械工业出版社', 'category': '计算机', 'price': 99.00, 'stock': 5, 'total': 10, 'publishDate': '2020-01-01', 'description': 'JavaScript经典教程'},
-            {'id': 2, 'isbn': '978-7-111-48437-5', 'title': 'Vue.js设计与实现', 'author': '霍春阳', 'publisher': '人民邮电出版社', 'category': '计算机', 'price': 79.00, 'stock': 3, 'total': 8, 'publishDate': '2022-03-01', 'description': 'Vue.js 3源码解析'},
-            {'id': 3, 'isbn': '978-7-115-52148-6', 'title': '深入理解计算机系统', 'author': 'Randal E. Bryant', 'publisher': '机械工业出版社', 'category': '计算机', 'price': 139.00, 'stock': 2, 'total': 5, 'publishDate': '2016-07-01', 'description': '计算机系统经典教材'},
-            {'id': 4, 'isbn': '978-7-020-02308-4', 'title': '红楼梦', 'author': '曹雪芹', 'publisher': '人民文学出版社', 'category': '文学', 'price': 59.70, 'stock': 8, 'total': 15, 'publishDate': '1996-12-01', 'description': '中国古典四大名著之一'},
-            {'id': 5, 'isbn': '978-7-544-27827-2', 'title': '百年孤独', 'author': '加西亚·马尔克斯', 'publisher': '南海出版公司', 'category': '文学', 'price': 55.00, 'stock': 4, 'total': 10, 'publishDate': '2017-08-01', 'description': '魔幻现实主义文学代表作'},
-            {'id': 6, 'isbn': '978-7-108-06332-5', 'title': '人类简史', 'author': '尤瓦尔·赫拉利', 'publisher': '中信出版社', 'category': '历史', 'price': 68.00, 'stock': 6, 'total': 12, 'publishDate': '2014-11-01', 'description': '从认知革命到科学革命'},
-            {'id': 7, 'isbn': '978-7-5086-5562-7', 'title': '经济学原理', 'author': '曼昆', 'publisher': '北京大学出版社', 'category': '经济', 'price': 128.00, 'stock': 3, 'total': 8, 'publishDate': '2015-05-01', 'description': '经济学入门教材'},
-            {'id': 8, 'isbn': '978-7-5327-6548-6', 'title': '三体', 'author': '刘慈欣', 'publisher': '重庆出版社', 'category': '科幻', 'price': 95.00, 'stock': 7, 'total': 20, 'publishDate': '2008-01-01', 'description': '中国科幻里程碑之作'},
-        ]
-        save_data('books.json', books)
+    with repo.transaction('books'):
+        if not len(repo.books):
+            books = [
+                {'id': 1, 'isbn': '978-7-111-42175-2', 'title': 'JavaScript高级程序设计', 'author': 'Nicholas C. Zakas', 'publisher': '机械工业出版社', 'category': '计算机', 'price': 99.00, 'stock': 5, 'total': 10, 'publishDate': '2020-01-01', 'description': 'JavaScript经典教程'},
+                {'id': 2, 'isbn': '978-7-111-48437-5', 'title': 'Vue.js设计与实现', 'author': '霍春阳', 'publisher': '人民邮电出版社', 'category': '计算机', 'price': 79.00, 'stock': 3, 'total': 8, 'publishDate': '2022-03-01', 'description': 'Vue.js 3源码解析'},
+                {'id': 3, 'isbn': '978-7-115-52148-6', 'title': '深入理解计算机系统', 'author': 'Randal E. Bryant', 'publisher': '机械工业出版社', 'category': '计算机', 'price': 139.00, 'stock': 2, 'total': 5, 'publishDate': '2016-07-01', 'description': '计算机系统经典教材'},
+                {'id': 4, 'isbn': '978-7-020-02308-4', 'title': '红楼梦', 'author': '曹雪芹', 'publisher': '人民文学出版社', 'category': '文学', 'price': 59.70, 'stock': 8, 'total': 15, 'publishDate': '1996-12-01', 'description': '中国古典四大名著之一'},
+                {'id': 5, 'isbn': '978-7-544-27827-2', 'title': '百年孤独', 'author': '加西亚·马尔克斯', 'publisher': '南海出版公司', 'category': '文学', 'price': 55.00, 'stock': 4, 'total': 10, 'publishDate': '2017-08-01', 'description': '魔幻现实主义文学代表作'},
+                {'id': 6, 'isbn': '978-7-108-06332-5', 'title': '人类简史', 'author': '尤瓦尔·赫拉利', 'publisher': '中信出版社', 'category': '历史', 'price': 68.00, 'stock': 6, 'total': 12, 'publishDate': '2014-11-01', 'description': '从认知革命到科学革命'},
+                {'id': 7, 'isbn': '978-7-5086-5562-7', 'title': '经济学原理', 'author': '曼昆', 'publisher': '北京大学出版社', 'category': '经济', 'price': 128.00, 'stock': 3, 'total': 8, 'publishDate': '2015-05-01', 'description': '经济学入门教材'},
+                {'id': 8, 'isbn': '978-7-5327-6548-6', 'title': '三体', 'author': '刘慈欣', 'publisher': '重庆出版社', 'category': '科幻', 'price': 95.00, 'stock': 7, 'total': 20, 'publishDate': '2008-01-01', 'description': '中国科幻里程碑之作'},
+            ]
+            repo.books.replace(books)
 
 # ==================== 用户接口 ====================
 @app.route('/api/auth/login', methods=['POST'])
 def login():
     """用户登录"""
     data = request.json
-    users = load_data('users.json')
-    user = next((u for u in users if u['username'] == data['username']), None)
+    users = repo.users
+    user = users.get(users_by_name.first(data['username']))
     if not user:
         return jsonify({'code': 400, 'message': '用户不存在'}), 400
-    if user['password'] != hash_password(data['password']):
+    if not verify_password(data['password'], user['password']):
         return jsonify({'code': 400, 'message': '密码错误'}), 400
-    # 返回用户信息（不包含密码）
+    # 旧格式的哈希在登录成功后升级（期间密码被修改则不覆盖）
+    if needs_upgrade(user['password']):
+        upgraded = make_password(data['password'])
+        with repo.transaction('users'):
+            current = repo.users.get(user['id'])
+            if current and current['password'] == user['password']:
+                repo.users.update(user['id'], {'password': upgraded})
+    # 返回用户信息（不包含密码）和登录令牌，之后的请求通过 Authorization: Bearer 携带令牌
     user_info = {k: v for k, v in user.items() if k != 'password'}
-    return jsonify({'code': 200, 'data': user_info, 'message': '登录成功'})
+    token, expires_at = token_signer.issue(user)
+    return jsonify({'code': 200, 'data': user_info, 'token': token, 'expiresAt': expires_at, 'message': '登录成功'})
+
+@app.route('/api/auth/logout', methods=['POST'])
+@require_auth()
+def logout():
+    """注销当前令牌"""
+    header = request.headers.get('Authorization', '')
+    if g.user:
+        token_signer.revoke(header[len('Bearer '):])
+    return jsonify({'code': 200, 'message': '已退出登录'})
 
 @app.route('/api/auth/register', methods=['POST'])
 def register():
     """用户注册"""
     data = request.json
-    users = load_data('users.json')
-    if any(u['username'] == data['username'] for u in users):
-        return jsonify({'code': 400, 'message': '用户名已存在'}), 400
-    new_user = {
-        'id': get_next_id(users),
-        'username': data['username'],
-        'password': hash_password(data['password']),
-        'role': 'user',
-        'name': data.get('name', ''),
-        'email': data.get('email', ''),
-        'phone': data.get('phone', ''),
-        'createTime': datetime.now().isoformat()
-    }
-    users.append(new_user)
-    save_data('users.json', users)
+    # 哈希计算较慢，放在事务外进行
+    password = make_password(data['password'])
+    with repo.transaction('users'):
+        users = repo.users
+        if users_by_name.count(data['username']):
+            return jsonify({'code': 400, 'message': '用户名已存在'}), 400
+        new_user = {
+            'id': users.next_id(),
+            'username': data['username'],
+            'password': password,
+            'role': 'user',
+            'name': data.get('name', ''),
+            'email': data.get('email', ''),
+            'phone': data.get('phone', ''),
+            'createTime': datetime.now().isoformat()
+        }
+        users.insert(new_user)
     return jsonify({'code': 200, 'message': '注册成功'})
 
 @app.route('/api/users', methods=['GET'])
+@require_auth('admin')
 def get_users():
     """获取用户列表"""
-    users = load_data('users.json')
-    return jsonify({'code': 200, 'data': [{k: v for k, v in u.items() if k != 'password'} for u in users]})
+    return jsonify({'code': 200, 'data': [{k: v for k, v in u.items() if k != 'password'} for u in repo.users.all()]})
 
 @app.route('/api/users/<int:user_id>', methods=['PUT'])
+@require_auth()
 def update_user(user_id):
     """更新用户信息"""
     data = request.json
-    users = load_data('users.json')
-    user = next((u for u in users if u['id'] == user_id), None)
-    if not user:
-        return jsonify({'code': 404, 'message': '用户不存在'}), 404
-    for key in ['name', 'email', 'phone', 'role']:
-        if key in data:
-            user[key] = data[key]
+    if not acts_for(g.user, user_id) or ('role' in data and g.user and g.user['role'] != 'admin'):
+        return jsonify({'code': 403, 'message': '没有权限'}), 403
+    changes = {key: data[key] for key in ['name', 'email', 'phone', 'role'] if key in data}
     if 'password' in data and data['password']:
-        user['password'] = hash_password(data['password'])
-    save_data('users.json', users)
+        changes['password'] = make_password(data['password'])
+    with repo.transaction('users', 'borrow_records', 'holds'):
+        users = repo.users
+        if user_id not in users:
+            return jsonify({'code': 404, 'message': '用户不存在'}), 404
+        sync_references('users', users.get(user_id), users.update(user_id, changes))
     return jsonify({'code': 200, 'message': '更新成功'})
 
 @app.route('/api/users/<int:user_id>', methods=['DELETE'])
+@require_auth('admin')
 def delete_user(user_id):
     """删除用户"""
-    users = load_data('users.json')
-    user = next((u for u in users if u['id'] == user_id), None)
-    if not user:
-        return jsonify({'code': 404, 'message': '用户不存在'}), 404
-    if user['role'] == 'admin':
-        return jsonify({'code': 400, 'message': '不能删除管理员'}), 400
-    users = [u for u in users if u['id'] != user_id]
-    save_data('users.json', users)
+    with repo.transaction('users'):
+        users = repo.users
+        user = users.get(user_id)
+        if not user:
+            return jsonify({'code': 404, 'message': '用户不存在'}), 404
+        if user['role'] == 'admin':
+            return jsonify({'code': 400, 'message': '不能删除管理员'}), 400
+        users.delete(user_id)
     return jsonify({'code': 200, 'message': '删除成功'})
 
 # ==================== 图书接口 ====================
 @app.route('/api/books', methods=['GET'])
+@cached_response('books')
 def get_books():
-    """获取图书列表（支持分页和筛选）"""
-    books = load_data('books.json')
-    # 筛选
-    title = request.args.get('title', '')
-    author = request.args.get('author', '')
-    category = request.args.get('category', '')
-    if title:
-        books = [b for b in books if title in b['title']]
-    if author:
-        books = [b for b in books if author in b['author']]
-    if category:
-        books = [b for b in books if b['category'] == category]
+    """获取图书列表（支持分页和筛选，q 为书名/作者/出版社/简介综合搜索，按相关度排序）
+
+    传入 cursor 参数（首页传空值）时使用游标分页：返回 nextCursor，下一页带上它继续读取。
+    facets=1 时同时返回符合筛选条件的图书按分类、出版社、出版年份的数量。
+    fields（逗号分隔）只输出指定的字段；compact=1 时按 columns + rows 输出（见 list_response）。
+    """
+    catalog = repo.books
+    try:
+        page, page_size = page_args()
+    except ValueError:
+        return invalid_page()
+    use_cursor = 'cursor' in request.args
+    try:
+        after = decode_cursor(request.args.get('cursor'), (int,))
+    except ValueError:
+        return invalid_cursor()
+    try:
+        fields = list_fields('books')
+    except ValueError as e:
+        return jsonify({'code': 400, 'message': str(e)}), 400
+    # 筛选：书名、作者通过检索索引查找，分类、出版社、年份取分面索引中的 id 集合求交集，不再逐本扫描
+    q = request.args.get('q', '').strip()
+    ids = None
+    for field in ('title', 'author'):
+        value = request.args.get(field, '')
+        if value:
+            matched = book_index.match(field, value)
+            ids = matched if ids is None else ids & matched
+    for field, facet in book_facets.items():
+        value = request.args.get(field, '')
+        if value:
+            ids = facet.get(value) if ids is None else facet.intersect(value, ids)
+    start = 0 if use_cursor else (page - 1) * page_size
+    if q or ids is not None:
+        if q:
+            books = [catalog.get(book_id) for book_id in book_index.search(q, within=ids)]
+        else:
+            books = [catalog.get(book_id) for book_id in sorted(ids)]
+        books = [b for b in books if b is not None]
+        total = len(books)
+        if after:
+            if q:
+                # 相关度排序的结果从上一页最后一本之后继续
+                start = next((i + 1 for i, b in enumerate(books) if b['id'] == after[0]), len(books))
+            else:
+                start = bisect_right(books, after[0], key=operator.itemgetter('id'))
+        rows = iter(books[start:])
+    else:
+        # 无筛选条件时在按 id 排序的索引上直接定位，翻到后面的页也不需要遍历前面的图书
+        total = len(catalog)
+        position = (after[0], after[0]) if after else None
+        rows = (b for b in (catalog.get(book_id) for _, book_id in books_by_id.scan(after=position, offset=start))
+                if b is not None)
     # 分页
-    page = int(request.args.get('page', 1))
-    page_size = int(request.args.get('pageSize', 10))
-    total = len(books)
-    start = (page - 1) * page_size
-    books = books[start:start + page_size]
-    return jsonify({'code': 200, 'data': {'list': books, 'total': total, 'page': page, 'pageSize': page_size}})
+    page_books = list(islice(rows, page_size))
+    data = {'total': total, 'page': page, 'pageSize': page_size}
+    if use_cursor:
+        has_more = page_books and next(rows, None) is not None
+        data['nextCursor'] = encode_cursor([page_books[-1]['id']]) if has_more else None
+    if request.args.get('facets') == '1':
+        # 有筛选条件时只统计结果中的图书，否则直接取各取值的总数
+        within = {b['id'] for b in books} if q or ids is not None else None
+        data['facets'] = {field: facet.counts(within) for field, facet in book_facets.items()}
+    return list_response(page_books, fields, data)
 
 @app.route('/api/books', methods=['POST'])
+@require_auth('admin')
 def add_book():
     """添加图书"""
     data = request.json
-    books = load_data('books.json')
-    if any(b['isbn'] == data['isbn'] for b in books):
-        return jsonify({'code': 400, 'message': 'ISBN已存在'}), 400
-    new_book = {
-        'id': get_next_id(books),
+    with repo.transaction('books'):
+        books = repo.books
+        if books_by_isbn.count(data['isbn']):
+            return jsonify({'code': 400, 'message': 'ISBN已存在'}), 400
+        try:
+            new_book = make_book(books.next_id(), data)
+        except ValueError as e:
+            return jsonify({'code': 400, 'message': str(e)}), 400
+        books.insert(new_book)
+    return jsonify({'code': 200, 'data': new_book, 'message': '添加成功'})
+
+def make_book(book_id, data):
+    """由请求数据生成新的图书记录；价格、数量无效时抛出 ValueError"""
+    price, total = clean_price(data.get('price', 0)), clean_total(data.get('total', 1))
+    return {
+        'id': book_id,
         'isbn': data['isbn'],
         'title': data['title'],
         'author': data['author'],
         'publisher': data.get('publisher', ''),
         'category': data.get('category', ''),
-        'price': data.get('price', 0),
-        'stock': data.get('total', 1),
-        'total': data.get('total', 1),
+        'price': price,
+        'stock': total,
+        'total': total,
         'publishDate': data.get('publishDate', ''),
         'description': data.get('description', '')
     }
-    books.append(new_book)
-    save_data('books.json', books)
-    return jsonify({'code': 200, 'data': new_book, 'message': '添加成功'})
+
+def bulk_format():
+    """批量导入导出的格式：format 参数优先，其次看 Content-Type，默认 jsonl"""
+    fmt = request.args.get('format')
+    if not fmt:
+        fmt = 'csv' if request.mimetype == 'text/csv' else 'jsonl'
+    return fmt if fmt in FORMATS else None
+
+@app.route('/api/books/bulk', methods=['POST'])
+@require_auth('admin')
+def import_books():
+    """批量导入图书（CSV 或 JSON lines），ISBN 重复的行跳过，全部图书在一个事务中写入"""
+    fmt = bulk_format()
+    if fmt is None:
+        return jsonify({'code': 400, 'message': '不支持的格式'}), 400
+    # 先在锁外逐行解析、校验，上传较慢时也不会长时间占用写锁
+    rows, errors, seen = [], [], set()
+    duplicates = 0
+    try:
+        for line_no, row in read_rows(request.stream, fmt):
+            try:
+                if isinstance(row, str):
+                    raise ValueError(row)
+                data = clean_book(row)
+            except ValueError as e:
+                errors.append({'line': line_no, 'message': str(e)})
+                continue
+            if data['isbn'] in seen:
+                duplicates += 1
+                continue
+            seen.add(data['isbn'])
+            rows.append(data)
+    except ValueError as e:
+        # 编码错误或 CSV 格式错误时整个文件都不导入
+        return jsonify({'code': 400, 'message': str(e)}), 400
+
+    imported = 0
+    with repo.transaction('books'):
+        books = repo.books
+        next_id = books.next_id()
+        for data in rows:
+            if books_by_isbn.count(data['isbn']):
+                duplicates += 1
+                continue
+            books.insert(make_book(next_id, data))
+            next_id += 1
+            imported += 1
+    return jsonify({'code': 200, 'data': {'imported': imported, 'duplicates': duplicates, 'errors': errors[:100],
+                                          'errorCount': len(errors)}, 'message': '导入完成'})
+
+@app.route('/api/books/export', methods=['GET'])
+def export_books():
+    """导出全部图书（CSV 或 JSON lines），边生成边发送"""
+    fmt = bulk_format()
+    if fmt is None:
+        return jsonify({'code': 400, 'message': '不支持的格式'}), 400
+    catalog = repo.books
+    books = (b for b in (catalog.get(book_id) for _, book_id in books_by_id.scan()) if b is not None)
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return Response(export_rows(books, fmt), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename=books.{fmt}'})
 
 @app.route('/api/books/<int:book_id>', methods=['PUT'])
+@require_auth('admin')
 def update_book(book_id):
     """更新图书"""
     data = request.json
-    books = load_data('books.json')
-    book = next((b for b in books if b['id'] == book_id), None)
-    if not book:
-        return jsonify({'code': 404, 'message': '图书不存在'}), 404
-    for key in ['title', 'author', 'publisher', 'category', 'price', 'total', 'publishDate', 'description']:
-        if key in data:
-            book[key] = data[key]
-    save_data('books.json', books)
+    with repo.transaction('books', 'borrow_records', 'holds'):
+        books = repo.books
+        if book_id not in books:
+            return jsonify({'code': 404, 'message': '图书不存在'}), 404
+        changes = {key: data[key] for key in ['title', 'author', 'publisher', 'category', 'price', 'total', 'publishDate', 'description'] if key in data}
+        try:
+            if 'price' in changes:
+                changes['price'] = clean_price(changes['price'])
+            if 'total' in changes:
+                changes['total'] = clean_total(changes['total'])
+        except ValueError as e:
+            return jsonify({'code': 400, 'message': str(e)}), 400
+        sync_references('books', books.get(book_id), books.update(book_id, changes))
     return jsonify({'code': 200, 'message': '更新成功'})
 
 @app.route('/api/books/<int:book_id>', methods=['DELETE'])
+@require_auth('admin')
 def delete_book(book_id):
     """删除图书"""
-    books = load_data('books.json')
-    books = [b for b in books if b['id'] != book_id]
-    save_data('books.json', books)
+    with repo.transaction('books'):
+        repo.books.delete(book_id)
     return jsonify({'code': 200, 'message': '删除成功'})
 
 @app.route('/api/books/categories', methods=['GET'])
+@cached_response('books')
 def get_categories():
     """获取图书分类"""
-    books = load_data('books.json')
-    categories = list(set(b['category'] for b in books if b['category']))
+    categories = sorted(book_facets['category'].counts())
     return jsonify({'code': 200, 'data': categories})
 
+# ==================== 推荐接口 ====================
+def recommended_books(entries, limit):
+    """[(得分, bookId)] 转为图书列表（附 score），跳过已删除的图书"""
+    books = []
+    for score, book_id in entries:
+        book = repo.books.get(book_id)
+        if book is not None:
+            books.append(dict(book, score=score))
+            if len(books) == limit:
+                break
+    return books
+
+def recommend_limit():
+    return max(1, min(int(request.args.get('limit', recommender.top_k)), recommender.top_k))
+
+@app.route('/api/books/<int:book_id>/related', methods=['GET'])
+@cached_response('books', 'borrow_records')
+def get_related_books(book_id):
+    """借过这本书的读者还借过：按共同读者数排序，score 为共同读者数，limit 最多 10"""
+    if repo.books.get(book_id) is None:
+        return jsonify({'code': 404, 'message': '图书不存在'}), 404
+    try:
+        limit = recommend_limit()
+    except ValueError:
+        return jsonify({'code': 400, 'message': 'limit 必须是整数'}), 400
+    return jsonify({'code': 200, 'data': recommended_books(recommender.related(book_id), limit)})
+
+@app.route('/api/users/<int:user_id>/recommendations', methods=['GET'])
+@require_auth()
+@require_owner(lambda kwargs: kwargs['user_id'])
+@cached_response('books', 'borrow_records')
+def get_recommendations(user_id):
+    """为读者推荐：汇总最近借过的图书的相关图书，不含已借过的；本人或管理员可查看"""
+    try:
+        limit = recommend_limit()
+    except ValueError:
+        return jsonify({'code': 400, 'message': 'limit 必须是整数'}), 400
+    return jsonify({'code': 200, 'data': recommended_books(recommender.recommend(user_id), limit)})
+
 # ==================== 借阅接口 ====================
-@app.route('/api/borrow', methods=['POST'])
-def borrow_book():
-    """借书"""
-    data = request.json
-    user_id = data['userId']
-    book_id = data['bookId']
-    
-    books = load_data('books.json')
-    book = next((b for b in books if b['id'] == book_id), None)
+class BorrowError(Exception):
+    """借书/还书校验失败"""
+
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+def borrow_one(books, records, user_id, book_id, user_name, now, actor=None):
+    """借一本书：检查库存、写借阅记录、扣减库存（需在 books、borrow_records 事务中调用）
+
+    actor 为令牌载荷：普通用户只能为自己借书，借阅人姓名取自令牌而不是请求内容。
+    """
+    if not acts_for(actor, user_id):
+        raise BorrowError(403, '没有权限')
+    user_name = user_display_name(user_id, user_name, actor)
+    book = books.get(book_id)
     if not book:
-        return jsonify({'code': 404, 'message': '图书不存在'}), 404
-    if book['stock'] <= 0:
-        return jsonify({'code': 400, 'message': '库存不足'}), 400
-    
-    records = load_data('borrow_records.json')
+        raise BorrowError(404, '图书不存在')
+    # 预约到书的读者借走为其保留的那一册，不占用库存
+    holds = repo.holds
+    hold = find_hold(holds, user_id, book_id)
+    reserved = hold is not None and hold['status'] == 'ready'
+    if book['stock'] <= 0 and not reserved:
+        raise BorrowError(400, '库存不足')
     # 检查是否已借阅
-    existing = next((r for r in records if r['userId'] == user_id and r['bookId'] == book_id and r['status'] == 'borrowed'), None)
-    if existing:
-        return jsonify({'code': 400, 'message': '您已借阅此书，请先归还'}), 400
-    
-    now = datetime.now()
+    if open_loans.count((user_id, book_id)):
+        raise BorrowError(400, '您已借阅此书，请先归还')
+
     due_date = now + timedelta(days=30)
     record = {
-        'id': get_next_id(records) if records else 1,
+        'id': records.next_id(),
         'userId': user_id,
         'bookId': book_id,
-        'userName': data.get('userName', ''),
+        'userName': user_name,
         'bookTitle': book['title'],
         'borrowDate': now.isoformat(),
         'dueDate': due_date.isoformat(),
@@ -253,119 +860,432 @@ def borrow_book():
         'status': 'borrowed',
         'fine': 0
     }
-    records.append(record)
-    book['stock'] -= 1
-    save_data('borrow_records.json', records)
-    save_data('books.json', books)
-    return jsonify({'code': 200, 'data': record, 'message': '借阅成功'})
+    records.insert(record)
+    if not reserved:
+        books.update(book_id, {'stock': book['stock'] - 1})
+    if hold is not None:
+        holds.update(hold['id'], {'status': 'fulfilled'})
+    return record
 
-@app.route('/api/borrow/<int:record_id>/return', methods=['POST'])
-def return_book(record_id):
-    """还书"""
-    records = load_data('borrow_records.json')
-    record = next((r for r in records if r['id'] == record_id), None)
+def return_one(books, records, record_id, now, actor=None):
+    """还一本书：更新借阅记录、计算罚款、恢复库存（需在 books、borrow_records 事务中调用）"""
+    record = records.get(record_id)
     if not record:
-        return jsonify({'code': 404, 'message': '借阅记录不存在'}), 404
+        raise BorrowError(404, '借阅记录不存在')
+    if not acts_for(actor, record['userId']):
+        raise BorrowError(403, '没有权限')
     if record['status'] == 'returned':
-        return jsonify({'code': 400, 'message': '已归还'}), 400
-    
-    now = datetime.now()
-    due_date = datetime.fromisoformat(record['dueDate'])
-    record['returnDate'] = now.isoformat()
-    record['status'] = 'returned'
-    
+        raise BorrowError(400, '已归还')
+
+    due_date = due_at(record)
+    changes = {'returnDate': now.isoformat(), 'status': 'returned'}
     # 计算逾期罚款
     if now > due_date:
-        overdue_days = (now - due_date).days
-        record['fine'] = overdue_days * 0.5
-    
-    # 更新库存
-    books = load_data('books.json')
-    book = next((b for b in books if b['id'] == record['bookId']), None)
+        changes['fine'] = compute_fine(due_date, now)
+    record = records.update(record_id, changes)
+
+    # 有人预约时这一册留给队首的读者，否则放回库存
+    if books.get(record['bookId']):
+        allocate_copy(books, repo.holds, record['bookId'], now)
+    return record
+
+def find_hold(holds, user_id, book_id):
+    """用户对该书进行中（排队或已到书）的预约，没有时返回 None"""
+    hold_id = active_holds.first((user_id, book_id))
+    return holds.get(hold_id) if hold_id is not None else None
+
+def allocate_copy(books, holds, book_id, now):
+    """把一册可借的书交给队首的预约（保留 HOLD_PICKUP_DAYS 天），没有人排队时放回库存"""
+    hold_id = hold_queue.next_waiting(book_id)
+    if hold_id is not None:
+        holds.update(hold_id, {'status': 'ready', 'readyAt': now.isoformat(),
+                               'expiresAt': (now + timedelta(days=HOLD_PICKUP_DAYS)).isoformat()})
+        return
+    book = books.get(book_id)
     if book:
-        book['stock'] += 1
-        save_data('books.json', books)
-    
-    save_data('borrow_records.json', records)
+        books.update(book_id, {'stock': book['stock'] + 1})
+
+def expire_holds(now):
+    """把超过保留期未借走的预约标记为过期，这一册交给下一位或放回库存，返回过期的预约数
+
+    没有保留中的预约时只需查看堆顶，不需要加锁。
+    """
+    next_expiry = hold_queue.next_expiry()
+    if next_expiry is None or next_expiry >= now:
+        return 0
+    with repo.transaction('books', 'holds'):
+        books, holds = repo.books, repo.holds
+        hold_ids = hold_queue.expired(now)
+        for hold_id in hold_ids:
+            hold = holds.update(hold_id, {'status': 'expired'})
+            allocate_copy(books, holds, hold['bookId'], now)
+    return len(hold_ids)
+
+class BatchAborted(Exception):
+    """批量操作中有失败项且要求全部成功，用于回滚整个事务"""
+
+def batch_id(value, name):
+    """借还书请求中的 id（单本和批量）：整数或整数字符串，缺少或格式错误时抛出 BorrowError(400)"""
+    if value is None:
+        raise BorrowError(400, f'缺少{name}')
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise BorrowError(400, f'{name}格式错误')
+    try:
+        return int(value)
+    except ValueError:
+        raise BorrowError(400, f'{name}格式错误')
+
+def run_batch(items, handle, atomic):
+    """在一个事务中依次处理 items，每项结果单独返回；atomic 时任一项失败则全部撤销"""
+    now = datetime.now()
+    results = []
+    try:
+        with repo.transaction('books', 'borrow_records', 'holds'):
+            books, records = repo.books, repo.borrow_records
+            for item in items:
+                try:
+                    results.append({'code': 200, 'data': handle(books, records, item, now)})
+                except BorrowError as e:
+                    results.append({'code': e.code, 'message': e.message})
+            if atomic and any(r['code'] != 200 for r in results):
+                raise BatchAborted()
+    except BatchAborted:
+        return jsonify({'code': 400, 'data': results, 'message': '部分操作失败，已全部撤销'}), 400
+    succeeded = sum(r['code'] == 200 for r in results)
+    return jsonify({'code': 200, 'data': results, 'message': f'成功 {succeeded} 项，失败 {len(results) - succeeded} 项'})
+
+@app.route('/api/borrow', methods=['POST'])
+@require_auth()
+def borrow_book():
+    """借书"""
+    data = request.json
+    try:
+        if not isinstance(data, dict):
+            raise BorrowError(400, '请求体应为包含 userId、bookId 的对象')
+        user_id, book_id = batch_id(data.get('userId'), 'userId'), batch_id(data.get('bookId'), 'bookId')
+    except BorrowError as e:
+        return jsonify({'code': e.code, 'message': e.message}), e.code
+    expire_holds(datetime.now())
+    # 在同一个事务中检查库存、写借阅记录、扣减库存
+    with repo.transaction('books', 'borrow_records', 'holds'):
+        try:
+            record = borrow_one(repo.books, repo.borrow_records, user_id, book_id,
+                                data.get('userName', ''), datetime.now(), g.user)
+        except BorrowError as e:
+            return jsonify({'code': e.code, 'message': e.message}), e.code
+    return jsonify({'code': 200, 'data': record, 'message': '借阅成功'})
+
+@app.route('/api/borrow/<int:record_id>/return', methods=['POST'])
+@require_auth()
+def return_book(record_id):
+    """还书"""
+    with repo.transaction('books', 'borrow_records', 'holds'):
+        try:
+            record = return_one(repo.books, repo.borrow_records, record_id, datetime.now(), g.user)
+        except BorrowError as e:
+            return jsonify({'code': e.code, 'message': e.message}), e.code
     return jsonify({'code': 200, 'data': record, 'message': '归还成功'})
 
+@app.route('/api/borrow/batch', methods=['POST'])
+@require_auth()
+def borrow_batch():
+    """批量借书：items 为 [{userId, bookId, userName}]，一次事务、一次写入；atomic 为真时任一本失败则全部不借"""
+    data = request.json
+    items = data.get('items') if isinstance(data, dict) else None
+    if not isinstance(items, list):
+        return jsonify({'code': 400, 'message': 'items 应为列表'}), 400
+    expire_holds(datetime.now())
+    def handle(books, records, item, now):
+        if not isinstance(item, dict):
+            raise BorrowError(400, '每项应为包含 userId、bookId 的对象')
+        user_id, book_id = batch_id(item.get('userId'), 'userId'), batch_id(item.get('bookId'), 'bookId')
+        return borrow_one(books, records, user_id, book_id, item.get('userName', ''), now, g.user)
+    return run_batch(items, handle, data.get('atomic', False))
+
+@app.route('/api/borrow/batch/return', methods=['POST'])
+@require_auth()
+def return_batch():
+    """批量还书：recordIds 为借阅记录 id 列表；atomic 为真时任一本失败则全部不还"""
+    data = request.json
+    record_ids = data.get('recordIds') if isinstance(data, dict) else None
+    if not isinstance(record_ids, list):
+        return jsonify({'code': 400, 'message': 'recordIds 应为列表'}), 400
+    def handle(books, records, record_id, now):
+        return return_one(books, records, batch_id(record_id, 'recordId'), now, g.user)
+    return run_batch(record_ids, handle, data.get('atomic', False))
+
 @app.route('/api/borrow', methods=['GET'])
+@require_auth()
 def get_borrow_records():
-    """获取借阅记录"""
-    records = load_data('borrow_records.json')
+    """获取借阅记录（可按 userId、bookId、status 筛选，按借阅时间倒序）
+
+    传入 cursor 参数（首页传空值）时使用游标分页：返回 nextCursor，下一页带上它继续读取。
+    fields（逗号分隔）只输出指定的字段；compact=1 时按 columns + rows 输出（见 list_response）。
+    """
+    mark_overdue(datetime.now())
+    records = repo.borrow_records
     user_id = request.args.get('userId')
+    if g.user and g.user['role'] != 'admin':
+        # 普通用户只能查看自己的借阅记录
+        user_id = str(g.user['uid'])
+    book_id = request.args.get('bookId')
     status = request.args.get('status')
+    try:
+        page, page_size = page_args()
+    except ValueError:
+        return invalid_page()
+    use_cursor = 'cursor' in request.args
+    try:
+        after = decode_cursor(request.args.get('cursor'), (str, int))
+    except ValueError:
+        return invalid_cursor()
+    try:
+        fields = list_fields('borrow_records')
+    except ValueError as e:
+        return jsonify({'code': 400, 'message': str(e)}), 400
+    start = 0 if use_cursor else (page - 1) * page_size
     
+    # 每个条件对应 (等值索引, 按借阅时间排序的分组索引, 值)
+    filters = []
     if user_id:
-        records = [r for r in records if r['userId'] == int(user_id)]
+        filters.append((records_by_user, records_by_user_date, int(user_id)))
+    if book_id:
+        filters.append((records_by_book, records_by_book_date, int(book_id)))
     if status:
-        records = [r for r in records if r['status'] == status]
+        filters.append((records_by_status, records_by_status_date, status))
+
+    # 按 (借阅时间, id) 倒序取出一页：在记录最少的条件的有序索引上直接定位（不筛选时用全部记录的有序索引），
+    # 其余条件用索引交集逐条判断，翻页和游标续读都不需要对命中的记录排序
+    position = tuple(after) if after else None
+    filters.sort(key=lambda f: f[0].count(f[2]))
+    ids = None
+    if not filters:
+        total = len(records)
+        entries = records_by_date.scan(after=position, offset=start, reverse=True)
+    elif len(filters) == 1:
+        index, ordered, value = filters[0]
+        total = index.count(value)
+        entries = ordered.scan(value, after=position, offset=start, reverse=True)
+    else:
+        index, ordered, value = filters[0]
+        ids = index.lookup(value)
+        for other, _, other_value in filters[1:]:
+            ids = other.intersect(other_value, ids)
+        total = len(ids)
+        entries = ordered.scan(value, after=position, reverse=True)
+    rows = (r for r in map(records.get, (record_id for _, record_id in entries)) if r is not None)
+    if ids is None:
+        start = 0
+    else:
+        rows = (r for r in rows if r['id'] in ids)
+    page_records = list(islice(rows, start, start + page_size))
     
-    # 更新逾期状态
+    data = {'total': total}
+    if use_cursor:
+        has_more = page_records and next(rows, None) is not None
+        last = page_records[-1] if has_more else None
+        data['nextCursor'] = encode_cursor([last['borrowDate'], last['id']]) if last else None
+    return list_response(page_records, fields, data)
+
+@app.route('/api/borrow/fines', methods=['GET'])
+@require_auth()
+def get_fines():
+    """罚款汇总（可按 userId 筛选）：accrued 为逾期未还的借阅截至当前的罚款，settled 为已归还记录上的罚款"""
     now = datetime.now()
-    for r in records:
-        if r['status'] == 'borrowed' and datetime.fromisoformat(r['dueDate']) < now:
-            r['status'] = 'overdue'
-    
-    records.sort(key=lambda x: x['borrowDate'], reverse=True)
-    
-    page = int(request.args.get('page', 1))
-    page_size = int(request.args.get('pageSize', 10))
-    total = len(records)
-    start = (page - 1) * page_size
-    records = records[start:start + page_size]
-    
-    return jsonify({'code': 200, 'data': {'list': records, 'total': total}})
+    mark_overdue(now)
+    user_id = request.args.get('userId')
+    if g.user and g.user['role'] != 'admin':
+        user_id = str(g.user['uid'])
+    if user_id:
+        try:
+            user_id = int(user_id)
+        except ValueError:
+            return jsonify({'code': 400, 'message': 'userId 必须是整数'}), 400
+        data = [due_scheduler.user_fines(user_id, now)]
+    else:
+        data = due_scheduler.fines(now)
+    return jsonify({'code': 200, 'data': data})
+
+# ==================== 预约接口 ====================
+def hold_view(hold):
+    """预约信息，排队中的预约附带 position（排在第几位）"""
+    data = hold.to_dict()
+    data['position'] = hold_queue.position(hold['id']) if hold['status'] == 'waiting' else None
+    return data
+
+def hold_user_id(value):
+    """请求中的用户 id：普通用户只能是自己，管理员或未启用令牌时取参数"""
+    if g.user and g.user['role'] != 'admin':
+        return g.user['uid']
+    if value in (None, ''):
+        return g.user['uid'] if g.user else None
+    return int(value)
+
+@app.route('/api/books/<int:book_id>/hold', methods=['POST'])
+@require_auth()
+def place_hold(book_id):
+    """预约图书：库存为 0 时排队，有书归还时按预约先后分配，到书后保留 HOLD_PICKUP_DAYS 天"""
+    data = request.json or {}
+    user_id = data.get('userId', g.user['uid'] if g.user else None)
+    if user_id is None:
+        return jsonify({'code': 400, 'message': '缺少 userId'}), 400
+    if not acts_for(g.user, user_id):
+        return jsonify({'code': 403, 'message': '没有权限'}), 403
+    user_name = user_display_name(user_id, data.get('userName', ''), g.user)
+    now = datetime.now()
+    expire_holds(now)
+    with repo.transaction('books', 'borrow_records', 'holds'):
+        book = repo.books.get(book_id)
+        if not book:
+            return jsonify({'code': 404, 'message': '图书不存在'}), 404
+        if book['stock'] > 0:
+            return jsonify({'code': 400, 'message': '库存充足，请直接借阅'}), 400
+        if open_loans.count((user_id, book_id)):
+            return jsonify({'code': 400, 'message': '您已借阅此书'}), 400
+        if active_holds.count((user_id, book_id)):
+            return jsonify({'code': 400, 'message': '您已预约此书'}), 400
+        holds = repo.holds
+        hold = holds.insert({
+            'id': holds.next_id(),
+            'userId': user_id,
+            'bookId': book_id,
+            'userName': user_name,
+            'bookTitle': book['title'],
+            'createTime': now.isoformat(),
+            'status': 'waiting',
+            'readyAt': None,
+            'expiresAt': None
+        })
+    return jsonify({'code': 200, 'data': hold_view(hold), 'message': '预约成功'})
+
+@app.route('/api/holds', methods=['GET'])
+@require_auth()
+def get_holds():
+    """预约列表（可按 userId、status 筛选，按预约时间倒序；普通用户只能查看自己的预约）"""
+    expire_holds(datetime.now())
+    holds = repo.holds
+    try:
+        user_id = hold_user_id(request.args.get('userId'))
+    except ValueError:
+        return jsonify({'code': 400, 'message': 'userId 必须是整数'}), 400
+    ids = holds_by_user.get(user_id) if user_id is not None else [h['id'] for h in holds.all()]
+    items = [holds.get(hold_id) for hold_id in sorted(ids, reverse=True)]
+    status = request.args.get('status')
+    items = [h for h in items if h is not None and (not status or h['status'] == status)]
+    return jsonify({'code': 200, 'data': [hold_view(h) for h in items]})
+
+@app.route('/api/holds/<int:hold_id>', methods=['DELETE'])
+@require_auth()
+def cancel_hold(hold_id):
+    """取消预约；已到书的预约取消后这一册交给下一位或放回库存"""
+    with repo.transaction('books', 'holds'):
+        holds = repo.holds
+        hold = holds.get(hold_id)
+        if not hold:
+            return jsonify({'code': 404, 'message': '预约不存在'}), 404
+        if not acts_for(g.user, hold['userId']):
+            return jsonify({'code': 403, 'message': '没有权限'}), 403
+        if hold['status'] not in ACTIVE_STATUSES:
+            return jsonify({'code': 400, 'message': '预约已结束'}), 400
+        was_ready = hold['status'] == 'ready'
+        hold = holds.update(hold_id, {'status': 'cancelled'})
+        if was_ready and repo.books.get(hold['bookId']):
+            allocate_copy(repo.books, holds, hold['bookId'], datetime.now())
+    return jsonify({'code': 200, 'data': hold_view(hold), 'message': '已取消预约'})
+
+@app.route('/api/holds/wait', methods=['GET'])
+@require_auth()
+def wait_for_holds():
+    """长轮询：等待预约到书，代替前端反复查询库存
+
+    返回 readyAt 晚于 since 的已到书预约（已有时立即返回），否则最多等待 timeout 秒
+    （默认和最多都是 MAX_HOLD_WAIT）后返回空列表。下次请求带上返回的 since。
+    """
+    try:
+        user_id = hold_user_id(request.args.get('userId'))
+        timeout = float(request.args.get('timeout', MAX_HOLD_WAIT))
+        # nan 会让截止时间也变成 nan，循环永远不会结束
+        if not math.isfinite(timeout):
+            raise ValueError(timeout)
+    except ValueError:
+        return jsonify({'code': 400, 'message': '参数格式错误'}), 400
+    if user_id is None:
+        return jsonify({'code': 400, 'message': '缺少 userId'}), 400
+    since = request.args.get('since', '')
+    deadline = time.monotonic() + min(max(timeout, 0), MAX_HOLD_WAIT)
+    while True:
+        expire_holds(datetime.now())
+        holds = repo.holds      # 同时同步其他 worker 写入的变更
+        ready = [holds.get(hold_id) for hold_id in sorted(holds_by_user.get(user_id))]
+        ready = [h for h in ready if h is not None and h['status'] == 'ready' and h['readyAt'] > since]
+        remaining = deadline - time.monotonic()
+        if ready or remaining <= 0:
+            break
+        hold_queue.wait(min(remaining, HOLD_POLL_INTERVAL))
+    since = max([since] + [h['readyAt'] for h in ready])
+    return jsonify({'code': 200, 'data': {'holds': [hold_view(h) for h in ready], 'since': since}})
 
 # ==================== 统计接口 ====================
+def statistics_state():
+    """统计结果还与日期有关；读取前先把到期的借阅标记为逾期"""
+    now = datetime.now()
+    mark_overdue(now)
+    return now.date().isoformat()
+
 @app.route('/api/statistics', methods=['GET'])
+@require_auth()
+@cached_response('users', 'books', 'borrow_records', state=statistics_state)
 def get_statistics():
     """获取统计数据"""
-    records = load_data('borrow_records.json')
-    books = load_data('books.json')
-    users = load_data('users.json')
     now = datetime.now()
-    
-    # 基础统计
-    total_borrows = len(records)
-    current_borrowed = len([r for r in records if r['status'] != 'returned'])
-    overdue_count = len([r for r in records if r['status'] == 'borrowed' and datetime.fromisoformat(r['dueDate']) < now])
-    
-    # 借阅排行
-    book_count = {}
-    for r in records:
-        book_count[r['bookTitle']] = book_count.get(r['bookTitle'], 0) + 1
-    book_ranking = sorted([{'title': k, 'count': v} for k, v in book_count.items()], key=lambda x: x['count'], reverse=True)[:10]
-    
-    # 月度统计
-    monthly_stats = []
-    for i in range(5, -1, -1):
-        month_date = now - timedelta(days=30 * i)
-        year = month_date.year
-        month = month_date.month
-        count = len([r for r in records if datetime.fromisoformat(r['borrowDate']).year == year and datetime.fromisoformat(r['borrowDate']).month == month])
-        monthly_stats.append({'month': f'{year}-{month:02d}', 'count': count})
-    
-    # 分类统计
-    category_stats = {}
-    for r in records:
-        book = next((b for b in books if b['id'] == r['bookId']), None)
-        if book:
-            category_stats[book['category']] = category_stats.get(book['category'], 0) + 1
-    
-    return jsonify({
-        'code': 200,
-        'data': {
-            'totalBorrows': total_borrows,
-            'currentBorrowed': current_borrowed,
-            'overdueCount': overdue_count,
-            'totalBooks': len(books),
-            'totalUsers': len(users),
-            'bookRanking': book_ranking,
-            'monthlyStats': monthly_stats,
-            'categoryStats': category_stats
-        }
-    })
+    records = repo.borrow_records
+    books = repo.books
+    users = repo.users
+    data = stats_engine.summary(now, len(records))
+    data['totalBooks'] = len(books)
+    data['totalUsers'] = len(users)
+    return jsonify({'code': 200, 'data': data})
+
+def today_state():
+    """未指定日期区间时默认截止到今天，缓存键需要包含日期"""
+    return datetime.now().date().isoformat()
+
+def timeline_user_id(kwargs):
+    value = request.args.get('userId')
+    return int(value) if value else None
+
+@app.route('/api/statistics/timeline', methods=['GET'])
+@require_auth()
+@require_owner(timeline_user_id)
+@cached_response('books', 'borrow_records', state=today_state)
+def get_borrow_timeline():
+    """借阅趋势：from、to（YYYY-MM-DD，含当天）区间内按 granularity（day/week/month）汇总的借阅次数，
+    可按 category、userId 筛选。默认截止到今天，按天取 30 天、按周取 12 周、按月取 12 个月
+    """
+    granularity = request.args.get('granularity', 'day')
+    if granularity not in GRANULARITIES:
+        return jsonify({'code': 400, 'message': 'granularity 只能是 day、week 或 month'}), 400
+    try:
+        last = datetime.strptime(request.args['to'], '%Y-%m-%d').date() if request.args.get('to') else datetime.now().date()
+        if request.args.get('from'):
+            first = datetime.strptime(request.args['from'], '%Y-%m-%d').date()
+        elif granularity == 'month':
+            months = last.year * 12 + last.month - 1 - 11
+            first = last.replace(year=months // 12, month=months % 12 + 1, day=1)
+        else:
+            first = last - timedelta(days=29 if granularity == 'day' else 7 * 12 - 1)
+        user_id = int(request.args['userId']) if request.args.get('userId') else None
+    except ValueError:
+        return jsonify({'code': 400, 'message': '参数格式错误（日期应为 YYYY-MM-DD）'}), 400
+    if first > last:
+        return jsonify({'code': 400, 'message': '开始日期不能晚于结束日期'}), 400
+    if (last - first).days + 1 > MAX_TIMELINE_BUCKETS * (1 if granularity == 'day' else 7 if granularity == 'week' else 28):
+        return jsonify({'code': 400, 'message': '时间段过多，请缩小日期范围或使用更大的粒度'}), 400
+    series = borrow_timeline.series(first, last, granularity, request.args.get('category') or None, user_id)
+    return jsonify({'code': 200, 'data': {
+        'from': first.isoformat(), 'to': last.isoformat(), 'granularity': granularity,
+        'series': series, 'total': sum(item['count'] for item in series),
+    }})
 
 if __name__ == '__main__':
     init_data()
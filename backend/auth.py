@@ -0,0 +1,245 @@
+"""
+图书馆管理系统 - 认证（密码哈希、登录令牌）
+
+新密码使用 PBKDF2-HMAC-SHA256，每个用户随机盐，存储格式为
+pbkdf2_sha256$迭代次数$盐$哈希（盐和哈希为十六进制）。
+旧版本的 SHA-256 + 固定盐哈希仍可校验，登录成功后由调用方升级为新格式。
+
+哈希计算放在固定大小的线程池中执行：同时登录的请求再多，
+占用的 CPU 也不超过线程池大小，其他接口不受影响。
+
+登录成功后签发令牌：载荷（用户 id、角色、姓名、过期时间）加 HMAC-SHA256 签名，
+之后的请求只需校验签名，不需要读取用户数据。注销的令牌记录在数据目录下的文件中（见 RevocationList），
+各 worker 进程校验令牌时都会检查，在任一进程注销后其他进程也立即拒绝该令牌。
+"""
+from concurrent.futures import ThreadPoolExecutor
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+
+from storage import FileLock
+
+ALGORITHM = 'pbkdf2_sha256'
+
+# 迭代次数（工作量），可通过环境变量调整；已有哈希低于该值时登录后自动升级
+PASSWORD_ITERATIONS = int(os.environ.get('LIBRARY_PASSWORD_ITERATIONS', 100000))
+
+LEGACY_SALT = 'library_system_salt_2024'
+
+# 令牌有效期（秒）
+TOKEN_TTL = int(os.environ.get('LIBRARY_TOKEN_TTL', 7 * 24 * 3600))
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def _run(fn, *args):
+    """在线程池中执行并等待结果。线程不会随 fork 复制到子进程，
+    因此每个进程（包括 gunicorn 预加载后 fork 出的 worker）各自创建线程池"""
+    global _executor, _executor_pid
+    if _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor_pid != os.getpid():
+                _executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 2, thread_name_prefix='password')
+                _executor_pid = os.getpid()
+    return _executor.submit(fn, *args).result()
+
+
+# ==================== 密码 ====================
+def legacy_hash(password):
+    """旧版密码哈希（SHA-256 + 固定盐）"""
+    return hashlib.sha256((password + LEGACY_SALT).encode()).hexdigest()
+
+
+def _pbkdf2(password, salt, iterations):
+    return hashlib.pbkdf2_hmac('sha256', password.encode(), salt, iterations)
+
+
+def make_password(password, iterations=None):
+    """生成带随机盐的密码哈希"""
+    iterations = iterations or PASSWORD_ITERATIONS
+    salt = os.urandom(16)
+    digest = _run(_pbkdf2, password, salt, iterations)
+    return f'{ALGORITHM}${iterations}${salt.hex()}${digest.hex()}'
+
+
+def needs_upgrade(stored):
+    """是否为旧格式或迭代次数低于当前配置"""
+    parts = stored.split('$')
+    return len(parts) != 4 or parts[0] != ALGORITHM or int(parts[1]) < PASSWORD_ITERATIONS
+
+
+def verify_password(password, stored):
+    """校验密码（旧版哈希与新格式均可）"""
+    if not stored:
+        return False
+    parts = stored.split('$')
+    if len(parts) != 4:
+        return hmac.compare_digest(stored, legacy_hash(password))
+    algorithm, iterations, salt, digest = parts
+    if algorithm != ALGORITHM:
+        return False
+    actual = _run(_pbkdf2, password, bytes.fromhex(salt), int(iterations))
+    return hmac.compare_digest(actual.hex(), digest)
+
+
+# ==================== 登录令牌 ====================
+class TokenError(Exception):
+    """令牌无效、过期或已注销"""
+
+
+def load_secret(path):
+    """签名密钥：优先使用环境变量 LIBRARY_SECRET_KEY，否则读取（首次生成）path 文件，多个进程共用"""
+    secret = os.environ.get('LIBRARY_SECRET_KEY')
+    if secret:
+        return secret.encode()
+    if not os.path.exists(path):
+        # 先写临时文件再链接到目标路径，多个进程同时启动时只有一个能成功，其余读取它写入的密钥
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            f.write(secrets.token_hex(32))
+        try:
+            os.link(tmp_path, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(tmp_path)
+    with open(path, 'r') as f:
+        return f.read().strip().encode()
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+class RevocationList:
+    """已注销令牌（jti -> 过期时间）
+
+    指定 path 时保存在数据目录下的文件中（每行“jti 过期时间”，只追加），多个 worker 进程共用：
+    注销时在文件锁内追加一行；查询时先检查文件是否变长或被替换，读入其他进程追加的条目。
+    已过期的条目超过一半时重写文件去掉它们。未指定 path 时只保存在当前进程的内存中。
+    """
+
+    # 条目数超过该值后才检查是否需要去掉已过期的条目
+    COMPACT_MIN = 1000
+
+    def __init__(self, path=None):
+        self.path = path
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._file_id = None        # 已读取的文件 (st_dev, st_ino)，文件被替换后重新读取
+        self._offset = 0            # 已读取到的位置
+
+    def add(self, jti, exp):
+        with self._lock:
+            if self.path is None:
+                self._entries[jti] = exp
+                self._compact()
+                return
+            with FileLock(f'{self.path}.lock'):
+                self._sync()
+                self._entries[jti] = exp
+                if not self._compact():
+                    fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+                    try:
+                        os.write(fd, f'{jti} {int(exp)}\n'.encode())
+                    finally:
+                        os.close(fd)
+                self._sync()
+
+    def __contains__(self, jti):
+        with self._lock:
+            if self.path is not None:
+                self._sync()
+            return jti in self._entries
+
+    def _compact(self):
+        """已过期的条目超过一半时去掉它们（有文件时重写文件），返回是否重写了"""
+        if len(self._entries) <= self.COMPACT_MIN:
+            return False
+        now = time.time()
+        live = {jti: exp for jti, exp in self._entries.items() if exp > now}
+        if len(live) * 2 > len(self._entries):
+            return False
+        self._entries = live
+        if self.path is None:
+            return False
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(''.join(f'{jti} {int(exp)}\n' for jti, exp in live.items()))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        return True
+
+    def _sync(self):
+        """读入文件中新增的条目；文件被其他进程重写时重新读取全部条目"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        if (stat.st_dev, stat.st_ino) == self._file_id and stat.st_size == self._offset:
+            return
+        with open(self.path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            file_id = (stat.st_dev, stat.st_ino)
+            if file_id != self._file_id or stat.st_size < self._offset:
+                self._entries, self._file_id, self._offset = {}, file_id, 0
+            f.seek(self._offset)
+            data = f.read()
+        # 只处理完整的行，其他进程正在写入的行下次再读
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].decode().splitlines():
+            jti, _, exp = line.partition(' ')
+            self._entries[jti] = int(exp)
+        self._offset += end
+
+
+class TokenSigner:
+    """签发、校验登录令牌"""
+
+    def __init__(self, secret, ttl=TOKEN_TTL, revoked=None):
+        self.secret = secret
+        self.ttl = ttl
+        self.revoked = revoked if revoked is not None else RevocationList()
+
+    def _sign(self, payload):
+        return _b64encode(hmac.new(self.secret, payload.encode(), hashlib.sha256).digest())
+
+    def issue(self, user, now=None):
+        """返回 (令牌, 过期时间戳)"""
+        exp = int((now or time.time()) + self.ttl)
+        claims = {'uid': user['id'], 'role': user.get('role', 'user'), 'name': user.get('name', ''),
+                  'exp': exp, 'jti': secrets.token_hex(8)}
+        payload = _b64encode(json.dumps(claims, separators=(',', ':'), ensure_ascii=False).encode())
+        return f'{payload}.{self._sign(payload)}', exp
+
+    def verify(self, token, now=None):
+        """校验签名和有效期，返回载荷；无效时抛出 TokenError"""
+        payload, _, signature = (token or '').partition('.')
+        if not signature or not hmac.compare_digest(signature, self._sign(payload)):
+            raise TokenError('签名无效')
+        try:
+            claims = json.loads(_b64decode(payload))
+        except ValueError:
+            raise TokenError('格式错误')
+        if claims['exp'] <= (now or time.time()):
+            raise TokenError('已过期')
+        if claims['jti'] in self.revoked:
+            raise TokenError('已注销')
+        return claims
+
+    def revoke(self, token):
+        claims = self.verify(token)
+        self.revoked.add(claims['jti'], claims['exp'])
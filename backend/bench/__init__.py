@@ -0,0 +1,9 @@
+"""
+图书馆管理系统 - 性能测试
+
+datagen 生成指定规模的图书、用户、借阅记录，run 在临时数据目录上通过 Flask test_client
+依次压测主要接口，输出各接口的延迟分位数、吞吐量和内存峰值（JSON）。
+
+用法（在 backend 目录下）：
+    python -m bench.run --books 10000 --users 1000 --records 100000 --requests 200
+"""
@@ -0,0 +1,94 @@
+"""
+性能测试数据生成
+"""
+from datetime import datetime, timedelta
+import json
+import os
+import random
+
+CATEGORIES = ['计算机', '文学', '历史', '经济', '科幻', '哲学', '艺术', '教育']
+TITLE_WORDS = ['数据', '系统', '设计', '原理', '历史', '简史', '算法', '网络', '文学', '故事', '世界', '城市',
+               '科学', '经济', '哲学', '艺术', '时间', '未来', '中国', '现代', '理论', '实践', '导论', '通识']
+AUTHORS = ['张伟', '王芳', '李娜', '刘洋', '陈静', '杨帆', '赵磊', '黄敏', '周杰', '吴昊', '徐丽', '孙强']
+PUBLISHERS = ['机械工业出版社', '人民邮电出版社', '人民文学出版社', '中信出版社', '北京大学出版社']
+
+# 所有生成的用户共用的密码
+PASSWORD = 'bench123'
+
+
+def generate_books(count, rng):
+    books = []
+    for book_id in range(1, count + 1):
+        total = rng.randint(1, 20)
+        books.append({
+            'id': book_id,
+            'isbn': f'978-7-{book_id:09d}',
+            'title': ''.join(rng.sample(TITLE_WORDS, rng.randint(2, 4))) + f'{book_id}',
+            'author': rng.choice(AUTHORS),
+            'publisher': rng.choice(PUBLISHERS),
+            'category': rng.choice(CATEGORIES),
+            'price': round(rng.uniform(20, 150), 2),
+            'stock': total,
+            'total': total,
+            'publishDate': f'{rng.randint(1990, 2024)}-{rng.randint(1, 12):02d}-01',
+            'description': ''.join(rng.sample(TITLE_WORDS, 5)),
+        })
+    return books
+
+
+def generate_users(count, password_hash, now):
+    users = [{'id': 1, 'username': 'admin', 'password': password_hash, 'role': 'admin', 'name': '管理员',
+              'email': '', 'phone': '', 'createTime': now.isoformat()}]
+    for user_id in range(2, count + 1):
+        users.append({'id': user_id, 'username': f'user{user_id}', 'password': password_hash, 'role': 'user',
+                      'name': f'读者{user_id}', 'email': f'user{user_id}@example.com', 'phone': '',
+                      'createTime': now.isoformat()})
+    return users
+
+
+def generate_records(count, books, users, rng, now, days=730):
+    """借阅历史：借阅时间分布在最近 days 天内，较早的大多已归还；未归还的借阅扣减库存"""
+    records = []
+    open_loans = set()
+    for record_id in range(1, count + 1):
+        user = rng.choice(users)
+        book = rng.choice(books)
+        borrow_date = now - timedelta(days=days * (1 - record_id / count), hours=rng.randint(0, 23))
+        due_date = borrow_date + timedelta(days=30)
+        key = (user['id'], book['id'])
+        returned = due_date < now - timedelta(days=5) or rng.random() < 0.5
+        if not returned and (book['stock'] <= 0 or key in open_loans):
+            returned = True
+        record = {
+            'id': record_id, 'userId': user['id'], 'bookId': book['id'], 'userName': user['name'],
+            'bookTitle': book['title'], 'borrowDate': borrow_date.isoformat(), 'dueDate': due_date.isoformat(),
+            'returnDate': None, 'status': 'borrowed', 'fine': 0,
+        }
+        if returned:
+            return_date = borrow_date + timedelta(days=rng.randint(1, 40))
+            record['returnDate'] = min(return_date, now).isoformat()
+            record['status'] = 'returned'
+            if return_date > due_date:
+                record['fine'] = (return_date - due_date).days * 0.5
+        else:
+            open_loans.add(key)
+            book['stock'] -= 1
+        records.append(record)
+    return records
+
+
+def generate(data_dir, books=1000, users=100, records=10000, seed=1, password_hash=None):
+    """在 data_dir 写入生成的 users.json、books.json、borrow_records.json，返回各集合的记录数"""
+    rng = random.Random(seed)
+    now = datetime.now()
+    if password_hash is None:
+        from auth import make_password
+        password_hash = make_password(PASSWORD)
+    book_list = generate_books(books, rng)
+    user_list = generate_users(users, password_hash, now)
+    record_list = generate_records(records, book_list, user_list, rng, now)
+    os.makedirs(data_dir, exist_ok=True)
+    for name, items in (('users', user_list), ('books', book_list), ('borrow_records', record_list)):
+        with open(os.path.join(data_dir, f'{name}.json'), 'w', encoding='utf-8') as f:
+            json.dump(items, f, ensure_ascii=False)
+    return {'users': len(user_list), 'books': len(book_list), 'borrow_records': len(record_list)}
@@ -0,0 +1,175 @@
+"""
+性能测试：在临时数据目录生成数据，通过 Flask test_client 逐个场景压测接口，结果以 JSON 输出
+"""
+import argparse
+import importlib
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:     # Windows
+    resource = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.datagen import PASSWORD, TITLE_WORDS, generate
+
+SCENARIOS = ('books_page', 'books_cursor', 'books_search', 'borrow_list', 'statistics', 'login', 'borrow_return')
+
+
+def percentile(values, p):
+    """已排序数据的 p 分位数（线性插值）"""
+    if not values:
+        return None
+    k = (len(values) - 1) * p / 100
+    low = int(k)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (k - low)
+
+
+def peak_rss_mb():
+    """进程内存峰值（MB），不支持的平台返回 None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def measure(call, count):
+    """执行 count 次 call(i)，返回延迟分位数（毫秒）和吞吐量（次/秒）"""
+    latencies = []
+    start = time.perf_counter()
+    for i in range(count):
+        begin = time.perf_counter()
+        response = call(i)
+        latencies.append((time.perf_counter() - begin) * 1000)
+        if response.status_code >= 500:
+            raise RuntimeError(f'请求失败：{response.status_code}')
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'requests': count,
+        'meanMs': round(sum(latencies) / count, 3),
+        'p50Ms': round(percentile(latencies, 50), 3),
+        'p95Ms': round(percentile(latencies, 95), 3),
+        'p99Ms': round(percentile(latencies, 99), 3),
+        'maxMs': round(latencies[-1], 3),
+        'throughput': round(count / elapsed, 1),
+    }
+
+
+def build_scenarios(client, counts, rng):
+    """场景名 -> 发送第 i 个请求的函数"""
+    books, users = counts['books'], counts['users']
+    cursor = {'next': ''}
+
+    def random_user():
+        return rng.randint(2, users) if users > 1 else 1
+
+    def books_page(i):
+        page = rng.randint(1, max(books // 20, 1))
+        return client.get(f'/api/books?page={page}&pageSize=20')
+
+    def books_cursor(i):
+        # 从头依次翻页，翻到最后再从头开始
+        response = client.get(f"/api/books?pageSize=20&cursor={cursor['next']}")
+        cursor['next'] = response.get_json()['data']['nextCursor'] or ''
+        return response
+
+    def books_search(i):
+        return client.get(f'/api/books?q={rng.choice(TITLE_WORDS)}&pageSize=20')
+
+    def borrow_list(i):
+        return client.get(f'/api/borrow?userId={random_user()}&pageSize=20')
+
+    def statistics(i):
+        return client.get('/api/statistics')
+
+    def login(i):
+        username = f'user{random_user()}' if users > 1 else 'admin'
+        return client.post('/api/auth/login', json={'username': username, 'password': PASSWORD})
+
+    def borrow_return(i):
+        response = client.post('/api/borrow', json={'userId': random_user(), 'bookId': rng.randint(1, books)})
+        data = response.get_json()
+        if data['code'] == 200:
+            response = client.post(f"/api/borrow/{data['data']['id']}/return")
+        return response
+
+    return {'books_page': books_page, 'books_cursor': books_cursor, 'books_search': books_search,
+            'borrow_list': borrow_list, 'statistics': statistics, 'login': login, 'borrow_return': borrow_return}
+
+
+def run(books=1000, users=100, records=10000, requests=200, seed=1, scenarios=SCENARIOS, data_dir=None):
+    """生成数据并压测，返回结果字典。需要在本进程导入 app 之前调用（app 启动时读取数据目录）"""
+    if 'app' in sys.modules:
+        raise RuntimeError('app 已经导入，无法切换到测试数据目录')
+    own_dir = data_dir is None
+    data_dir = data_dir or tempfile.mkdtemp(prefix='library-bench-')
+    os.environ['LIBRARY_DATA_DIR'] = data_dir
+    try:
+        begin = time.perf_counter()
+        counts = generate(data_dir, books=books, users=users, records=records, seed=seed)
+        generate_seconds = time.perf_counter() - begin
+        storage = os.environ.get('LIBRARY_STORAGE', 'json')
+        if storage == 'sqlite':
+            from manage import migrate_sqlite
+            db_path = os.environ.setdefault('LIBRARY_SQLITE_PATH', os.path.join(data_dir, 'library.db'))
+            migrate_sqlite(data_dir, db_path)
+
+        # 导入 app 并加载全部集合（含索引、统计的初次构建）
+        begin = time.perf_counter()
+        app_module = importlib.import_module('app')
+        for name in counts:
+            app_module.repo.collection(name)
+        load_seconds = time.perf_counter() - begin
+
+        client = app_module.app.test_client()
+        calls = build_scenarios(client, counts, random.Random(seed))
+        results = {name: measure(calls[name], requests) for name in scenarios}
+        return {
+            'config': {'books': books, 'users': users, 'records': records, 'requests': requests,
+                       'seed': seed, 'storage': storage},
+            'generateSeconds': round(generate_seconds, 3),
+            'loadSeconds': round(load_seconds, 3),
+            'scenarios': results,
+            'peakRssMb': peak_rss_mb(),
+        }
+    finally:
+        if own_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='图书馆管理系统接口性能测试')
+    parser.add_argument('--books', type=int, default=1000, help='图书数量')
+    parser.add_argument('--users', type=int, default=100, help='用户数量（含管理员）')
+    parser.add_argument('--records', type=int, default=10000, help='借阅记录数量')
+    parser.add_argument('--requests', type=int, default=200, help='每个场景的请求次数')
+    parser.add_argument('--seed', type=int, default=1, help='随机数种子')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='要运行的场景，逗号分隔')
+    parser.add_argument('--data-dir', help='数据目录（默认使用临时目录，结束后删除）')
+    parser.add_argument('--output', help='结果写入文件，默认输出到标准输出')
+    args = parser.parse_args(argv)
+
+    scenarios = [name for name in args.scenarios.split(',') if name]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"未知场景：{', '.join(sorted(unknown))}")
+    report = run(args.books, args.users, args.records, args.requests, args.seed, scenarios, args.data_dir)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
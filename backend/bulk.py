@@ -0,0 +1,122 @@
+"""
+图书馆管理系统 - 图书批量导入导出
+
+支持两种格式：csv（首行为字段名）和 jsonl（每行一个 JSON 对象）。
+导入时逐行读取请求体，不需要先把整个文件读入内存；导出时逐批生成响应内容。
+"""
+import csv
+import io
+import json
+import math
+
+from models import json_default
+
+# 导出的字段（也是 CSV 导入时可用的列名）
+BOOK_FIELDS = ['id', 'isbn', 'title', 'author', 'publisher', 'category', 'price', 'stock', 'total',
+               'publishDate', 'description']
+# 导入时按文本保存的字段
+TEXT_FIELDS = ['isbn', 'title', 'author', 'publisher', 'category', 'publishDate', 'description']
+FORMATS = ('csv', 'jsonl')
+
+# 导出时每次生成的记录数
+EXPORT_BATCH = 500
+
+
+def read_rows(stream, fmt):
+    """逐行解析上传内容，生成 (行号, 字段字典)；无法解析的行生成 (行号, 错误信息)
+
+    内容不是 UTF-8 编码或 CSV 格式无法解析时整个文件无法继续读取，抛出 ValueError。
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    try:
+        if fmt == 'csv':
+            reader = csv.DictReader(text)
+            for row in reader:
+                yield reader.line_num, {k: v for k, v in row.items() if k is not None}
+            return
+        for line_no, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                yield line_no, 'JSON格式错误'
+                continue
+            yield line_no, row if isinstance(row, dict) else '每行应为一个JSON对象'
+    except UnicodeDecodeError:
+        # 按块解码，出错的位置不能准确对应到行
+        raise ValueError('文件不是UTF-8编码，请转换为UTF-8后重新上传')
+    except csv.Error as e:
+        raise ValueError(f'第{reader.line_num}行CSV格式错误：{e}')
+
+
+def clean_book(row):
+    """校验一行图书数据并转换字段类型，返回 add_book 接受的字段；数据无效时抛出 ValueError"""
+    data = {}
+    for field in TEXT_FIELDS:
+        value = row.get(field)
+        if value is None or value == '':
+            continue
+        # JSON lines 中的文本字段只接受字符串或数字，数组、对象等不能原样保存
+        if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+            raise ValueError(f'{field}格式错误')
+        data[field] = str(value)
+    for field in ('isbn', 'title', 'author'):
+        if not data.get(field, '').strip():
+            raise ValueError(f'缺少{field}')
+    data['isbn'] = data['isbn'].strip()
+    if row.get('price') not in (None, ''):
+        data['price'] = clean_price(row['price'])
+    if row.get('total') not in (None, ''):
+        data['total'] = clean_total(row['total'])
+    return data
+
+
+def clean_price(value):
+    """价格：有限的非负数（nan、inf 无法输出为合法的 JSON），否则抛出 ValueError"""
+    try:
+        price = float(value)
+    except (TypeError, ValueError):
+        raise ValueError('价格格式错误')
+    if not math.isfinite(price) or price < 0:
+        raise ValueError('价格应为非负数')
+    return price
+
+
+def clean_total(value):
+    """馆藏数量：非负整数，否则抛出 ValueError"""
+    if isinstance(value, float) and not value.is_integer():
+        raise ValueError('数量应为整数')
+    try:
+        total = int(value)
+    except (TypeError, ValueError):
+        raise ValueError('数量格式错误')
+    if total < 0:
+        raise ValueError('数量应为非负整数')
+    return total
+
+
+def export_rows(books, fmt):
+    """逐批生成导出内容，books 为可迭代的图书记录"""
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=BOOK_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        count = 0
+        for book in books:
+            writer.writerow(book)
+            count += 1
+            if count % EXPORT_BATCH == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+        return
+    lines = []
+    for book in books:
+        lines.append(json.dumps(book, ensure_ascii=False, default=json_default))
+        if len(lines) == EXPORT_BATCH:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
@@ -0,0 +1,65 @@
+"""
+图书馆管理系统 - 响应缓存
+
+缓存只读接口序列化后的响应体，按 (路径, 查询参数) 区分，容量有限，按最近最少使用淘汰。
+每条缓存记录生成时所依赖数据的版本，版本变化后视为失效。
+压缩后的响应体（gzip/deflate）与原响应体一起缓存，命中时不再重复压缩。
+"""
+from collections import OrderedDict
+import hashlib
+import threading
+
+# 默认最多缓存的响应数
+CACHE_SIZE = 256
+
+
+class ResponseCache:
+    """LRU 响应缓存"""
+
+    def __init__(self, maxsize=CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version):
+        """返回 (响应体, ETag)；不存在或版本不一致时返回 None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1], entry[2]
+
+    def put(self, key, version, body):
+        """保存响应体，返回 (响应体, ETag)"""
+        etag = hashlib.sha1(body).hexdigest()
+        with self._lock:
+            self._entries[key] = (version, body, etag, {})
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return body, etag
+
+    def encoded(self, key, version, encoding, encode):
+        """返回压缩后的响应体（encode(body) 的结果按 encoding 缓存）；不存在或版本不一致时返回 None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            data = entry[3].get(encoding)
+        if data is None:
+            data = encode(entry[1])
+            with self._lock:
+                entry[3][encoding] = data
+        return data
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,63 @@
+"""
+图书馆管理系统 - 冗余字段的一致性
+
+借阅记录和预约中保存了书名（bookTitle）和借阅人姓名（userName），列表直接输出，不需要逐条关联图书和用户。
+图书改名、用户改姓名时由 propagate() 按外键索引只更新引用了它的记录，不改写整个集合；
+repair() 一次遍历修正历史数据中已经不一致的记录（python manage.py repair-records）。
+"""
+
+# 冗余字段：(保存冗余字段的集合, 字段, 外键字段, 来源集合, 来源字段)
+DENORMALIZED = [
+    ('borrow_records', 'bookTitle', 'bookId', 'books', 'title'),
+    ('borrow_records', 'userName', 'userId', 'users', 'name'),
+    ('holds', 'bookTitle', 'bookId', 'books', 'title'),
+    ('holds', 'userName', 'userId', 'users', 'name'),
+]
+
+
+def references(source):
+    """引用了 source 集合的冗余字段：[(集合, 字段, 外键字段, 来源字段)]"""
+    return [(name, field, key, source_field)
+            for name, field, key, source_name, source_field in DENORMALIZED if source_name == source]
+
+
+def propagate(collection, ids, field, value):
+    """把 ids 中记录的 field 改为 value（需在该集合的事务中调用），返回修改的记录数"""
+    changed = 0
+    for item_id in sorted(ids):
+        item = collection.get(item_id)
+        if item is not None and item.get(field) != value:
+            collection.update(item_id, {field: value})
+            changed += 1
+    return changed
+
+
+def repair(repo):
+    """按当前的图书、用户信息修正全部冗余字段，返回 {集合: 修正的记录数}
+
+    来源记录已删除时保留原值。所有修改在一个事务中完成，只写入有变化的记录。
+    """
+    names = {name for name, *_ in DENORMALIZED} | {source for *_, source, _ in DENORMALIZED}
+    counts = {}
+    with repo.transaction(*names):
+        values = {}
+        for _, _, _, source, source_field in DENORMALIZED:
+            if (source, source_field) not in values:
+                values[source, source_field] = {item['id']: item[source_field]
+                                                for item in repo.collection(source).all()}
+        for name in dict.fromkeys(name for name, *_ in DENORMALIZED):
+            collection = repo.collection(name)
+            fields = [(field, key, values[source, source_field])
+                      for target, field, key, source, source_field in DENORMALIZED if target == name]
+            changed = 0
+            for item in list(collection.all()):
+                changes = {}
+                for field, key, current in fields:
+                    value = current.get(item[key])
+                    if value is not None and item.get(field) != value:
+                        changes[field] = value
+                if changes:
+                    collection.update(item['id'], changes)
+                    changed += 1
+            counts[name] = changed
+    return counts
@@ -0,0 +1,135 @@
+"""
+图书馆管理系统 - 图书预约队列
+
+库存为 0 的图书可以预约，每本书的预约按提交顺序排成队列（FIFO）。
+还书时归还的这一册直接分配给队首的预约（状态 waiting -> ready），读者在保留期内借走即完成预约，
+超过保留期未借的预约由定时清理标记为 expired，这一册再交给下一位或放回库存。
+队列作为 holds 集合的监听器，随预约的新增和状态变化增量更新。
+
+预约状态：waiting（排队中）、ready（已到书，保留中）、fulfilled（已借走）、cancelled（已取消）、expired（已过期）
+"""
+from collections import deque
+from datetime import datetime
+import heapq
+import threading
+
+# 到书后的保留天数
+HOLD_PICKUP_DAYS = 3
+
+# 仍在进行中的预约状态
+ACTIVE_STATUSES = ('waiting', 'ready')
+
+
+class HoldQueue:
+    """各图书的预约队列与到书保留期"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._reset()
+
+    def _reset(self):
+        self._queues = {}      # bookId -> 排队中的预约 id（按 id 排序），取消等变化在出队时跳过
+        self._waiting = {}     # 排队中的预约 id -> bookId
+        self._counts = {}      # bookId -> 排队人数
+        self._heap = []        # (保留截止时间, 预约 id)，失效的条目在出堆时跳过
+        self._ready = {}       # 保留中的预约 id -> 保留截止时间
+
+    # ==================== 索引维护 ====================
+    def rebuild(self, holds):
+        with self._lock:
+            self._reset()
+            for hold in sorted(holds, key=lambda h: h['id']):
+                self._add(hold)
+            heapq.heapify(self._heap)
+            self._changed.notify_all()
+
+    def apply(self, old, new):
+        with self._lock:
+            if old is not None:
+                self._remove(old)
+            if new is not None:
+                self._add(new, push=True)
+            # 通知等待到书的请求
+            if new is not None and new['status'] == 'ready':
+                self._changed.notify_all()
+
+    def _add(self, hold, push=False):
+        hold_id, status = hold['id'], hold['status']
+        if status == 'waiting':
+            book_id = hold['bookId']
+            queue = self._queues.get(book_id)
+            if queue is None:
+                queue = self._queues[book_id] = deque()
+            if not queue or queue[-1] < hold_id:
+                queue.append(hold_id)
+            elif hold_id not in queue:
+                # 撤销事务时恢复的预约按 id 插回原来的位置
+                queue.insert(next(i for i, other in enumerate(queue) if other > hold_id), hold_id)
+            self._waiting[hold_id] = book_id
+            self._counts[book_id] = self._counts.get(book_id, 0) + 1
+        elif status == 'ready':
+            expires_at = datetime.fromisoformat(hold['expiresAt'])
+            self._ready[hold_id] = expires_at
+            entry = (expires_at, hold_id)
+            if push:
+                heapq.heappush(self._heap, entry)
+            else:
+                self._heap.append(entry)
+
+    def _remove(self, hold):
+        hold_id, status = hold['id'], hold['status']
+        if status == 'waiting':
+            book_id = self._waiting.pop(hold_id, None)
+            if book_id is None:
+                return
+            self._counts[book_id] -= 1
+            if not self._counts[book_id]:
+                del self._counts[book_id]
+                del self._queues[book_id]
+        elif status == 'ready':
+            self._ready.pop(hold_id, None)
+            if len(self._heap) > 2 * len(self._ready) + 64:
+                self._heap = [(expires_at, other) for other, expires_at in self._ready.items()]
+                heapq.heapify(self._heap)
+
+    # ==================== 查询 ====================
+    def next_waiting(self, book_id):
+        """队首的预约 id（没有排队时返回 None），只丢弃已离开队列的条目"""
+        with self._lock:
+            queue = self._queues.get(book_id)
+            while queue and self._waiting.get(queue[0]) != book_id:
+                queue.popleft()
+            return queue[0] if queue else None
+
+    def queue_length(self, book_id):
+        with self._lock:
+            return self._counts.get(book_id, 0)
+
+    def position(self, hold_id):
+        """排队中的预约前面还有几位（从 1 开始），不在排队时返回 None"""
+        with self._lock:
+            book_id = self._waiting.get(hold_id)
+            if book_id is None:
+                return None
+            waiting = self._waiting
+            return 1 + sum(1 for other in self._queues[book_id] if other < hold_id and waiting.get(other) == book_id)
+
+    def next_expiry(self):
+        """最早的保留截止时间，没有保留中的预约时返回 None"""
+        with self._lock:
+            heap = self._heap
+            while heap and self._ready.get(heap[0][1]) != heap[0][0]:
+                heapq.heappop(heap)
+            return heap[0][0] if heap else None
+
+    def expired(self, now):
+        """保留已过期的预约 id（按截止时间排序）"""
+        with self._lock:
+            return [hold_id for hold_id, expires_at in sorted(self._ready.items(), key=lambda item: item[1])
+                    if expires_at < now]
+
+    def wait(self, timeout):
+        """等待有预约到书（或超时），返回后由调用方重新查询"""
+        with self._changed:
+            self._changed.wait(timeout)
@@ -0,0 +1,90 @@
+"""
+图书馆管理系统 - 数据维护工具
+
+用法：
+    python manage.py [--data-dir DIR] migrate-sqlite [--db PATH]
+    python manage.py [--data-dir DIR] convert-format {pretty,compact,columnar}
+    python manage.py [--data-dir DIR] repair-records [--db PATH]
+"""
+import argparse
+import os
+import sys
+sys.path.insert(0, os.path.dirname(__file__))
+
+from denorm import repair
+from repository import Repository, DEFAULT_COLLECTIONS
+from storage import JSON_FORMATS, JsonStorage, Journal, SqliteStorage
+
+DATA_DIR = os.environ.get('LIBRARY_DATA_DIR') or os.path.join(os.path.dirname(__file__), 'data')
+
+
+def open_json_repository(data_dir, fmt='pretty'):
+    """打开 JSON 数据目录（存在日志时一并重放）"""
+    journal_path = os.path.join(data_dir, 'journal.log')
+    journal = Journal(journal_path) if os.path.exists(journal_path) else None
+    return Repository(JsonStorage(data_dir, fmt), journal=journal, lock_dir=data_dir)
+
+
+def migrate_sqlite(data_dir, db_path):
+    """把 JSON 数据导入 SQLite，返回各集合导入的记录数"""
+    source = open_json_repository(data_dir)
+    target = SqliteStorage(db_path)
+    counts = {}
+    for name in DEFAULT_COLLECTIONS:
+        items = list(source.collection(name).all())
+        target.save(name, items)
+        counts[name] = len(items)
+    return counts
+
+
+def convert_format(data_dir, fmt):
+    """把数据文件改写为指定格式（合并日志），返回各集合的记录数"""
+    repo = open_json_repository(data_dir, fmt)
+    counts = {name: len(repo.collection(name)) for name in DEFAULT_COLLECTIONS}
+    repo.compact()
+    return counts
+
+
+def repair_records(data_dir, db_path=None):
+    """按当前的图书、用户信息修正借阅记录和预约中的书名、姓名，返回各集合修正的记录数"""
+    if db_path:
+        repo = Repository(SqliteStorage(db_path), lock_dir=os.path.dirname(os.path.abspath(db_path)))
+    else:
+        repo = open_json_repository(data_dir)
+    return repair(repo)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='图书馆管理系统数据维护工具')
+    parser.add_argument('--data-dir', default=DATA_DIR, help='JSON 数据目录')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    migrate = commands.add_parser('migrate-sqlite', help='把 JSON 数据导入 SQLite 数据库')
+    migrate.add_argument('--db', help='SQLite 数据库路径（默认 <data-dir>/library.db）')
+
+    convert = commands.add_parser('convert-format', help='改写 JSON 数据文件的格式')
+    convert.add_argument('format', choices=JSON_FORMATS)
+
+    fix = commands.add_parser('repair-records', help='修正借阅记录、预约中与图书/用户不一致的书名和姓名')
+    fix.add_argument('--db', help='修正 SQLite 数据库（默认修正 JSON 数据目录）')
+
+    args = parser.parse_args(argv)
+    if args.command == 'convert-format':
+        counts = convert_format(args.data_dir, args.format)
+        for name, count in counts.items():
+            print(f'{name}: {count} 条')
+        print(f'已改写为 {args.format} 格式')
+    elif args.command == 'migrate-sqlite':
+        db_path = args.db or os.path.join(args.data_dir, 'library.db')
+        counts = migrate_sqlite(args.data_dir, db_path)
+        for name, count in counts.items():
+            print(f'{name}: {count} 条')
+        print(f'已导入到 {db_path}')
+    elif args.command == 'repair-records':
+        counts = repair_records(args.data_dir, args.db)
+        for name, count in counts.items():
+            print(f'{name}: 修正 {count} 条')
+
+
+if __name__ == '__main__':
+    main()
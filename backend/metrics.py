@@ -0,0 +1,109 @@
+"""
+图书馆管理系统 - 运行指标
+
+记录每个接口的请求数和延迟分布，以及存储层的读写耗时、字节数、记录数，
+按 Prometheus 文本格式输出（/api/metrics）。
+"""
+from bisect import bisect_left
+import threading
+
+# 延迟分布的桶上限（秒）
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """固定桶的直方图"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """各桶上限及小于等于该值的累计次数（最后一项为 +Inf）"""
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            yield bound, total
+
+
+def _labels(**labels):
+    return ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _bound(value):
+    return '+Inf' if value == float('inf') else repr(value)
+
+
+class Metrics:
+    """指标汇总"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self.requests = {}          # (method, route, status) -> 次数
+        self.latency = {}           # (method, route) -> Histogram
+        self.storage_time = {}      # (op, collection) -> Histogram
+        self.storage_bytes = {}     # (op, collection) -> 字节数
+        self.storage_records = {}   # (op, collection) -> 记录数
+
+    def observe_request(self, method, route, status, seconds):
+        with self._lock:
+            key = (method, route, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            histogram = self.latency.get((method, route))
+            if histogram is None:
+                histogram = self.latency[(method, route)] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def observe_storage(self, op, name, seconds, nbytes, records):
+        """存储层 observer 回调"""
+        with self._lock:
+            key = (op, name)
+            histogram = self.storage_time.get(key)
+            if histogram is None:
+                histogram = self.storage_time[key] = Histogram(self.buckets)
+            histogram.observe(seconds)
+            self.storage_bytes[key] = self.storage_bytes.get(key, 0) + nbytes
+            self.storage_records[key] = self.storage_records.get(key, 0) + records
+
+    def render(self, gauges=()):
+        """Prometheus 文本格式；gauges 为额外的 (指标名, 说明, {标签字典的元组: 值})"""
+        lines = []
+        with self._lock:
+            lines += ['# HELP library_http_requests_total 接口请求次数', '# TYPE library_http_requests_total counter']
+            for (method, route, status), count in sorted(self.requests.items()):
+                lines.append(f'library_http_requests_total{{{_labels(method=method, route=route, status=status)}}} {count}')
+            self._render_histograms(lines, 'library_http_request_duration_seconds', '接口耗时',
+                                    {_labels(method=m, route=r): h for (m, r), h in self.latency.items()})
+            self._render_histograms(lines, 'library_storage_duration_seconds', '存储读写耗时',
+                                    {_labels(op=op, collection=c): h for (op, c), h in self.storage_time.items()})
+            for name, help_text, values in (('library_storage_bytes_total', '存储读写字节数', self.storage_bytes),
+                                            ('library_storage_records_total', '存储读写记录数', self.storage_records)):
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+                for (op, collection), value in sorted(values.items()):
+                    lines.append(f'{name}{{{_labels(op=op, collection=collection)}}} {value}')
+        for name, help_text, values in gauges:
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} gauge']
+            for labels, value in values.items():
+                lines.append(f'{name}{{{_labels(**dict(labels))}}} {value}' if labels else f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _render_histograms(lines, name, help_text, histograms):
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+        for labels, histogram in sorted(histograms.items()):
+            for bound, count in histogram.cumulative():
+                lines.append(f'{name}_bucket{{{labels},le="{_bound(bound)}"}} {count}')
+            lines.append(f'{name}_sum{{{labels}}} {histogram.sum}')
+            lines.append(f'{name}_count{{{labels}}} {histogram.count}')
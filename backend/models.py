@@ -0,0 +1,209 @@
+"""
+图书馆管理系统 - 记录类型
+
+集合中的记录用带 __slots__ 的只读对象保存，比同样内容的字典节省大部分内存。
+记录实现 Mapping 接口（record['title']、record.get()、dict(record)），
+原有按字典访问的代码和接口返回的 JSON 结构都不需要改变。
+
+分类、状态、出版社等取值有限的字段在创建时驻留（sys.intern），相同的字符串共用一个对象；
+借阅记录的日期在第一次用到时解析并缓存，之后比较日期不再重复解析。
+接口输出记录时生成的 JSON 文本也缓存在记录上，列表接口反复输出同一批记录时直接拼接。
+"""
+from collections.abc import Mapping
+from datetime import datetime
+import json
+import sys
+
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+def _compile(source, name):
+    namespace = {'_intern': _intern}
+    exec(source, namespace)
+    return namespace[name]
+
+
+class Record(Mapping):
+    """记录基类：FIELDS 中的字段存入同名的 slot，其他字段存入 _extra 字典"""
+
+    __slots__ = ('_extra', '_json')
+    FIELDS = ()
+    INTERNED = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._field_set = frozenset(cls.FIELDS)
+        cls._interned = frozenset(cls.INTERNED)
+        # 字段齐全（绝大多数记录）时使用按字段展开生成的函数，
+        # 比逐个 setattr / getattr 的通用循环快几倍（与 collections.namedtuple 的做法相同）
+        cls._fill = staticmethod(_compile('def fill(self, data):\n' + ''.join(
+            f'    self.{key} = _intern(data[{key!r}])\n' if key in cls._interned else f'    self.{key} = data[{key!r}]\n'
+            for key in cls.FIELDS) + '    self._extra = None\n', 'fill'))
+        cls._as_dict = staticmethod(_compile('def as_dict(self):\n    return {' + ', '.join(
+            f'{key!r}: self.{key}' for key in cls.FIELDS) + '}\n', 'as_dict'))
+
+    def __init__(self, data):
+        if data.keys() == self._field_set:
+            self._fill(self, data)
+            return
+        fields, interned = self._field_set, self._interned
+        extra = None
+        for key, value in data.items():
+            if key in fields:
+                if key in interned:
+                    value = _intern(value)
+                setattr(self, key, value)
+            else:
+                if extra is None:
+                    extra = {}
+                extra[key] = value
+        self._extra = extra
+
+    @classmethod
+    def of(cls, data):
+        """把字典转换为记录，已经是该类型的记录原样返回"""
+        return data if type(data) is cls else cls(data)
+
+    def __getitem__(self, key):
+        if key in self._field_set:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        if key in self._field_set:
+            return getattr(self, key, default)
+        if self._extra is not None:
+            return self._extra.get(key, default)
+        return default
+
+    def __contains__(self, key):
+        if key in self._field_set:
+            return hasattr(self, key)
+        return self._extra is not None and key in self._extra
+
+    def __iter__(self):
+        for key in self.FIELDS:
+            if hasattr(self, key):
+                yield key
+        if self._extra is not None:
+            yield from self._extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def to_dict(self):
+        """转换为普通字典（比 dict(record) 快）"""
+        if self._extra is None:
+            try:
+                return self._as_dict(self)
+            except AttributeError:
+                pass
+        data = {}
+        for key in self.FIELDS:
+            try:
+                data[key] = getattr(self, key)
+            except AttributeError:
+                pass
+        if self._extra is not None:
+            data.update(self._extra)
+        return data
+
+    def to_json(self, fields=None, row=False):
+        """记录的 JSON 文本（见 record_json），缓存最近一次的字段组合，记录只读所以不会过期"""
+        key = (fields, row)
+        try:
+            cached_key, text = self._json
+            if cached_key == key:
+                return text
+        except AttributeError:
+            pass
+        text = _dumps(_project(self.to_dict(), fields, row))
+        self._json = (key, text)
+        return text
+
+    def __repr__(self):
+        return f'{type(self).__name__}({dict(self)!r})'
+
+
+class Book(Record):
+    __slots__ = ('id', 'isbn', 'title', 'author', 'publisher', 'category', 'price', 'stock', 'total',
+                 'publishDate', 'description')
+    FIELDS = __slots__
+    INTERNED = ('author', 'publisher', 'category')
+
+
+class User(Record):
+    __slots__ = ('id', 'username', 'password', 'role', 'name', 'email', 'phone', 'createTime')
+    FIELDS = __slots__
+    INTERNED = ('role',)
+
+
+class BorrowRecord(Record):
+    __slots__ = ('id', 'userId', 'bookId', 'userName', 'bookTitle', 'borrowDate', 'dueDate', 'returnDate',
+                 'status', 'fine', '_due_at')
+    FIELDS = __slots__[:-1]
+    INTERNED = ('userName', 'bookTitle', 'status')
+
+    @property
+    def due_at(self):
+        """应还日期（datetime，解析一次后缓存）"""
+        try:
+            return self._due_at
+        except AttributeError:
+            value = self._due_at = datetime.fromisoformat(self.dueDate)
+            return value
+
+
+class Hold(Record):
+    __slots__ = ('id', 'userId', 'bookId', 'userName', 'bookTitle', 'createTime', 'status', 'readyAt', 'expiresAt')
+    FIELDS = __slots__
+    INTERNED = ('userName', 'bookTitle', 'status')
+
+
+# 各集合使用的记录类型
+MODELS = {'books': Book, 'users': User, 'borrow_records': BorrowRecord, 'holds': Hold}
+
+
+def plain(item):
+    """记录对象转为字典，普通字典原样返回"""
+    return item if type(item) is dict else item.to_dict()
+
+
+def _project(data, fields, row):
+    if row:
+        return [data.get(key) for key in fields]
+    if fields is None:
+        return data
+    return {key: data[key] for key in fields if key in data}
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+def record_json(item, fields=None, row=False):
+    """记录的 JSON 文本：只含 fields 中的字段（None 为全部字段），row 为真时输出按 fields 排列的值数组"""
+    if type(item) is dict:
+        return _dumps(_project(item, fields, row))
+    return item.to_json(fields, row)
+
+
+def json_default(obj):
+    """json.dumps 的 default 参数：记录对象按字典输出"""
+    if isinstance(obj, Record):
+        return obj.to_dict()
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def due_at(record):
+    """借阅记录的应还日期，普通字典则每次解析"""
+    if type(record) is BorrowRecord:
+        return record.due_at
+    return datetime.fromisoformat(record['dueDate'])
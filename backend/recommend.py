@@ -0,0 +1,142 @@
+"""
+图书馆管理系统 - 图书推荐（“借过这本书的读者还借过”）
+
+两本书被同一位读者借过即共现一次，共现的读者越多越相关。
+推荐器作为 borrow_records 集合的监听器维护倒排表（读者 -> 图书、图书 -> 读者），
+每本书的相关图书（前 top_k 本）在第一次查询时由倒排表算出并缓存；
+之后每次借阅只更新涉及的已缓存条目（共现次数只增不减，前 k 名可以逐条维护），
+查询相关图书只是一次字典读取。删除借阅记录时相关缓存失效，下次查询重新计算。
+
+完整的图书 × 图书共现矩阵在百万级借阅时条目过多，这里只保存倒排表和各书的前 k 名。
+"""
+from collections import Counter
+import heapq
+import threading
+
+
+class Recommender:
+    """基于借阅历史共现的图书推荐"""
+
+    def __init__(self, top_k=10, history=50):
+        self.top_k = top_k
+        self.history = history          # 为读者推荐时参考最近借过的图书数
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.user_books = {}            # userId -> {bookId: 借阅次数}，按第一次借阅的先后排列
+        self.book_users = {}            # bookId -> 借过的 userId 集合
+        self._related = {}              # bookId -> [(共现读者数, bookId)]，已计算过的图书才有
+
+    # ==================== 监听借阅记录 ====================
+    def rebuild(self, records):
+        with self._lock:
+            self._reset()
+            user_books, book_users = self.user_books, self.book_users
+            for record in records:
+                user_id, book_id = record['userId'], record['bookId']
+                books = user_books.get(user_id)
+                if books is None:
+                    books = user_books[user_id] = {}
+                books[book_id] = books.get(book_id, 0) + 1
+                users = book_users.get(book_id)
+                if users is None:
+                    users = book_users[book_id] = set()
+                users.add(user_id)
+
+    def apply(self, old, new):
+        # 归还、逾期等状态变化不影响推荐
+        if old is not None and new is not None and (old['userId'], old['bookId']) == (new['userId'], new['bookId']):
+            return
+        with self._lock:
+            if old is not None:
+                self._remove(old['userId'], old['bookId'])
+            if new is not None:
+                self._add(new['userId'], new['bookId'])
+
+    def _add(self, user_id, book_id):
+        books = self.user_books.setdefault(user_id, {})
+        if book_id in books:
+            books[book_id] += 1
+            return
+        users = self.book_users.setdefault(book_id, set())
+        users.add(user_id)
+        # 与该读者借过的每本书各多一位共同读者，只需更新已缓存的条目
+        for other in books:
+            if book_id in self._related or other in self._related:
+                count = self._known_count(book_id, other)
+                # 缓存中已有这一对时次数加一即可，否则求两本书读者集合的交集
+                count = count + 1 if count is not None else len(users & self.book_users[other])
+                self._offer(book_id, other, count)
+                self._offer(other, book_id, count)
+        books[book_id] = 1
+
+    def _remove(self, user_id, book_id):
+        books = self.user_books.get(user_id)
+        if not books or book_id not in books:
+            return
+        books[book_id] -= 1
+        if books[book_id]:
+            return
+        del books[book_id]
+        if not books:
+            del self.user_books[user_id]
+        users = self.book_users[book_id]
+        users.discard(user_id)
+        if not users:
+            del self.book_users[book_id]
+        # 共现次数减少后，原来排在前 k 名之外的图书可能进入，缓存失效后重新计算
+        self._related.pop(book_id, None)
+        for other in books:
+            self._related.pop(other, None)
+
+    def _known_count(self, book_id, other):
+        """两本书增加共同读者之前的共现次数（任一方的缓存里有这一对时）"""
+        for first, second in ((book_id, other), (other, book_id)):
+            for count, related_id in self._related.get(first, ()):
+                if related_id == second:
+                    return count
+        return None
+
+    def _offer(self, book_id, other, count):
+        """other 与 book_id 的共现次数增加到 count，更新 book_id 的缓存（未缓存时忽略）"""
+        related = self._related.get(book_id)
+        if related is None:
+            return
+        entries = [entry for entry in related if entry[1] != other]
+        entries.append((count, other))
+        entries.sort(key=_rank)
+        # 替换而不是就地修改，正在读取旧列表的请求不受影响
+        self._related[book_id] = entries[:self.top_k]
+
+    # ==================== 查询 ====================
+    def related(self, book_id):
+        """借过该书的读者还借过的图书：[(共现读者数, bookId)]，按相关程度从高到低"""
+        with self._lock:
+            related = self._related.get(book_id)
+            if related is None:
+                related = self._related[book_id] = self._compute(book_id)
+            return related
+
+    def _compute(self, book_id):
+        counts = Counter()
+        for user_id in self.book_users.get(book_id, ()):
+            counts.update(self.user_books[user_id].keys())
+        counts.pop(book_id, None)
+        return heapq.nsmallest(self.top_k, ((count, other) for other, count in counts.items()), key=_rank)
+
+    def recommend(self, user_id, limit=None):
+        """为读者推荐：汇总最近借过的图书的相关图书，排除已借过的，返回 [(得分, bookId)]"""
+        with self._lock:
+            books = dict(self.user_books.get(user_id, {}))
+        scores = {}
+        for book_id in list(books)[-self.history:]:
+            for count, other in self.related(book_id):
+                if other not in books:
+                    scores[other] = scores.get(other, 0) + count
+        return heapq.nsmallest(limit or self.top_k, ((score, other) for other, score in scores.items()), key=_rank)
+
+
+def _rank(entry):
+    # 次数多的在前，次数相同时 id 小的在前
+    return -entry[0], entry[1]
@@ -0,0 +1,529 @@
+"""
+图书馆管理系统 - 内存数据仓库
+
+每个集合（users / books / borrow_records）在进程内只加载一次，按 id 建立字典，
+之后所有接口都从内存读取；只有当磁盘文件的 mtime 或大小变化时才重新加载
+（SQLite 存储则比较每个集合的版本号）。
+
+启用日志模式（journal）时，每次提交只向日志追加一行变更，不再重写整个文件；
+日志超过阈值后压缩回快照文件，启动时在快照之上重放日志恢复数据。
+
+写操作放在 Repository.transaction() 中执行：事务按集合加锁（进程内线程锁 +
+数据目录下的文件锁），开始时同步其他进程写入的最新数据，正常结束时一次性提交，
+出错时回滚内存中的修改。
+
+搜索索引、统计等派生数据通过 Repository.subscribe() 注册为集合的监听器：
+集合整体（重新）加载时调用 listener.rebuild(items)，单条记录变化时调用
+listener.apply(old, new)（新增时 old 为 None，删除时 new 为 None）。
+每次变化还会使集合的 version 加一，响应缓存据此判断是否失效。
+
+创建仓库时可以为集合指定记录类型（models.py），写入内存的字典会先转换为该类型。
+"""
+from bisect import bisect_left, bisect_right, insort
+from contextlib import contextmanager
+from datetime import datetime
+import operator
+import os
+import threading
+
+from storage import FileLock
+
+# 日志超过该大小（字节）时压缩回快照文件
+COMPACT_THRESHOLD = 8 * 1024 * 1024
+
+DEFAULT_COLLECTIONS = ('users', 'books', 'borrow_records', 'holds')
+
+
+class Collection:
+    """单个数据集合的内存副本"""
+
+    def __init__(self, name, storage, model=None):
+        self.name = name
+        self.storage = storage
+        self.model = model
+        self.items = {}
+        self._max_id = 0
+        self._stamp = None
+        self._loaded = False
+        self._pending = []
+        self._undo = []
+        self._listeners = []
+        self._lock = threading.RLock()
+        self.version = 0
+
+    def subscribe(self, listener):
+        self._listeners.append(listener)
+        if self._loaded:
+            listener.rebuild(self.items.values())
+
+    def changed_on_disk(self):
+        return not self._loaded or self.storage.stamp(self.name) != self._stamp
+
+    def refresh(self):
+        """磁盘文件有变化时重新加载"""
+        if not self.changed_on_disk():
+            return
+        with self._lock:
+            if self.changed_on_disk():
+                self.load()
+
+    def load(self):
+        stamp = self.storage.stamp(self.name)
+        items = self.storage.load(self.name)
+        if self.model is not None:
+            # 逐条替换为记录对象，转换过的字典随即释放，加载时不会同时持有两份数据
+            for i, item in enumerate(items):
+                items[i] = self.model(item)
+        self._reset(items)
+        self._stamp = stamp
+        self._loaded = True
+        self._pending, self._undo = [], []
+
+    def _make(self, item):
+        return item if self.model is None else self.model.of(item)
+
+    def _reset(self, items):
+        if self.model is not None:
+            items = map(self.model.of, items)
+        self.items = {item['id']: item for item in items}
+        self._max_id = max(self.items, default=0)
+        self.version += 1
+        for listener in self._listeners:
+            listener.rebuild(self.items.values())
+
+    def _set(self, item_id, item):
+        """写入一条记录（item 为 None 时删除），通知监听器并返回旧值"""
+        old = self.items.get(item_id)
+        if item is None:
+            if old is None:
+                return None
+            del self.items[item_id]
+        else:
+            self.items[item_id] = item
+            self._max_id = max(self._max_id, item_id)
+        self.version += 1
+        for listener in self._listeners:
+            listener.apply(old, item)
+        return old
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, item_id):
+        return item_id in self.items
+
+    def all(self):
+        return self.items.values()
+
+    def get(self, item_id):
+        return self.items.get(item_id)
+
+    def next_id(self):
+        return self._max_id + 1
+
+    # 修改操作只作用于内存，提交后才写回磁盘。
+    # 记录对象视为只读：update 会生成新的记录替换旧值，
+    # 正在被其他请求读取的旧对象不会被就地修改。
+    def insert(self, item):
+        item = self._make(item)
+        self._undo.append((item['id'], self._set(item['id'], item)))
+        self._pending.append(['put', item])
+        return item
+
+    def update(self, item_id, changes):
+        old = self.items[item_id]
+        item = dict(old) if self.model is None else old.to_dict()
+        item.update(changes)
+        item = self._make(item)
+        self._undo.append((item_id, self._set(item_id, item)))
+        self._pending.append(['put', item])
+        return item
+
+    def delete(self, item_id):
+        item = self._set(item_id, None)
+        if item is not None:
+            self._undo.append((item_id, item))
+            self._pending.append(['delete', item_id])
+        return item
+
+    def replace(self, items):
+        self._undo.append((None, self.items))
+        self._reset(items)
+        self._pending.append(['replace', list(self.items.values())])
+
+    def apply(self, op, payload):
+        """重放一条日志变更"""
+        if op == 'put':
+            self._set(payload['id'], self._make(payload))
+        elif op == 'delete':
+            self._set(payload, None)
+        elif op == 'replace':
+            self._reset(payload)
+
+    def take_pending(self):
+        """取出尚未持久化的变更"""
+        pending, self._pending = self._pending, []
+        return pending
+
+    def rollback(self):
+        """撤销尚未提交成功的修改"""
+        for item_id, old in reversed(self._undo):
+            if item_id is None:
+                self._reset(old.values())
+            else:
+                self._set(item_id, old)
+        if self._undo:
+            self._max_id = max(self.items, default=0)
+        self._pending, self._undo = [], []
+
+
+class Index:
+    """集合的二级索引：键 -> 记录 id 集合
+
+    key 为字段名或从记录计算键的函数；指定 where 时只索引满足条件的记录。
+    """
+
+    _SKIP = object()
+
+    def __init__(self, key, where=None):
+        self.key = operator.itemgetter(key) if isinstance(key, str) else key
+        self.where = where
+        self._map = {}
+
+    def _key_of(self, item):
+        if item is None or (self.where is not None and not self.where(item)):
+            return self._SKIP
+        return self.key(item)
+
+    def rebuild(self, items):
+        mapping = {}
+        for item in items:
+            key = self._key_of(item)
+            if key is not self._SKIP:
+                mapping.setdefault(key, set()).add(item['id'])
+        self._map = mapping
+
+    def apply(self, old, new):
+        old_key, new_key = self._key_of(old), self._key_of(new)
+        if old_key == new_key and old_key is not self._SKIP:
+            return
+        if old_key is not self._SKIP:
+            ids = self._map.get(old_key)
+            if ids is not None:
+                ids.discard(old['id'])
+                if not ids:
+                    del self._map[old_key]
+        if new_key is not self._SKIP:
+            self._map.setdefault(new_key, set()).add(new['id'])
+
+    def get(self, key):
+        """键对应的记录 id（返回副本）"""
+        ids = self._map.get(key)
+        return set(ids) if ids else set()
+
+    def lookup(self, key):
+        """键对应的记录 id 集合本身（不复制）：只读，只用于计数和成员判断，不要修改或在写入时遍历"""
+        return self._map.get(key) or frozenset()
+
+    def intersect(self, key, ids):
+        """键对应的记录 id 与 ids 的交集，只遍历两者中较小的一个，不复制索引中的集合"""
+        mine = self._map.get(key)
+        if not mine or not ids:
+            return set()
+        if isinstance(ids, (set, frozenset)):
+            return mine & ids
+        return {item_id for item_id in ids if item_id in mine}
+
+    def first(self, key):
+        """键对应的任意一条记录 id，没有时返回 None"""
+        ids = self._map.get(key)
+        return next(iter(ids), None) if ids else None
+
+    def count(self, key):
+        ids = self._map.get(key)
+        return len(ids) if ids else 0
+
+    def counts(self, within=None):
+        """各键的记录数；指定 within（id 集合）时只统计其中的记录，结果中不含计数为 0 的键"""
+        entries = list(self._map.items())
+        if within is None:
+            return {key: len(ids) for key, ids in entries}
+        counts = {}
+        for key, ids in entries:
+            count = len(ids & within)
+            if count:
+                counts[key] = count
+        return counts
+
+
+class OrderedIndex:
+    """有序索引：记录按 (排序键, id) 排好序，可以从任意位置继续读取，用于游标分页
+
+    指定 group 时按分组分别排序，例如每个用户的借阅记录各自按借阅时间排序。
+    """
+
+    SCAN_CHUNK = 256
+
+    def __init__(self, sort_key, group=None):
+        self.sort_key = operator.itemgetter(sort_key) if isinstance(sort_key, str) else sort_key
+        self.group = operator.itemgetter(group) if isinstance(group, str) else group
+        self._lists = {}
+
+    def _place(self, item):
+        group = self.group(item) if self.group is not None else None
+        return group, (self.sort_key(item), item['id'])
+
+    def rebuild(self, items):
+        lists = {}
+        for item in items:
+            group, entry = self._place(item)
+            lists.setdefault(group, []).append(entry)
+        for entries in lists.values():
+            entries.sort()
+        self._lists = lists
+
+    def apply(self, old, new):
+        old_place = self._place(old) if old is not None else None
+        new_place = self._place(new) if new is not None else None
+        if old_place == new_place:
+            return
+        if old_place is not None:
+            group, entry = old_place
+            entries = self._lists.get(group, [])
+            i = bisect_left(entries, entry)
+            if i < len(entries) and entries[i] == entry:
+                del entries[i]
+        if new_place is not None:
+            group, entry = new_place
+            insort(self._lists.setdefault(group, []), entry)
+
+    def count(self, group=None):
+        return len(self._lists.get(group, ()))
+
+    def scan(self, group=None, after=None, offset=0, reverse=False):
+        """按顺序（reverse 时倒序）迭代 (排序键, id)。
+
+        after 为上一页最后一条的 (排序键, id)，从它之后继续；offset 为再跳过的条数。
+        """
+        entries = self._lists.get(group, [])
+        chunk_size = self.SCAN_CHUNK
+        offset = max(offset, 0)
+        # 每次只复制一小段，其他线程同时修改列表也不会出错
+        if reverse:
+            pos = len(entries) if after is None else bisect_left(entries, tuple(after))
+            pos -= offset
+            while pos > 0:
+                chunk = entries[max(pos - chunk_size, 0):pos]
+                if not chunk:
+                    return
+                yield from reversed(chunk)
+                pos -= len(chunk)
+        else:
+            pos = 0 if after is None else bisect_right(entries, tuple(after))
+            pos += offset
+            while True:
+                chunk = entries[pos:pos + chunk_size]
+                if not chunk:
+                    return
+                yield from chunk
+                pos += len(chunk)
+
+
+class Repository:
+    """进程级数据仓库"""
+
+    def __init__(self, storage, journal=None, compact_threshold=COMPACT_THRESHOLD, names=DEFAULT_COLLECTIONS,
+                 lock_dir=None, models=None):
+        self.storage = storage
+        self.models = models or {}
+        self.journal = journal
+        self.compact_threshold = compact_threshold
+        self.lock_dir = lock_dir
+        self._collections = {name: Collection(name, storage, self.models.get(name)) for name in names}
+        self._journal_key = None
+        self._journal_pos = 0
+        self._compact_due = False
+        self._lock = threading.RLock()
+        self._local = threading.local()
+
+    def _get(self, name):
+        coll = self._collections.get(name)
+        if coll is None:
+            with self._lock:
+                coll = self._collections.setdefault(name, Collection(name, self.storage, self.models.get(name)))
+        return coll
+
+    def collection(self, name):
+        """获取集合（按需创建，并检查磁盘是否有更新）"""
+        coll = self._get(name)
+        if self.journal is None:
+            coll.refresh()
+        else:
+            self._sync_journal(coll)
+        return coll
+
+    def subscribe(self, name, listener):
+        """注册集合的变更监听器（用于维护搜索索引、统计等派生数据）"""
+        self._get(name).subscribe(listener)
+
+    def create_index(self, name, key, where=None):
+        """为集合建立随数据增量维护的二级索引"""
+        index = Index(key, where)
+        self.subscribe(name, index)
+        return index
+
+    def create_ordered_index(self, name, sort_key, group=None):
+        """为集合建立按 sort_key 排序的有序索引"""
+        index = OrderedIndex(sort_key, group)
+        self.subscribe(name, index)
+        return index
+
+    @property
+    def users(self):
+        return self.collection('users')
+
+    @property
+    def books(self):
+        return self.collection('books')
+
+    @property
+    def borrow_records(self):
+        return self.collection('borrow_records')
+
+    @property
+    def holds(self):
+        return self.collection('holds')
+
+    # ==================== 事务 ====================
+    def _held(self):
+        """当前线程在事务中已锁定的集合"""
+        held = getattr(self._local, 'held', None)
+        if held is None:
+            held = self._local.held = set()
+        return held
+
+    @contextmanager
+    def transaction(self, *names):
+        """在事务中修改集合：按名称顺序加锁，结束时原子提交，异常时回滚"""
+        held = self._held()
+        names = sorted(set(names) - held)
+        colls = [self._get(name) for name in names]
+        thread_locks, file_locks = [], []
+        try:
+            for coll in colls:
+                coll._lock.acquire()
+                thread_locks.append(coll._lock)
+            if self.lock_dir is not None:
+                for name in names:
+                    lock = FileLock(os.path.join(self.lock_dir, f'.{name}.lock'))
+                    lock.acquire()
+                    file_locks.append(lock)
+            held.update(names)
+            # 持有锁之后再同步磁盘数据，保证读-改-写期间不会被其他进程修改
+            self.storage.recover()
+            for name in names:
+                self.collection(name)
+            try:
+                yield self
+                self.save(*names)
+            except BaseException:
+                for coll in colls:
+                    coll.rollback()
+                raise
+        finally:
+            held.difference_update(names)
+            for lock in reversed(file_locks):
+                lock.release()
+            for lock in reversed(thread_locks):
+                lock.release()
+        if self._compact_due and not held:
+            self.compact()
+
+    # ==================== 日志模式 ====================
+    def _sync_journal(self, coll):
+        """读取其他进程追加的日志；快照或日志文件被替换时整体重新加载"""
+        key, size = self.journal.state()
+        if key == self._journal_key and size == self._journal_pos and not coll.changed_on_disk():
+            return
+        with self._lock:
+            key, size = self.journal.state()
+            if key != self._journal_key or size < self._journal_pos or coll.changed_on_disk():
+                self._recover()
+            elif size > self._journal_pos:
+                entries, self._journal_pos = self.journal.read(self._journal_pos)
+                self._replay(entries)
+
+    def _recover(self):
+        """从快照加载所有集合，再按顺序重放日志"""
+        self._journal_key, _ = self.journal.state()
+        for coll in self._collections.values():
+            coll.load()
+        entries, self._journal_pos = self.journal.read(0)
+        self._replay(entries)
+
+    def _replay(self, entries):
+        for entry in entries:
+            for name, op, payload in entry['ops']:
+                coll = self._collections.get(name)
+                if coll is not None:
+                    coll.apply(op, payload)
+
+    def compact(self):
+        """把内存中的数据写回快照文件，并清空日志（锁定全部集合）"""
+        with self.transaction(*self._collections):
+            with self._lock:
+                for coll in self._collections.values():
+                    self._write_snapshot(coll)
+                if self.journal is not None:
+                    self.journal.reset()
+                    self._journal_key, self._journal_pos = self.journal.state()
+                self._compact_due = False
+
+    def _write_snapshot(self, coll):
+        self.storage.save(coll.name, list(coll.items.values()))
+        coll._stamp = self.storage.stamp(coll.name)
+
+    # ==================== 持久化 ====================
+    def flush(self):
+        """等待进行中的事务提交完毕，并完成待执行的日志压缩（进程退出前调用）"""
+        colls = [self._collections[name] for name in sorted(self._collections)]
+        for coll in colls:
+            coll._lock.acquire()
+        try:
+            if self._compact_due:
+                self.compact()
+        finally:
+            for coll in reversed(colls):
+                coll._lock.release()
+
+    def save(self, *names):
+        """持久化指定集合中尚未保存的变更（一次提交）"""
+        with self._lock:
+            colls = [self._collections[name] for name in names]
+            changes = [(coll, coll.take_pending()) for coll in colls]
+            changes = [(coll, pending) for coll, pending in changes if pending]
+            if changes:
+                try:
+                    self._commit(changes)
+                except BaseException:
+                    for coll in colls:
+                        coll.rollback()
+                    raise
+            for coll in colls:
+                coll._undo = []
+        if self._compact_due and not self._held():
+            self.compact()
+
+    def _commit(self, changes):
+        if self.journal is None:
+            self.storage.commit(changes)
+            for coll, _ in changes:
+                coll._stamp = self.storage.stamp(coll.name)
+            return
+        ops = [[coll.name, op, payload] for coll, pending in changes for op, payload in pending]
+        start, end = self.journal.append({'ts': datetime.now().isoformat(), 'ops': ops})
+        if start == self._journal_pos:
+            self._journal_key, _ = self.journal.state()
+            self._journal_pos = end
+        if end >= self.compact_threshold:
+            self._compact_due = True
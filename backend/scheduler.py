@@ -0,0 +1,131 @@
+"""
+图书馆管理系统 - 到期调度
+
+未归还的借阅按应还日期放入最小堆，到期的记录由 due() 取出，
+调用方在事务中把状态改为 overdue 并保存；同时按用户汇总逾期罚款。
+调度器作为 borrow_records 集合的监听器，随借阅/归还增量更新。
+"""
+import heapq
+import threading
+
+from models import due_at
+
+# 逾期罚款：每天 0.5 元
+FINE_PER_DAY = 0.5
+
+
+def compute_fine(due_date, now):
+    """截至 now 的逾期罚款"""
+    if now <= due_date:
+        return 0
+    return (now - due_date).days * FINE_PER_DAY
+
+
+class DueDateScheduler:
+    """借阅到期调度器"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._heap = []        # (应还日期, 记录id)，删除的条目在出堆时跳过
+        self._due = {}         # 状态为 borrowed 的记录id -> 应还日期
+        self._overdue = {}     # userId -> {记录id: 应还日期}，状态为 overdue 的记录
+        self._settled = {}     # userId -> 已归还记录上的罚款合计
+
+    # ==================== 索引维护 ====================
+    def rebuild(self, records):
+        with self._lock:
+            self._reset()
+            for record in records:
+                self._add(record)
+            heapq.heapify(self._heap)
+
+    def apply(self, old, new):
+        with self._lock:
+            if old is not None:
+                self._remove(old)
+            if new is not None:
+                self._add(new, push=True)
+
+    def _add(self, record, push=False):
+        status = record['status']
+        if status == 'borrowed':
+            due_date = due_at(record)
+            self._due[record['id']] = due_date
+            entry = (due_date, record['id'])
+            if push:
+                heapq.heappush(self._heap, entry)
+            else:
+                self._heap.append(entry)
+        elif status == 'overdue':
+            self._overdue.setdefault(record['userId'], {})[record['id']] = due_at(record)
+        elif record.get('fine'):
+            user_id = record['userId']
+            self._settled[user_id] = self._settled.get(user_id, 0) + record['fine']
+
+    def _remove(self, record):
+        status = record['status']
+        if status == 'borrowed':
+            # 堆中的条目留到出堆时再丢弃，失效条目过多时整体重建
+            self._due.pop(record['id'], None)
+            if len(self._heap) > 2 * len(self._due) + 64:
+                self._heap = [(due_date, record_id) for record_id, due_date in self._due.items()]
+                heapq.heapify(self._heap)
+        elif status == 'overdue':
+            loans = self._overdue.get(record['userId'], {})
+            loans.pop(record['id'], None)
+            if not loans:
+                self._overdue.pop(record['userId'], None)
+        elif record.get('fine'):
+            user_id = record['userId']
+            self._settled[user_id] = self._settled.get(user_id, 0) - record['fine']
+            if not self._settled[user_id]:
+                del self._settled[user_id]
+
+    def _discard_stale(self):
+        heap = self._heap
+        while heap and self._due.get(heap[0][1]) != heap[0][0]:
+            heapq.heappop(heap)
+
+    # ==================== 查询 ====================
+    def next_due(self):
+        """最早的应还日期，没有未到期的借阅时返回 None"""
+        with self._lock:
+            self._discard_stale()
+            return self._heap[0][0] if self._heap else None
+
+    def due(self, now):
+        """已过应还日期、仍为 borrowed 状态的记录id（按应还日期排序）"""
+        with self._lock:
+            self._discard_stale()
+            heap = self._heap
+            # 只遍历堆中早于 now 的部分，耗时与到期的记录数有关
+            found = []
+            stack = [0] if heap else []
+            while stack:
+                i = stack.pop()
+                due_date, record_id = heap[i]
+                if due_date >= now:
+                    continue
+                if self._due.get(record_id) == due_date:
+                    found.append(heap[i])
+                stack.extend(child for child in (2 * i + 1, 2 * i + 2) if child < len(heap))
+            found.sort()
+            return [record_id for _, record_id in found]
+
+    def user_fines(self, user_id, now):
+        """用户的罚款：accrued 为逾期未还的借阅截至 now 的罚款，settled 为已归还记录上的罚款"""
+        with self._lock:
+            loans = list(self._overdue.get(user_id, {}).values())
+            settled = self._settled.get(user_id, 0)
+        accrued = sum(compute_fine(due_date, now) for due_date in loans)
+        return {'userId': user_id, 'overdueCount': len(loans), 'accrued': accrued,
+                'settled': settled, 'total': accrued + settled}
+
+    def fines(self, now):
+        """所有有逾期或罚款记录的用户的罚款汇总"""
+        with self._lock:
+            user_ids = set(self._overdue) | set(self._settled)
+        return [self.user_fines(user_id, now) for user_id in sorted(user_ids)]
@@ -0,0 +1,114 @@
+"""
+图书馆管理系统 - 图书检索索引
+
+对书名、作者、出版社、简介建立字符级倒排索引（单字 + 相邻双字），
+中文书名不分词也能按任意片段匹配，例如“楼梦”可以找到“红楼梦”。
+索引作为 books 集合的监听器，随图书增删改增量更新。
+"""
+
+# 参与检索的字段及其在综合搜索（q=）中的权重
+SEARCH_FIELDS = {'title': 3, 'author': 2, 'publisher': 1, 'description': 1}
+
+
+def normalize(text):
+    return str(text or '').casefold()
+
+
+def ngrams(text):
+    """文本的所有单字和相邻双字"""
+    grams = set(text)
+    grams.update(text[i:i + 2] for i in range(len(text) - 1))
+    return grams
+
+
+class SearchIndex:
+    """图书倒排索引"""
+
+    def __init__(self, fields=SEARCH_FIELDS):
+        self.fields = dict(fields)
+        self._postings = {field: {} for field in self.fields}
+        self._texts = {field: {} for field in self.fields}
+
+    # ==================== 索引维护 ====================
+    def rebuild(self, items):
+        postings = {field: {} for field in self.fields}
+        texts = {field: {} for field in self.fields}
+        for item in items:
+            self._add(postings, texts, item)
+        # 整体替换，正在进行的查询仍使用旧索引
+        self._postings, self._texts = postings, texts
+
+    def apply(self, old, new):
+        if old is not None:
+            self._remove(old)
+        if new is not None:
+            self._add(self._postings, self._texts, new)
+
+    def _add(self, postings, texts, item):
+        for field in self.fields:
+            text = normalize(item.get(field))
+            texts[field][item['id']] = text
+            index = postings[field]
+            for gram in ngrams(text):
+                index.setdefault(gram, set()).add(item['id'])
+
+    def _remove(self, item):
+        for field in self.fields:
+            text = self._texts[field].pop(item['id'], '')
+            index = self._postings[field]
+            for gram in ngrams(text):
+                ids = index.get(gram)
+                if ids is not None:
+                    ids.discard(item['id'])
+                    if not ids:
+                        del index[gram]
+
+    # ==================== 查询 ====================
+    def candidates(self, field, text):
+        """可能包含 text 的图书 id（忽略大小写，结果需再校验）"""
+        text = normalize(text)
+        if not text:
+            return None
+        index = self._postings[field]
+        grams = [text] if len(text) == 1 else [text[i:i + 2] for i in range(len(text) - 1)]
+        postings = [index.get(gram) for gram in set(grams)]
+        if not all(postings):
+            return set()
+        postings.sort(key=len)
+        return postings[0].intersection(*postings[1:])
+
+    def match(self, field, text):
+        """字段中包含 text 的图书 id（忽略大小写）"""
+        ids = self.candidates(field, text)
+        if ids is None:
+            return None
+        text = normalize(text)
+        texts = self._texts[field]
+        return {book_id for book_id in ids if text in texts.get(book_id, '')}
+
+    def search(self, query, within=None):
+        """综合搜索：按空白切分关键词，每个关键词都需在某个字段中出现，按相关度排序返回 id 列表"""
+        terms = normalize(query).split()
+        scores = None
+        for term in terms:
+            term_scores = {}
+            for field, weight in self.fields.items():
+                texts = self._texts[field]
+                for book_id in self.candidates(field, term):
+                    text = texts.get(book_id, '')
+                    if term not in text:
+                        continue
+                    # 完全匹配、前缀匹配的字段得分更高
+                    score = weight * (3 if text == term else 2 if text.startswith(term) else 1)
+                    term_scores[book_id] = term_scores.get(book_id, 0) + score
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {book_id: score + term_scores[book_id] for book_id, score in scores.items() if book_id in term_scores}
+            if not scores:
+                break
+        if not scores:
+            return []
+        if within is not None:
+            scores = {book_id: score for book_id, score in scores.items() if book_id in within}
+        return sorted(scores, key=lambda book_id: (-scores[book_id], book_id))
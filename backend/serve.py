@@ -0,0 +1,109 @@
+"""
+图书馆管理系统 - 生产环境启动入口
+
+    python serve.py [--bind 0.0.0.0:5000] [--workers N] [--threads N]
+
+使用 gunicorn 以多进程（worker）+ 每个进程多线程（gthread）运行，参数也可以通过环境变量设置：
+LIBRARY_BIND、LIBRARY_WORKERS（默认 CPU 核数）、LIBRARY_THREADS（默认 8）、LIBRARY_GRACEFUL_TIMEOUT（秒，默认 30）。
+
+线程数：普通接口只占用线程几毫秒，而等待到书的长轮询（GET /api/holds/wait）在等待期间一直占用一个线程，
+最长 MAX_HOLD_WAIT（5 秒，见 app.py）。一个 worker 中同时等待的长轮询达到线程数时，其他请求要排队到有长轮询返回，
+因此 workers × threads 应大于同时打开预约页面的读者数再留出处理普通请求的余量；读者多时调大 LIBRARY_THREADS。
+
+主进程先导入应用并写入初始数据（init_data），再 fork 出各个 worker，worker 启动时不再重复初始化。
+各 worker 通过数据目录下的文件锁互斥写入（见 repository.py），不会互相覆盖。
+收到 SIGTERM / SIGINT 后停止接受新连接，等待进行中的请求处理完毕，再调用 repo.flush()
+等待未结束的事务提交并完成待执行的日志压缩，然后退出。
+
+未安装 gunicorn 时（例如 Windows）退回到 werkzeug 的多线程服务器（单进程，--workers 不起作用）。
+"""
+import argparse
+import os
+import signal
+import sys
+import threading
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:     # 未安装 gunicorn
+    BaseApplication = None
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_app():
+    """导入应用并写入初始数据，返回 app 模块"""
+    import app as app_module
+    app_module.init_data()
+    return app_module
+
+
+def flush_repository():
+    """退出前持久化未完成的写入"""
+    import app as app_module
+    app_module.repo.flush()
+
+
+def worker_exit(server, worker):
+    """gunicorn 钩子：worker 处理完进行中的请求、退出前调用"""
+    flush_repository()
+
+
+def run_gunicorn(options):
+    class Server(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            # preload_app：在主进程中执行一次，worker 由 fork 继承
+            return load_app().app
+
+    Server().run()
+
+
+def run_werkzeug(host, port):
+    from werkzeug.serving import make_server
+
+    app_module = load_app()
+    server = make_server(host, port, app_module.app, threaded=True)
+    # 在信号处理函数里不能直接调用 shutdown()（会等待 serve_forever 所在的当前线程）
+    signal.signal(signal.SIGTERM, lambda *args: threading.Thread(target=server.shutdown).start())
+    print(f'未安装 gunicorn，使用 werkzeug 多线程服务器：http://{host}:{port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        flush_repository()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='图书馆管理系统后端服务（生产环境）')
+    parser.add_argument('--bind', default=os.environ.get('LIBRARY_BIND', '0.0.0.0:5000'), help='监听地址')
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('LIBRARY_WORKERS', os.cpu_count() or 1)),
+                        help='worker 进程数')
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('LIBRARY_THREADS', 8)),
+                        help='每个 worker 的线程数')
+    parser.add_argument('--graceful-timeout', type=int, default=int(os.environ.get('LIBRARY_GRACEFUL_TIMEOUT', 30)),
+                        help='退出时等待进行中请求的最长时间（秒）')
+    args = parser.parse_args(argv)
+
+    if BaseApplication is None:
+        host, _, port = args.bind.rpartition(':')
+        run_werkzeug(host or '0.0.0.0', int(port))
+        return
+    run_gunicorn({
+        'bind': args.bind,
+        'workers': args.workers,
+        'threads': args.threads,
+        'worker_class': 'gthread',
+        'preload_app': True,
+        'graceful_timeout': args.graceful_timeout,
+        'worker_exit': worker_exit,
+    })
+
+
+if __name__ == '__main__':
+    main()
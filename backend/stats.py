@@ -0,0 +1,394 @@
+"""
+图书馆管理系统 - 借阅统计
+
+统计计数器随借阅/归还事件增量维护，只在集合（重新）加载时从历史记录整体重建，
+/api/statistics 直接读取计数器，不再每次遍历全部借阅记录。
+
+BorrowTimeline 按天维护借阅次数（全部、按分类、按用户），任意日期区间按天/周/月汇总时
+用前缀和求每个区间的次数，耗时只与区间个数有关，与历史记录的数量无关。
+"""
+from bisect import bisect_left, insort
+from datetime import date, timedelta
+from itertools import accumulate
+import heapq
+import threading
+
+from models import due_at
+
+
+class _Listener:
+    """把集合变更转发给统计引擎的对应方法"""
+
+    def __init__(self, rebuild, apply):
+        self.rebuild = rebuild
+        self.apply = apply
+
+
+class StatisticsEngine:
+    """借阅统计引擎"""
+
+    def __init__(self, ranking_size=10):
+        self.ranking_size = ranking_size
+        self._lock = threading.Lock()
+        self._book_category = {}
+        self._book_title = {}          # bookId -> 图书当前的书名
+        self._reset_counters()
+
+    def _reset_counters(self):
+        self.book_counts = {}          # bookId -> 借阅次数
+        self.book_titles = {}          # bookId -> 最近一次借阅记录中的书名（图书已删除时使用）
+        self.month_counts = {}         # 'YYYY-MM' -> 借阅次数
+        self.category_counts = {}      # 分类 -> 借阅次数
+        self.current_borrowed = 0      # 未归还的借阅数
+        self.overdue_records = 0       # 已标记为 overdue 的借阅数
+        self._open_due = []            # 状态为 borrowed 的 (应还日期, 记录id)，按日期排序
+        self._ranking = None
+
+    def attach(self, repo):
+        repo.subscribe('books', _Listener(self.rebuild_books, self.apply_book))
+        repo.subscribe('borrow_records', _Listener(self.rebuild_records, self.apply_record))
+
+    # ==================== 借阅记录 ====================
+    def rebuild_records(self, records):
+        with self._lock:
+            self._reset_counters()
+            for record in records:
+                self._add_record(record, sort=False)
+            self._open_due.sort()
+            self._rebuild_categories()
+
+    def apply_record(self, old, new):
+        with self._lock:
+            if old is not None:
+                self._remove_record(old)
+            if new is not None:
+                self._add_record(new)
+
+    def _add_record(self, record, sort=True):
+        book_id = record['bookId']
+        self.book_counts[book_id] = self.book_counts.get(book_id, 0) + 1
+        self.book_titles[book_id] = record['bookTitle']
+        _increment(self.month_counts, record['borrowDate'][:7], 1)
+        if book_id in self._book_category:
+            _increment(self.category_counts, self._book_category[book_id], 1)
+        if record['status'] != 'returned':
+            self.current_borrowed += 1
+        if record['status'] == 'overdue':
+            self.overdue_records += 1
+        if record['status'] == 'borrowed':
+            entry = (due_at(record), record['id'])
+            if sort:
+                insort(self._open_due, entry)
+            else:
+                self._open_due.append(entry)
+        self._ranking = None
+
+    def _remove_record(self, record):
+        book_id = record['bookId']
+        _increment(self.book_counts, book_id, -1)
+        _increment(self.month_counts, record['borrowDate'][:7], -1)
+        if book_id in self._book_category:
+            _increment(self.category_counts, self._book_category[book_id], -1)
+        if record['status'] != 'returned':
+            self.current_borrowed -= 1
+        if record['status'] == 'overdue':
+            self.overdue_records -= 1
+        if record['status'] == 'borrowed':
+            entry = (due_at(record), record['id'])
+            i = bisect_left(self._open_due, entry)
+            if i < len(self._open_due) and self._open_due[i] == entry:
+                del self._open_due[i]
+        self._ranking = None
+
+    # ==================== 图书（分类） ====================
+    def rebuild_books(self, books):
+        with self._lock:
+            self._book_category = {b['id']: b['category'] for b in books}
+            self._book_title = {b['id']: b['title'] for b in books}
+            self._rebuild_categories()
+            self._ranking = None
+
+    def apply_book(self, old, new):
+        with self._lock:
+            # 排行按 bookId 计数，书名取图书当前的书名，改名后不会拆成两条
+            book_id = (new or old)['id']
+            if new is not None:
+                self._book_title[book_id] = new['title']
+            else:
+                self._book_title.pop(book_id, None)
+            if old is None or new is None or old['title'] != new['title']:
+                self._ranking = None
+            old_category = old['category'] if old is not None else None
+            new_category = new['category'] if new is not None else None
+            if old is not None and new is not None and old_category == new_category:
+                return
+            count = self.book_counts.get(book_id, 0)
+            if old is not None:
+                self._book_category.pop(book_id, None)
+                _increment(self.category_counts, old_category, -count)
+            if new is not None:
+                self._book_category[book_id] = new_category
+                _increment(self.category_counts, new_category, count)
+
+    def _rebuild_categories(self):
+        counts = {}
+        for book_id, count in self.book_counts.items():
+            if book_id in self._book_category:
+                _increment(counts, self._book_category[book_id], count)
+        self.category_counts = counts
+
+    # ==================== 查询 ====================
+    def overdue_count(self, now):
+        # 已标记逾期的记录，加上已过应还日期但尚未标记的记录
+        return self.overdue_records + bisect_left(self._open_due, (now,))
+
+    def book_ranking(self):
+        ranking = self._ranking
+        if ranking is None:
+            top = heapq.nlargest(self.ranking_size, self.book_counts.items(), key=lambda kv: kv[1])
+            titles = self._book_title
+            ranking = self._ranking = [{'title': titles.get(book_id) or self.book_titles[book_id], 'count': count}
+                                       for book_id, count in top]
+        return ranking
+
+    def monthly_stats(self, now, months=6):
+        # 按自然月倒推（不能用 30 天近似，否则会跳过或重复某些月份）
+        stats = []
+        current = now.year * 12 + now.month - 1
+        for i in range(months - 1, -1, -1):
+            year, month = divmod(current - i, 12)
+            key = f'{year}-{month + 1:02d}'
+            stats.append({'month': key, 'count': self.month_counts.get(key, 0)})
+        return stats
+
+    def summary(self, now, total_borrows):
+        with self._lock:
+            return {
+                'totalBorrows': total_borrows,
+                'currentBorrowed': self.current_borrowed,
+                'overdueCount': self.overdue_count(now),
+                'bookRanking': self.book_ranking(),
+                'monthlyStats': self.monthly_stats(now),
+                'categoryStats': dict(self.category_counts),
+            }
+
+
+# ==================== 时间序列 ====================
+GRANULARITIES = ('day', 'week', 'month')
+
+
+class DailyCounts:
+    """按天计数：counts[i] 为第 start + i 天（date.toordinal()）的次数，区间求和使用前缀和"""
+
+    def __init__(self, day_counts=None):
+        self.start = None
+        self.counts = []
+        self._prefix = None
+        if day_counts:
+            # 由 {天: 次数} 一次性生成
+            self.start = min(day_counts)
+            self.counts = [0] * (max(day_counts) - self.start + 1)
+            for day, count in day_counts.items():
+                self.counts[day - self.start] = count
+
+    def add(self, day, delta):
+        if self.start is None:
+            self.start = day
+        elif day < self.start:
+            self.counts[:0] = [0] * (self.start - day)
+            self.start = day
+        i = day - self.start
+        if i >= len(self.counts):
+            self.counts.extend([0] * (i + 1 - len(self.counts)))
+        self.counts[i] += delta
+        self._prefix = None
+
+    def prefix(self):
+        """前缀和：prefix[i] 为前 i 天的合计，数据变化后第一次查询时重新计算"""
+        prefix = self._prefix
+        if prefix is None:
+            prefix = self._prefix = [0, *accumulate(self.counts)]
+        return prefix
+
+    def total(self, prefix, first, last):
+        """[first, last) 天内的合计"""
+        if self.start is None:
+            return 0
+        size = len(prefix) - 1
+        return prefix[min(max(last - self.start, 0), size)] - prefix[min(max(first - self.start, 0), size)]
+
+
+def buckets(first, last, granularity):
+    """把 [first, last] 日期区间按天/周（周一开始）/自然月切分，生成 (名称, 起始日, 结束日后一天)"""
+    start = first
+    while start <= last:
+        if granularity == 'day':
+            end = start + timedelta(days=1)
+            label = start.isoformat()
+        elif granularity == 'week':
+            week_start = start - timedelta(days=start.weekday())
+            end = week_start + timedelta(days=7)
+            year, week, _ = week_start.isocalendar()
+            label = f'{year}-W{week:02d}'
+        else:
+            end = date(start.year + start.month // 12, start.month % 12 + 1, 1)
+            label = f'{start.year}-{start.month:02d}'
+        end = min(end, last + timedelta(days=1))
+        yield label, start, end
+        start = end
+
+
+class BorrowTimeline:
+    """借阅次数的时间序列（按借阅日期），随借阅记录、图书分类的变化增量维护"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._book_category = {}
+        self._reset()
+
+    def _reset(self):
+        self.all = DailyCounts()
+        self.by_category = {}       # 分类 -> DailyCounts
+        self.by_user = {}           # userId -> 按日期排序的 (日, bookId)
+        self.by_book = {}           # bookId -> 借阅日列表（图书改分类时在分类之间移动）
+
+    def attach(self, repo):
+        repo.subscribe('books', _Listener(self.rebuild_books, self.apply_book))
+        repo.subscribe('borrow_records', _Listener(self.rebuild_records, self.apply_record))
+
+    @staticmethod
+    def _day(record):
+        return date.fromisoformat(record['borrowDate'][:10]).toordinal()
+
+    # ==================== 借阅记录 ====================
+    def rebuild_records(self, records):
+        with self._lock:
+            self._reset()
+            days = {}
+            by_user, by_book = self.by_user, self.by_book
+            for record in records:
+                text = record['borrowDate'][:10]
+                day = days.get(text)
+                if day is None:
+                    day = days[text] = date.fromisoformat(text).toordinal()
+                book_id = record['bookId']
+                user_entries = by_user.get(record['userId'])
+                if user_entries is None:
+                    user_entries = by_user[record['userId']] = []
+                user_entries.append((day, book_id))
+                book_days = by_book.get(book_id)
+                if book_days is None:
+                    book_days = by_book[book_id] = []
+                book_days.append(day)
+            for entries in by_user.values():
+                entries.sort()
+            self._rebuild_counts()
+
+    def _rebuild_counts(self):
+        """由 by_book 重新生成全部及各分类的按天计数"""
+        total, by_category = {}, {}
+        for book_id, book_days in self.by_book.items():
+            category = self._book_category.get(book_id)
+            counts = by_category.setdefault(category, {}) if category else None
+            for day in book_days:
+                total[day] = total.get(day, 0) + 1
+                if counts is not None:
+                    counts[day] = counts.get(day, 0) + 1
+        self.all = DailyCounts(total)
+        self.by_category = {category: DailyCounts(counts) for category, counts in by_category.items()}
+
+    def apply_record(self, old, new):
+        # 只有借阅日期、用户、图书影响时间序列，状态变化（归还、逾期）不需要处理
+        if old is not None and new is not None and \
+                (old['borrowDate'], old['userId'], old['bookId']) == (new['borrowDate'], new['userId'], new['bookId']):
+            return
+        with self._lock:
+            if old is not None:
+                self._remove(old, self._day(old))
+            if new is not None:
+                self._add(new, self._day(new))
+
+    def _add(self, record, day):
+        book_id = record['bookId']
+        self.all.add(day, 1)
+        category = self._book_category.get(book_id)
+        if category:
+            self._category_counts(category).add(day, 1)
+        insort(self.by_user.setdefault(record['userId'], []), (day, book_id))
+        self.by_book.setdefault(book_id, []).append(day)
+
+    def _remove(self, record, day):
+        book_id = record['bookId']
+        self.all.add(day, -1)
+        category = self._book_category.get(book_id)
+        if category:
+            self._category_counts(category).add(day, -1)
+        entries = self.by_user.get(record['userId'], [])
+        i = bisect_left(entries, (day, book_id))
+        if i < len(entries) and entries[i] == (day, book_id):
+            del entries[i]
+        days = self.by_book.get(book_id, [])
+        if day in days:
+            days.remove(day)
+
+    def _category_counts(self, category):
+        counts = self.by_category.get(category)
+        if counts is None:
+            counts = self.by_category[category] = DailyCounts()
+        return counts
+
+    # ==================== 图书（分类） ====================
+    def rebuild_books(self, books):
+        with self._lock:
+            self._book_category = {b['id']: b.get('category') for b in books}
+            self._rebuild_counts()
+
+    def apply_book(self, old, new):
+        with self._lock:
+            book_id = (new or old)['id']
+            old_category = self._book_category.pop(book_id, None)
+            new_category = new.get('category') if new is not None else None
+            if new is not None:
+                self._book_category[book_id] = new_category
+            if old_category == new_category:
+                return
+            for day in self.by_book.get(book_id, ()):
+                if old_category:
+                    self._category_counts(old_category).add(day, -1)
+                if new_category:
+                    self._category_counts(new_category).add(day, 1)
+
+    # ==================== 查询 ====================
+    def series(self, first, last, granularity='day', category=None, user_id=None):
+        """[first, last] 日期区间内每个时间段的借阅次数，返回 [{'period', 'start', 'count'}]"""
+        with self._lock:
+            if user_id is not None:
+                count = self._user_counter(user_id, category)
+            else:
+                counts = self.by_category.get(category, DailyCounts()) if category else self.all
+                prefix = counts.prefix()
+
+                def count(start, end):
+                    return counts.total(prefix, start, end)
+            return [{'period': label, 'start': start.isoformat(), 'count': count(start.toordinal(), end.toordinal())}
+                    for label, start, end in buckets(first, last, granularity)]
+
+    def _user_counter(self, user_id, category):
+        entries = self.by_user.get(user_id, [])
+        if not category:
+            # 按日期排序，二分查找区间两端即得次数
+            return lambda start, end: bisect_left(entries, (end,)) - bisect_left(entries, (start,))
+        book_category = self._book_category
+
+        def count(start, end):
+            return sum(1 for _, book_id in entries[bisect_left(entries, (start,)):bisect_left(entries, (end,))]
+                       if book_category.get(book_id) == category)
+        return count
+
+
+def _increment(counter, key, delta):
+    value = counter.get(key, 0) + delta
+    if value:
+        counter[key] = value
+    else:
+        counter.pop(key, None)
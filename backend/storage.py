@@ -0,0 +1,416 @@
+"""
+图书馆管理系统 - 数据存储后端
+
+各存储都可以设置 observer 回调统计读写开销：每次读取、解析、序列化、写入时调用
+observer(操作, 集合, 耗时秒数, 字节数, 记录数)。
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from models import json_default, plain
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    """跨进程的排他文件锁，多个 worker 进程共用同一个数据目录时使用"""
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    def acquire(self):
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            else:
+                while True:
+                    try:
+                        msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        time.sleep(0.01)
+        except BaseException:
+            os.close(fd)
+            raise
+        self._fd = fd
+
+    def release(self):
+        fd, self._fd = self._fd, None
+        if fd is None:
+            return
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        else:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        os.close(fd)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class Observed:
+    """支持 observer 回调的存储基类"""
+
+    observer = None
+
+    def _observe(self, op, name, start, nbytes=0, records=0):
+        if self.observer is not None:
+            self.observer(op, name, time.perf_counter() - start, nbytes, records)
+
+
+def write_temp_file(path, data):
+    """写入 path.tmp 并落盘，返回临时文件路径"""
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    return tmp
+
+
+def write_file_atomic(path, data):
+    """先写临时文件，再用 os.replace 原子替换目标文件"""
+    os.replace(write_temp_file(path, data), path)
+
+
+# JSON 数据文件格式：
+#   pretty   缩进排版，便于阅读和手工修改（默认）
+#   compact  去掉空白的紧凑 JSON，序列化快约 2.5 倍
+#   columnar 按列存储：每个字段一个数组，重复较多的字符串字段（书名、姓名、状态等）
+#            存为字符串表 + 编号；文件约小一半，读入后相同的字符串共用同一个对象
+# 读取时自动识别文件格式，与配置不同的文件会在压缩或下次写入时转换。
+JSON_FORMATS = ('pretty', 'compact', 'columnar')
+
+
+def encode_columnar(items):
+    columns = {}
+    for item in items:
+        for key in item:
+            columns.setdefault(key, None)
+    count = len(items)
+    encoded = {}
+    for key in columns:
+        values = [item.get(key) for item in items]
+        column = {}
+        absent = [i for i, item in enumerate(items) if key not in item]
+        if absent:
+            column['absent'] = absent
+        table = {}
+        if all(type(value) is str for value in values):
+            for value in values:
+                table.setdefault(value, len(table))
+        if table and len(table) * 4 <= count:
+            column['strings'] = list(table)
+            column['codes'] = [table[value] for value in values]
+        else:
+            column['values'] = values
+        encoded[key] = column
+    return {'format': 'columnar', 'count': count, 'columns': encoded}
+
+
+def decode_columnar(data):
+    names, arrays = [], []
+    for name, column in data['columns'].items():
+        if 'strings' in column:
+            strings = column['strings']
+            values = [strings[code] for code in column['codes']]
+        else:
+            values = column['values']
+        names.append(name)
+        arrays.append(values)
+    items = [dict(zip(names, row)) for row in zip(*arrays)] if names else [{} for _ in range(data['count'])]
+    for name, column in data['columns'].items():
+        for i in column.get('absent', ()):
+            del items[i][name]
+    return items
+
+
+class JsonStorage(Observed):
+    """JSON 文件存储：每个集合对应数据目录下的一个 .json 文件（格式见 JSON_FORMATS）"""
+
+    def __init__(self, data_dir, fmt='pretty'):
+        if fmt not in JSON_FORMATS:
+            raise ValueError(f'unknown data format: {fmt}')
+        self.data_dir = data_dir
+        self.fmt = fmt
+        self.intent_path = os.path.join(data_dir, 'commit.intent')
+        self.commit_lock_path = os.path.join(data_dir, '.commit.lock')
+        self.recover()
+
+    def path(self, name):
+        return os.path.join(self.data_dir, name + '.json')
+
+    def stamp(self, name):
+        """文件的 (mtime, size)，用于判断磁盘上的数据是否被修改"""
+        try:
+            st = os.stat(self.path(name))
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def load(self, name):
+        filepath = self.path(name)
+        if not os.path.exists(filepath):
+            return []
+        start = time.perf_counter()
+        with open(filepath, 'rb') as f:
+            data = f.read()
+        self._observe('read', name, start, len(data))
+        start = time.perf_counter()
+        items = json.loads(data.decode('utf-8'))
+        if isinstance(items, dict):
+            items = decode_columnar(items)
+        self._observe('parse', name, start, len(data), len(items))
+        return items
+
+    def file_format(self, name):
+        """数据文件的格式；文件不存在或为空列表时返回 None"""
+        try:
+            with open(self.path(name), 'rb') as f:
+                head = f.read(2)
+        except FileNotFoundError:
+            return None
+        if head.startswith(b'{'):
+            return 'columnar'
+        if head == b'[\n':
+            return 'pretty'
+        return 'compact' if head and head != b'[]' else None
+
+    def _serialize(self, name, items):
+        start = time.perf_counter()
+        # 先统一转为字典，编码时不必为每条记录回调 default
+        items = [plain(item) for item in items]
+        if self.fmt == 'columnar':
+            data = json.dumps(encode_columnar(items), ensure_ascii=False, separators=(',', ':'))
+        elif self.fmt == 'compact':
+            data = json.dumps(items, ensure_ascii=False, separators=(',', ':'))
+        else:
+            data = json.dumps(items, ensure_ascii=False, indent=2)
+        data = data.encode('utf-8')
+        self._observe('serialize', name, start, len(data), len(items))
+        return data
+
+    def save(self, name, items):
+        data = self._serialize(name, items)
+        start = time.perf_counter()
+        write_file_atomic(self.path(name), data)
+        self._observe('write', name, start, len(data), len(items))
+
+    def commit(self, changes):
+        """提交变更：JSON 文件没有记录级写入，重写有变更的集合。
+
+        涉及多个文件时，先把所有临时文件落盘，再写入提交意图，最后逐个替换；
+        替换过程中崩溃的话，下次 recover() 会按提交意图继续完成。
+        """
+        if len(changes) == 1:
+            coll, _ = changes[0]
+            self.save(coll.name, list(coll.items.values()))
+            return
+        renames = []
+        for coll, _ in changes:
+            target = self.path(coll.name)
+            data = self._serialize(coll.name, list(coll.items.values()))
+            start = time.perf_counter()
+            tmp = write_temp_file(target, data)
+            self._observe('write', coll.name, start, len(data), len(coll.items))
+            renames.append([os.path.basename(tmp), os.path.basename(target)])
+        with FileLock(self.commit_lock_path):
+            write_file_atomic(self.intent_path, json.dumps(renames).encode('utf-8'))
+            self._apply_intent()
+
+    def recover(self):
+        """完成上次中断的多文件提交"""
+        if not os.path.exists(self.intent_path):
+            return
+        with FileLock(self.commit_lock_path):
+            self._apply_intent()
+
+    def _apply_intent(self):
+        try:
+            with open(self.intent_path, 'r', encoding='utf-8') as f:
+                renames = json.load(f)
+        except FileNotFoundError:
+            return
+        for tmp, target in renames:
+            tmp = os.path.join(self.data_dir, tmp)
+            if os.path.exists(tmp):
+                os.replace(tmp, os.path.join(self.data_dir, target))
+        os.remove(self.intent_path)
+
+
+class Journal(Observed):
+    """追加写日志：每次提交的变更作为一行 JSON 追加到文件末尾"""
+
+    def __init__(self, path, fsync=False):
+        self.path = path
+        self.fsync = fsync
+
+    def state(self):
+        """返回 (文件标识, 大小)；压缩会生成新文件，文件标识随之变化"""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None, 0
+        return (st.st_ino, st.st_dev), st.st_size
+
+    def read(self, pos=0):
+        """从 pos 开始读取完整的日志行，返回 (entries, 读到的位置)"""
+        start = time.perf_counter()
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(pos)
+                data = f.read()
+        except FileNotFoundError:
+            return [], 0
+        end = data.rfind(b'\n') + 1
+        entries = [json.loads(line) for line in data[:end].splitlines() if line.strip()]
+        self._observe('journal_read', 'journal', start, end, len(entries))
+        return entries, pos + end
+
+    def append(self, entry):
+        """追加一行，返回该行在文件中的 (起始位置, 结束位置)"""
+        start = time.perf_counter()
+        line = (json.dumps(entry, ensure_ascii=False, separators=(',', ':'), default=json_default) + '\n').encode('utf-8')
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+            if self.fsync:
+                os.fsync(fd)
+            end = os.lseek(fd, 0, os.SEEK_CUR)
+        finally:
+            os.close(fd)
+        self._observe('journal_append', 'journal', start, len(line), len(entry.get('ops', ())))
+        return end - len(line), end
+
+    def reset(self):
+        """用空文件替换日志（压缩完成后调用）"""
+        write_file_atomic(self.path, b'')
+
+
+# SQLite 表结构：与 JSON 数据模型的字段一一对应，未列出的字段存入 extra 列（JSON）。
+# 列不声明类型，SQLite 原样保存整数/浮点数/字符串，读出后与 JSON 中的值一致。
+SQLITE_SCHEMAS = {
+    'users': ['username', 'password', 'role', 'name', 'email', 'phone', 'createTime'],
+    'books': ['isbn', 'title', 'author', 'publisher', 'category', 'price', 'stock', 'total', 'publishDate', 'description'],
+    'borrow_records': ['userId', 'bookId', 'userName', 'bookTitle', 'borrowDate', 'dueDate', 'returnDate', 'status', 'fine'],
+    'holds': ['userId', 'bookId', 'userName', 'bookTitle', 'createTime', 'status', 'readyAt', 'expiresAt'],
+}
+
+SQLITE_INDEXES = [
+    'CREATE INDEX IF NOT EXISTS idx_books_isbn ON books (isbn)',
+    'CREATE INDEX IF NOT EXISTS idx_users_username ON users (username)',
+    'CREATE INDEX IF NOT EXISTS idx_borrow_records_user_status ON borrow_records (userId, status)',
+    'CREATE INDEX IF NOT EXISTS idx_holds_book_status ON holds (bookId, status)',
+]
+
+
+class SqliteStorage(Observed):
+    """SQLite 存储：按记录写入，一次提交的所有变更在同一个事务中完成"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._tables = set()
+        db = self._db()
+        db.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, version INTEGER NOT NULL)')
+        for name in SQLITE_SCHEMAS:
+            self._ensure_table(name)
+        for sql in SQLITE_INDEXES:
+            db.execute(sql)
+        db.commit()
+
+    def _db(self):
+        # sqlite3 连接不能跨线程共享，每个线程各用一个；
+        # 也不能跨进程使用，fork 出的 worker 进程（gunicorn 预加载）重新打开连接
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=30)
+            db.execute('PRAGMA journal_mode=WAL')
+            self._local.db, self._local.pid = db, os.getpid()
+        return db
+
+    def _columns(self, name):
+        return SQLITE_SCHEMAS.get(name, [])
+
+    def _ensure_table(self, name):
+        if name in self._tables:
+            return
+        if not name.isidentifier():
+            raise ValueError(f'非法的集合名: {name}')
+        columns = ''.join(f', "{col}"' for col in self._columns(name))
+        self._db().execute(f'CREATE TABLE IF NOT EXISTS "{name}" (id INTEGER PRIMARY KEY{columns}, extra TEXT)')
+        self._tables.add(name)
+
+    def _to_row(self, name, item):
+        columns = self._columns(name)
+        extra = {k: v for k, v in item.items() if k != 'id' and (k not in columns or isinstance(v, (dict, list)))}
+        row = [item['id']]
+        row.extend(None if col in extra else item.get(col) for col in columns)
+        row.append(json.dumps(extra, ensure_ascii=False) if extra else None)
+        return row
+
+    def _to_item(self, name, row):
+        columns = self._columns(name)
+        item = {'id': row[0]}
+        item.update(zip(columns, row[1:-1]))
+        if row[-1]:
+            item.update(json.loads(row[-1]))
+        return item
+
+    def recover(self):
+        """SQLite 自身保证事务原子性，无需恢复"""
+
+    def stamp(self, name):
+        """集合的版本号，每次提交递增"""
+        row = self._db().execute('SELECT version FROM meta WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else None
+
+    def load(self, name):
+        start = time.perf_counter()
+        self._ensure_table(name)
+        rows = self._db().execute(f'SELECT * FROM "{name}" ORDER BY id')
+        items = [self._to_item(name, row) for row in rows]
+        self._observe('load', name, start, 0, len(items))
+        return items
+
+    def save(self, name, items):
+        self._write([(name, [['replace', items]])])
+
+    def commit(self, changes):
+        self._write([(coll.name, pending) for coll, pending in changes])
+
+    def _write(self, changes):
+        db = self._db()
+        with db:
+            for name, pending in changes:
+                start = time.perf_counter()
+                self._ensure_table(name)
+                placeholders = ', '.join('?' * (len(self._columns(name)) + 2))
+                upsert = f'INSERT OR REPLACE INTO "{name}" VALUES ({placeholders})'
+                for op, payload in pending:
+                    if op == 'put':
+                        db.execute(upsert, self._to_row(name, payload))
+                    elif op == 'delete':
+                        db.execute(f'DELETE FROM "{name}" WHERE id = ?', (payload,))
+                    elif op == 'replace':
+                        db.execute(f'DELETE FROM "{name}"')
+                        db.executemany(upsert, (self._to_row(name, item) for item in payload))
+                db.execute('INSERT INTO meta (name, version) VALUES (?, 1) '
+                           'ON CONFLICT(name) DO UPDATE SET version = version + 1', (name,))
+                records = sum(len(payload) if op == 'replace' else 1 for op, payload in pending)
+                self._observe('write', name, start, 0, records)
+
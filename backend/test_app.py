@@ -2,12 +2,18 @@
 图书馆管理系统 - 单元测试
 """
 import unittest
+import gzip
 import json
 import os
 import sys
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from unittest.mock import patch
 sys.path.insert(0, os.path.dirname(__file__))
 
-from app import app, init_data, load_data, save_data, hash_password, DATA_DIR
+from app import app, expire_holds, init_data, load_data, save_data, hash_password, get_next_id, repo, token_signer, DATA_DIR
 
 class TestLibrarySystem(unittest.TestCase):
     """图书馆管理系统测试类"""
@@ -19,11 +25,14 @@ class TestLibrarySystem(unittest.TestCase):
         cls.client = app.test_client()
         # 备份原有数据
         cls.backup_files = {}
-        for filename in ['users.json', 'books.json', 'borrow_records.json']:
+        for filename in ['users.json', 'books.json', 'borrow_records.json', 'holds.json']:
             filepath = os.path.join(DATA_DIR, filename)
             if os.path.exists(filepath):
                 with open(filepath, 'r', encoding='utf-8') as f:
                     cls.backup_files[filename] = f.read()
+            else:
+                # 测试前不存在的文件在测试后删除
+                cls.backup_files[filename] = None
         init_data()
     
     @classmethod
@@ -31,6 +40,10 @@ class TestLibrarySystem(unittest.TestCase):
         """测试后恢复数据"""
         for filename, content in cls.backup_files.items():
             filepath = os.path.join(DATA_DIR, filename)
+            if content is None:
+                if os.path.exists(filepath):
+                    os.remove(filepath)
+                continue
             with open(filepath, 'w', encoding='utf-8') as f:
                 f.write(content)
     
@@ -83,6 +96,42 @@ class TestLibrarySystem(unittest.TestCase):
         self.assertEqual(data['code'], 200)
         self.assertIn('注册成功', data['message'])
     
+    def test_legacy_password_upgraded_on_login(self):
+        """TC-060: 旧版哈希的用户登录成功后升级为加盐哈希"""
+        users = load_data('users.json')
+        users.append({'id': get_next_id(users), 'username': 'legacy_user', 'password': hash_password('old123'),
+                      'role': 'user', 'name': '', 'email': '', 'phone': ''})
+        save_data('users.json', users)
+        response = self.client.post('/api/auth/login', json={'username': 'legacy_user', 'password': 'old123'})
+        self.assertEqual(json.loads(response.data)['code'], 200)
+        user = next(u for u in load_data('users.json') if u['username'] == 'legacy_user')
+        self.assertTrue(user['password'].startswith('pbkdf2_sha256$'))
+        response = self.client.post('/api/auth/login', json={'username': 'legacy_user', 'password': 'old123'})
+        self.assertEqual(json.loads(response.data)['code'], 200)
+        save_data('users.json', [u for u in load_data('users.json') if u['username'] != 'legacy_user'])
+
+    def test_login_token(self):
+        """TC-063: 登录返回令牌，普通用户凭令牌只能为自己借书，注销后令牌失效"""
+        self.client.post('/api/auth/register', json={'username': 'token_user', 'password': 'pw123456', 'name': '令牌用户'})
+        data = json.loads(self.client.post('/api/auth/login', json={'username': 'token_user', 'password': 'pw123456'}).data)
+        headers = {'Authorization': f"Bearer {data['token']}"}
+        user_id = data['data']['id']
+        books = load_data('books.json')
+
+        response = self.client.post('/api/borrow', json={'userId': user_id + 1, 'bookId': books[5]['id']}, headers=headers)
+        self.assertEqual(response.status_code, 403)
+        response = self.client.post('/api/borrow', json={'userId': user_id, 'bookId': books[5]['id'], 'userName': '冒名'},
+                                    headers=headers)
+        record = json.loads(response.data)['data']
+        self.assertEqual(record['userName'], '令牌用户')
+        self.assertEqual(self.client.get('/api/users', headers=headers).status_code, 403)
+        self.client.post(f"/api/borrow/{record['id']}/return", headers=headers)
+
+        self.client.post('/api/auth/logout', headers=headers)
+        self.assertEqual(self.client.get('/api/borrow', headers=headers).status_code, 401)
+        self.assertEqual(self.client.get('/api/borrow', headers={'Authorization': 'Bearer bad.token'}).status_code, 401)
+        save_data('users.json', [u for u in load_data('users.json') if u['username'] != 'token_user'])
+
     def test_register_duplicate_username(self):
         """TC-005: 测试重复用户名注册"""
         response = self.client.post('/api/auth/register',
@@ -240,6 +289,24 @@ class TestLibrarySystem(unittest.TestCase):
         self.assertEqual(data['code'], 400)
         self.assertIn('已归还', data['message'])
     
+    def test_borrow_records_filter_by_user(self):
+        """TC-046: 按用户筛选借阅记录"""
+        books = load_data('books.json')
+        book_id = books[3]['id']
+        borrow_response = self.client.post('/api/borrow',
+            json={'userId': 99, 'bookId': book_id, 'userName': '测试'},
+            content_type='application/json')
+        record_id = json.loads(borrow_response.data)['data']['id']
+
+        data = json.loads(self.client.get('/api/borrow?userId=99').data)
+        self.assertEqual([r['id'] for r in data['data']['list']], [record_id])
+        data = json.loads(self.client.get(f'/api/borrow?userId=99&bookId={book_id}&status=borrowed').data)
+        self.assertEqual(data['data']['total'], 1)
+
+        self.client.post(f'/api/borrow/{record_id}/return')
+        data = json.loads(self.client.get('/api/borrow?userId=99&status=borrowed').data)
+        self.assertEqual(data['data']['total'], 0)
+
     # ==================== 统计模块测试 ====================
     def test_get_statistics(self):
         """TC-016: 测试获取统计数据"""
@@ -256,7 +323,54 @@ class TestLibrarySystem(unittest.TestCase):
         data = json.loads(response.data)
         self.assertEqual(data['code'], 200)
         self.assertIsInstance(data['data'], list)
-    
+
+    def test_book_facets(self):
+        """TC-074: 按分类、出版社筛选并返回分面计数，增删改图书后计数随之更新"""
+        data = json.loads(self.client.get('/api/books?category=计算机&facets=1').data)['data']
+        self.assertEqual(data['total'], 3)
+        self.assertEqual(data['facets']['category'], {'计算机': 3})
+        self.assertEqual(data['facets']['publisher'], {'机械工业出版社': 2, '人民邮电出版社': 1})
+        data = json.loads(self.client.get('/api/books?category=计算机&publisher=机械工业出版社').data)['data']
+        self.assertEqual(sorted(b['id'] for b in data['list']), [1, 3])
+
+        response = self.client.post('/api/books',
+            json={'isbn': '978-7-000-00000-2', 'title': '分面测试图书', 'author': '测试作者', 'category': '艺术',
+                  'publishDate': '2024-01-01'},
+            content_type='application/json')
+        book_id = json.loads(response.data)['data']['id']
+        facets = json.loads(self.client.get('/api/books?facets=1').data)['data']['facets']
+        self.assertEqual(facets['category']['艺术'], 1)
+        self.assertEqual(facets['year']['2024'], 1)
+        self.client.put(f'/api/books/{book_id}', json={'category': '计算机'}, content_type='application/json')
+        data = json.loads(self.client.get('/api/books/categories').data)
+        self.assertNotIn('艺术', data['data'])
+        self.assertEqual(json.loads(self.client.get('/api/books?category=计算机').data)['data']['total'], 4)
+        self.client.delete(f'/api/books/{book_id}')
+        self.assertEqual(json.loads(self.client.get('/api/books?year=2024').data)['data']['total'], 0)
+
+    def test_search_books_partial_title(self):
+        """TC-039: 书名片段检索与综合搜索"""
+        response = self.client.get('/api/books?title=楼梦')
+        data = json.loads(response.data)
+        self.assertEqual(data['code'], 200)
+        self.assertIn('红楼梦', [b['title'] for b in data['data']['list']])
+        response = self.client.get('/api/books?q=曹雪芹')
+        data = json.loads(response.data)
+        self.assertEqual(data['data']['list'][0]['title'], '红楼梦')
+
+    def test_search_index_follows_updates(self):
+        """TC-040: 修改书名后检索结果随之更新"""
+        response = self.client.post('/api/books',
+            json={'isbn': '978-7-000-00000-1', 'title': '检索测试图书', 'author': '测试作者', 'total': 1},
+            content_type='application/json')
+        book_id = json.loads(response.data)['data']['id']
+        self.client.put(f'/api/books/{book_id}', json={'title': '更名后的图书'}, content_type='application/json')
+        data = json.loads(self.client.get('/api/books?title=检索测试').data)
+        self.assertEqual(data['data']['total'], 0)
+        data = json.loads(self.client.get('/api/books?title=更名后').data)
+        self.assertEqual([b['id'] for b in data['data']['list']], [book_id])
+        self.client.delete(f'/api/books/{book_id}')
+
     # ==================== 分页测试 ====================
     def test_books_pagination(self):
         """TC-018: 测试图书分页功能"""
@@ -268,6 +382,401 @@ class TestLibrarySystem(unittest.TestCase):
         self.assertEqual(data['data']['pageSize'], 2)
 
 
+    def test_cursor_pagination(self):
+        """TC-048: 游标分页依次取完全部数据，与页码分页结果一致，页码或每页条数无效时返回 400"""
+        expected = json.loads(self.client.get('/api/books?pageSize=1000').data)['data']['list']
+        seen, cursor = [], ''
+        while cursor is not None:
+            data = json.loads(self.client.get(f'/api/books?pageSize=3&cursor={cursor}').data)['data']
+            seen.extend(data['list'])
+            cursor = data['nextCursor']
+        self.assertEqual([b['id'] for b in seen], [b['id'] for b in expected])
+
+        books = load_data('books.json')
+        for book in books[4:7]:
+            self.client.post('/api/borrow', json={'userId': 98, 'bookId': book['id'], 'userName': '测试'},
+                             content_type='application/json')
+        page = json.loads(self.client.get('/api/borrow?userId=98&pageSize=2&cursor=').data)['data']
+        self.assertEqual(page['total'], 3)
+        rest = json.loads(self.client.get(f"/api/borrow?userId=98&pageSize=2&cursor={page['nextCursor']}").data)['data']
+        self.assertIsNone(rest['nextCursor'])
+        by_page = json.loads(self.client.get('/api/borrow?userId=98&pageSize=3').data)['data']['list']
+        self.assertEqual([r['id'] for r in page['list'] + rest['list']], [r['id'] for r in by_page])
+
+        response = self.client.get('/api/borrow?cursor=bad')
+        self.assertEqual(response.status_code, 400)
+        for url in ('/api/books', '/api/borrow'):
+            for query in ('page=0', 'pageSize=-1', 'page=x'):
+                self.assertEqual(self.client.get(f'{url}?{query}').status_code, 400)
+            data = json.loads(self.client.get(f'{url}?pageSize=0').data)['data']
+            self.assertEqual(data['list'], [])
+
+
+    def test_overdue_marked_and_fined(self):
+        """TC-051: 到期未还的借阅被标记为逾期并保存，可查询罚款"""
+        books = load_data('books.json')
+        response = self.client.post('/api/borrow', json={'userId': 97, 'bookId': books[7]['id'], 'userName': '测试'},
+                                    content_type='application/json')
+        record_id = json.loads(response.data)['data']['id']
+        records = load_data('borrow_records.json')
+        for record in records:
+            if record['id'] == record_id:
+                record['dueDate'] = (datetime.now() - timedelta(days=3)).isoformat()
+        save_data('borrow_records.json', records)
+
+        data = json.loads(self.client.get('/api/borrow?userId=97&status=overdue').data)['data']
+        self.assertEqual([r['id'] for r in data['list']], [record_id])
+        stored = next(r for r in load_data('borrow_records.json') if r['id'] == record_id)
+        self.assertEqual(stored['status'], 'overdue')
+        fines = json.loads(self.client.get('/api/borrow/fines?userId=97').data)['data'][0]
+        self.assertEqual(fines['accrued'], 1.5)
+        self.assertEqual(self.client.get('/api/borrow/fines?userId=x').status_code, 400)
+        # 逾期未还时不能重复借同一本书
+        response = self.client.post('/api/borrow', json={'userId': 97, 'bookId': books[7]['id']},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        returned = json.loads(self.client.post(f'/api/borrow/{record_id}/return').data)['data']
+        self.assertEqual(returned['fine'], 1.5)
+
+
+    def test_etag_and_invalidation(self):
+        """TC-053: 图书列表带 ETag，未变化时返回 304，数据修改后重新生成"""
+        response = self.client.get('/api/books?pageSize=100')
+        etag = response.headers['ETag']
+        response = self.client.get('/api/books?pageSize=100', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        add = self.client.post('/api/books', json={'isbn': '978-7-000-00000-2', 'title': '缓存测试图书', 'author': '测试', 'total': 1},
+                               content_type='application/json')
+        book_id = json.loads(add.data)['data']['id']
+        response = self.client.get('/api/books?pageSize=100', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(book_id, [b['id'] for b in json.loads(response.data)['data']['list']])
+        self.client.delete(f'/api/books/{book_id}')
+
+
+    def test_bulk_import_and_export(self):
+        """TC-056: 批量导入跳过重复 ISBN 并报告错误行，导出包含导入的图书"""
+        books = load_data('books.json')
+        lines = [json.dumps({'isbn': 'BULK-1', 'title': '批量图书一', 'author': '甲', 'total': 3}),
+                 json.dumps({'isbn': 'BULK-1', 'title': '重复', 'author': '甲'}),
+                 json.dumps({'isbn': books[0]['isbn'], 'title': '已存在', 'author': '乙'}),
+                 json.dumps({'isbn': 'BULK-2', 'title': '缺少作者'})]
+        response = self.client.post('/api/books/bulk', data='\n'.join(lines), content_type='application/x-ndjson')
+        data = json.loads(response.data)['data']
+        self.assertEqual((data['imported'], data['duplicates'], data['errorCount']), (1, 2, 1))
+        self.assertEqual(data['errors'][0]['line'], 4)
+
+        csv_data = 'isbn,title,author,total\nBULK-3,批量图书三,丙,2\n'
+        data = json.loads(self.client.post('/api/books/bulk', data=csv_data, content_type='text/csv').data)['data']
+        self.assertEqual(data['imported'], 1)
+
+        response = self.client.get('/api/books/export?format=csv')
+        self.assertEqual(response.mimetype, 'text/csv')
+        exported = response.get_data(as_text=True)
+        self.assertIn('批量图书一', exported)
+        self.assertIn('BULK-3', exported)
+        self.assertEqual(len(exported.strip().splitlines()), len(books) + 3)
+        for book in load_data('books.json'):
+            if book['isbn'].startswith('BULK-'):
+                self.client.delete(f"/api/books/{book['id']}")
+
+
+    def test_batch_borrow_and_return(self):
+        """TC-057: 批量借还书在一个事务中完成，atomic 时任一项失败全部撤销"""
+        books = load_data('books.json')
+        stock = {b['id']: b['stock'] for b in books}
+        items = [{'userId': 96, 'bookId': b['id']} for b in books[:3]] + [{'userId': 96, 'bookId': 99999}]
+        response = self.client.post('/api/borrow/batch', json={'items': items, 'atomic': True})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([r['code'] for r in json.loads(response.data)['data']], [200, 200, 200, 404])
+        self.assertEqual({b['id']: b['stock'] for b in load_data('books.json')}, stock)
+
+        with patch.object(repo, '_commit', wraps=repo._commit) as commit:
+            response = self.client.post('/api/borrow/batch', json={'items': items + items[:1]})
+        self.assertEqual(commit.call_count, 1)
+        results = json.loads(response.data)['data']
+        self.assertEqual([r['code'] for r in results], [200, 200, 200, 404, 400])
+        self.assertEqual(load_data('books.json')[0]['stock'], stock[books[0]['id']] - 1)
+
+        record_ids = [r['data']['id'] for r in results[:3]]
+        response = self.client.post('/api/borrow/batch/return', json={'recordIds': record_ids, 'atomic': True})
+        self.assertEqual([r['data']['status'] for r in json.loads(response.data)['data']], ['returned'] * 3)
+        self.assertEqual({b['id']: b['stock'] for b in load_data('books.json')}, stock)
+
+    def test_borrow_validates_ids(self):
+        """TC-101: 单本借书的 userId、bookId 转为整数，字符串 id 不能绕过重复借阅检查，缺少或格式错误时返回 400"""
+        books = load_data('books.json')
+        response = self.client.post('/api/borrow', json={'userId': '94', 'bookId': str(books[3]['id'])})
+        record = json.loads(response.data)['data']
+        self.assertEqual((record['userId'], record['bookId']), (94, books[3]['id']))
+        response = self.client.post('/api/borrow', json={'userId': 94, 'bookId': books[3]['id']})
+        self.assertEqual(response.status_code, 400)
+        for body in ({'userId': 94}, {'userId': 'x', 'bookId': books[3]['id']}, {'userId': 94, 'bookId': [1]}, [1]):
+            self.assertEqual(self.client.post('/api/borrow', json=body).status_code, 400)
+        self.client.post(f"/api/borrow/{record['id']}/return")
+
+    def test_batch_invalid_items(self):
+        """TC-098: 批量借还书中缺少字段或格式错误的项单独返回 400（atomic 时全部撤销），items 不是列表时返回 400"""
+        books = load_data('books.json')
+        stock = {b['id']: b['stock'] for b in books}
+        items = [{'userId': 95, 'bookId': books[0]['id']}, {'userId': 95}, {'userId': 'x', 'bookId': books[1]['id']},
+                 {'userId': 95, 'bookId': [1]}, 'bad']
+        response = self.client.post('/api/borrow/batch', json={'items': items, 'atomic': True})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([r['code'] for r in json.loads(response.data)['data']], [200, 400, 400, 400, 400])
+        self.assertEqual({b['id']: b['stock'] for b in load_data('books.json')}, stock)
+
+        response = self.client.post('/api/borrow/batch', json={'items': items})
+        results = json.loads(response.data)['data']
+        self.assertEqual([r['code'] for r in results], [200, 400, 400, 400, 400])
+        response = self.client.post('/api/borrow/batch/return', json={'recordIds': [results[0]['data']['id'], 'x', None]})
+        self.assertEqual([r['code'] for r in json.loads(response.data)['data']], [200, 400, 400])
+
+        for url, body in (('/api/borrow/batch', {}), ('/api/borrow/batch', {'items': {'userId': 95}}),
+                          ('/api/borrow/batch/return', {'recordIds': 5}), ('/api/borrow/batch', [items[0]])):
+            response = self.client.post(url, json=body)
+            self.assertEqual(response.status_code, 400)
+
+    def test_borrow_timeline(self):
+        """TC-080: 借阅趋势按指定区间和粒度汇总，参数错误时返回 400"""
+        today = datetime.now().date()
+        data = json.loads(self.client.get('/api/statistics/timeline').data)['data']
+        self.assertEqual(len(data['series']), 30)
+        self.assertEqual(data['to'], today.isoformat())
+        before = data['series'][-1]['count']
+        response = self.client.post('/api/borrow', json={'userId': 1, 'bookId': 8})
+        record_id = json.loads(response.data)['data']['id']
+        data = json.loads(self.client.get(f'/api/statistics/timeline?from={today}&to={today}&category=科幻&userId=1').data)['data']
+        self.assertEqual(data['series'], [{'period': today.isoformat(), 'start': today.isoformat(), 'count': 1}])
+        data = json.loads(self.client.get('/api/statistics/timeline?granularity=month').data)['data']
+        self.assertEqual(len(data['series']), 12)
+        self.assertEqual(data['series'][-1]['period'], today.strftime('%Y-%m'))
+        data = json.loads(self.client.get('/api/statistics/timeline').data)['data']
+        self.assertEqual(data['series'][-1]['count'], before + 1)
+        self.client.post(f'/api/borrow/{record_id}/return')
+        for query in ('granularity=year', 'from=2024-13-01', 'from=2024-02-01&to=2024-01-01', 'from=1900-01-01'):
+            self.assertEqual(self.client.get(f'/api/statistics/timeline?{query}').status_code, 400)
+
+    def test_recommendations(self):
+        """TC-083: 相关图书与个人推荐随借阅更新，不推荐已借过的图书"""
+        record_ids = []
+        for user_id, book_id in ((901, 6), (901, 7), (902, 6)):
+            response = self.client.post('/api/borrow', json={'userId': user_id, 'bookId': book_id})
+            record_ids.append(json.loads(response.data)['data']['id'])
+        related = json.loads(self.client.get('/api/books/6/related').data)['data']
+        self.assertIn(7, [b['id'] for b in related])
+        self.assertEqual(related[0]['score'], max(b['score'] for b in related))
+        recommended = json.loads(self.client.get('/api/users/902/recommendations?limit=3').data)['data']
+        self.assertIn(7, [b['id'] for b in recommended])
+        self.assertNotIn(6, [b['id'] for b in recommended])
+        self.assertLessEqual(len(recommended), 3)
+        self.assertEqual(self.client.get('/api/books/999/related').status_code, 404)
+        self.assertEqual(self.client.get('/api/books/6/related?limit=x').status_code, 400)
+        for record_id in record_ids:
+            self.client.post(f'/api/borrow/{record_id}/return')
+
+    def test_hold_queue(self):
+        """TC-086: 无库存时预约排队，还书后分配给队首并可通过长轮询获知，过期后交给下一位或放回库存"""
+        stock = repo.books.get(3)['stock']
+        loans = []
+        for user_id in range(911, 911 + stock):
+            response = self.client.post('/api/borrow', json={'userId': user_id, 'bookId': 3})
+            loans.append(json.loads(response.data)['data']['id'])
+        self.assertEqual(self.client.post('/api/books/4/hold', json={'userId': 921}).status_code, 400)
+        first = json.loads(self.client.post('/api/books/3/hold', json={'userId': 921}).data)['data']
+        second = json.loads(self.client.post('/api/books/3/hold', json={'userId': 922}).data)['data']
+        self.assertEqual((first['status'], first['position'], second['position']), ('waiting', 1, 2))
+        self.assertEqual(self.client.post('/api/books/3/hold', json={'userId': 921}).status_code, 400)
+
+        # 还书后这一册留给队首，库存不变
+        self.client.post(f'/api/borrow/{loans[0]}/return')
+        self.assertEqual(repo.books.get(3)['stock'], 0)
+        data = json.loads(self.client.get('/api/holds/wait?userId=921&timeout=0').data)['data']
+        self.assertEqual([h['id'] for h in data['holds']], [first['id']])
+        data = json.loads(self.client.get(f'/api/holds/wait?userId=921&timeout=0&since={data["since"]}').data)['data']
+        self.assertEqual(data['holds'], [])
+        response = self.client.post('/api/borrow', json={'userId': 922, 'bookId': 3})
+        self.assertEqual(json.loads(response.data)['message'], '库存不足')
+        response = self.client.post('/api/borrow', json={'userId': 921, 'bookId': 3})
+        loans[0] = json.loads(response.data)['data']['id']
+        holds = json.loads(self.client.get('/api/holds?userId=921').data)['data']
+        self.assertEqual(holds[0]['status'], 'fulfilled')
+
+        # 第二位到书后超过保留期未借，这一册放回库存
+        self.client.post(f'/api/borrow/{loans[1]}/return')
+        self.assertEqual(repo.holds.get(second['id'])['status'], 'ready')
+        self.assertEqual(expire_holds(datetime.now() + timedelta(days=4)), 1)
+        self.assertEqual(repo.holds.get(second['id'])['status'], 'expired')
+        self.assertEqual(repo.books.get(3)['stock'], 1)
+        self.assertEqual(self.client.delete(f'/api/holds/{second["id"]}').status_code, 400)
+        for record_id in [loans[0]] + loans[2:]:
+            self.client.post(f'/api/borrow/{record_id}/return')
+        self.assertEqual(repo.books.get(3)['stock'], stock)
+
+    def test_list_fields_and_compression(self):
+        """TC-087: 列表接口按 fields 只输出指定字段，compact=1 按行输出，客户端接受时压缩响应"""
+        full = json.loads(self.client.get('/api/books?pageSize=8').data)['data']
+        data = json.loads(self.client.get('/api/books?pageSize=8&fields=title,stock').data)['data']
+        self.assertEqual(data['list'], [{'id': b['id'], 'title': b['title'], 'stock': b['stock']} for b in full['list']])
+        self.assertEqual(data['total'], full['total'])
+        data = json.loads(self.client.get('/api/books?pageSize=8&compact=1').data)['data']
+        self.assertNotIn('description', data['columns'])
+        self.assertEqual([dict(zip(data['columns'], row)) for row in data['rows']],
+                         [{key: b[key] for key in data['columns']} for b in full['list']])
+        self.assertEqual(self.client.get('/api/books?fields=title,secret').status_code, 400)
+        records = json.loads(self.client.get('/api/borrow?fields=status').data)['data']['list']
+        self.assertTrue(all(set(r) == {'id', 'status'} for r in records))
+
+        # 缓存的响应与未缓存的响应都按 Accept-Encoding 压缩，较小的响应不压缩
+        response = self.client.get('/api/books?pageSize=8', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertEqual(json.loads(gzip.decompress(response.data))['data'], full)
+        response = self.client.get('/api/books?pageSize=8', headers={'Accept-Encoding': 'gzip',
+                                                                      'If-None-Match': response.headers['ETag']})
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get('/api/books?pageSize=8', headers={'Accept-Encoding': 'deflate'})
+        self.assertEqual(json.loads(zlib.decompress(response.data))['data'], full)
+        response = self.client.get('/api/metrics', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('library_collection_records', gzip.decompress(response.data).decode())
+        self.assertNotIn('Content-Encoding', self.client.get('/api/books/categories',
+                                                             headers={'Accept-Encoding': 'gzip'}).headers)
+
+    def test_rename_updates_borrow_records(self):
+        """TC-091: 图书改名、用户改姓名后借阅记录和统计使用新名称，借阅人姓名取自用户资料"""
+        response = self.client.post('/api/borrow', json={'userId': 1, 'bookId': 7, 'userName': '伪造的名字'})
+        record = json.loads(response.data)['data']
+        self.assertEqual(record['userName'], '系统管理员')
+        title = repo.books.get(7)['title']
+        self.client.put('/api/books/7', json={'title': '经济学原理（第8版）'})
+        self.client.put('/api/users/1', json={'name': '管理员'})
+        self.assertEqual(repo.borrow_records.get(record['id'])['bookTitle'], '经济学原理（第8版）')
+        self.assertEqual(repo.borrow_records.get(record['id'])['userName'], '管理员')
+        records = json.loads(self.client.get('/api/borrow?bookId=7&fields=bookTitle').data)['data']['list']
+        self.assertEqual({r['bookTitle'] for r in records}, {'经济学原理（第8版）'})
+        ranking = json.loads(self.client.get('/api/statistics').data)['data']['bookRanking']
+        self.assertNotIn(title, [item['title'] for item in ranking])
+        self.client.put('/api/books/7', json={'title': title})
+        self.client.put('/api/users/1', json={'name': '系统管理员'})
+        self.client.post(f'/api/borrow/{record["id"]}/return')
+
+    def test_recommendations_cache_checks_owner(self):
+        """TC-093: 本人查看过的推荐已缓存，其他用户请求时仍返回 403"""
+        owner = {'Authorization': f"Bearer {token_signer.issue({'id': 931, 'name': '甲'})[0]}"}
+        other = {'Authorization': f"Bearer {token_signer.issue({'id': 932, 'name': '乙'})[0]}"}
+        self.assertEqual(self.client.get('/api/users/931/recommendations', headers=owner).status_code, 200)
+        self.assertEqual(self.client.get('/api/users/931/recommendations', headers=other).status_code, 403)
+
+    def test_timeline_cache_checks_owner(self):
+        """TC-094: 本人查看过的借阅趋势已缓存，其他用户按 userId 请求时仍返回 403"""
+        owner = {'Authorization': f"Bearer {token_signer.issue({'id': 933, 'name': '丙'})[0]}"}
+        other = {'Authorization': f"Bearer {token_signer.issue({'id': 934, 'name': '丁'})[0]}"}
+        self.assertEqual(self.client.get('/api/statistics/timeline?userId=933', headers=owner).status_code, 200)
+        self.assertEqual(self.client.get('/api/statistics/timeline?userId=933', headers=other).status_code, 403)
+        self.assertEqual(self.client.get('/api/statistics/timeline?userId=x', headers=other).status_code, 400)
+
+    def test_borrow_records_filtered_paging(self):
+        """TC-095: 只按图书或状态筛选时，页码分页和游标分页都按借阅时间倒序，与全部命中记录排序后的结果一致"""
+        books = load_data('books.json')
+        for user_id in (951, 952, 953):
+            self.client.post('/api/borrow', json={'userId': user_id, 'bookId': books[0]['id'], 'userName': '测试'},
+                             content_type='application/json')
+            self.client.post('/api/borrow', json={'userId': user_id, 'bookId': books[3]['id'], 'userName': '测试'},
+                             content_type='application/json')
+        records = load_data('borrow_records.json')
+        for query, match in ((f"bookId={books[0]['id']}", lambda r: r['bookId'] == books[0]['id']),
+                             ('status=borrowed', lambda r: r['status'] == 'borrowed'),
+                             (f"bookId={books[3]['id']}&status=borrowed",
+                              lambda r: r['bookId'] == books[3]['id'] and r['status'] == 'borrowed')):
+            expected = [r['id'] for r in sorted((r for r in records if match(r)),
+                                                key=lambda r: (r['borrowDate'], r['id']), reverse=True)]
+            by_page = []
+            for page in range(1, len(expected) // 2 + 2):
+                data = json.loads(self.client.get(f'/api/borrow?{query}&pageSize=2&page={page}').data)['data']
+                self.assertEqual(data['total'], len(expected))
+                by_page.extend(r['id'] for r in data['list'])
+            self.assertEqual(by_page, expected)
+            by_cursor, cursor = [], ''
+            while cursor is not None:
+                data = json.loads(self.client.get(f'/api/borrow?{query}&pageSize=2&cursor={cursor}').data)['data']
+                by_cursor.extend(r['id'] for r in data['list'])
+                cursor = data['nextCursor']
+            self.assertEqual(by_cursor, expected)
+
+    def test_bulk_import_rejects_bad_input(self):
+        """TC-097: 非 UTF-8 编码的文件返回 400 且不导入，ISBN、书名为对象或数组、价格或数量无效的行报告为错误行"""
+        data = 'isbn,title,author\nBULK-GBK,中文书名,作者\n'.encode('gbk')
+        response = self.client.post('/api/books/bulk', data=data, content_type='text/csv')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(any(b['isbn'] == 'BULK-GBK' for b in load_data('books.json')))
+
+        lines = [json.dumps({'isbn': {'a': 1}, 'title': '对象ISBN', 'author': '甲'}),
+                 json.dumps({'isbn': 'BULK-4', 'title': ['数组书名'], 'author': '甲'})]
+        response = self.client.post('/api/books/bulk', data='\n'.join(lines), content_type='application/x-ndjson')
+        data = json.loads(response.data)['data']
+        self.assertEqual((data['imported'], data['errorCount']), (0, 2))
+        self.assertEqual([e['line'] for e in data['errors']], [1, 2])
+
+        lines = ['{"isbn": "BULK-5", "title": "价格无效", "author": "甲", "price": NaN}',
+                 json.dumps({'isbn': 'BULK-6', 'title': '数量为负', 'author': '甲', 'total': -3})]
+        data = json.loads(self.client.post('/api/books/bulk', data='\n'.join(lines),
+                                           content_type='application/x-ndjson').data)['data']
+        self.assertEqual((data['imported'], data['errorCount']), (0, 2))
+        response = self.client.post('/api/books', data='{"isbn": "BULK-7", "title": "t", "author": "a", "price": Infinity}',
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/books', json={'isbn': 'BULK-7', 'title': 't', 'author': 'a', 'total': -1})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.put('/api/books/1', json={'price': -5}).status_code, 400)
+        self.assertNotIn('NaN', self.client.get('/api/books?pageSize=100').get_data(as_text=True))
+
+    def test_hold_wait_does_not_block_other_requests(self):
+        """TC-099: 几个长轮询同时等待时其他请求照常处理，长轮询最多等待 MAX_HOLD_WAIT 秒，timeout 为 nan 等非有限数时返回 400"""
+        def get(url):
+            start = time.monotonic()
+            response = app.test_client().get(url)
+            return response, time.monotonic() - start
+        with patch('app.MAX_HOLD_WAIT', 1), ThreadPoolExecutor(4) as pool:
+            waits = [pool.submit(get, f'/api/holds/wait?userId={user_id}&timeout=30') for user_id in (961, 962, 963)]
+            time.sleep(0.1)
+            response, elapsed = pool.submit(get, '/api/books').result()
+            self.assertEqual(response.status_code, 200)
+            self.assertLess(elapsed, 0.5)
+            self.assertFalse(any(wait.done() for wait in waits))
+            for wait in waits:
+                response, elapsed = wait.result()
+                self.assertEqual(json.loads(response.data)['data']['holds'], [])
+                self.assertLess(elapsed, 3)
+        for timeout in ('nan', 'inf', '-inf', 'x'):
+            response = self.client.get(f'/api/holds/wait?userId=961&timeout={timeout}')
+            self.assertEqual(response.status_code, 400)
+
+    def test_health(self):
+        """TC-076: 健康检查接口无需登录，返回各集合的记录数"""
+        response = self.client.get('/api/health')
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['data']['status'], 'ok')
+        self.assertEqual(data['data']['collections']['books'], len(repo.books))
+        with patch.object(repo, 'collection', side_effect=OSError('磁盘错误')):
+            response = self.client.get('/api/health')
+        self.assertEqual(response.status_code, 503)
+
+    def test_metrics_and_slow_log(self):
+        """TC-068: /api/metrics 输出接口与存储指标，超过阈值的请求写入慢请求日志"""
+        # 注册一个用户，保证有 users 集合的写入（单独运行本测试时也是如此）
+        self.client.post('/api/auth/register', json={'username': 'metrics_user', 'password': 'pw123456'})
+        self.client.get('/api/books/categories')
+        text = self.client.get('/api/metrics').get_data(as_text=True)
+        self.assertIn('route="/api/books/categories"', text)
+        self.assertIn('library_storage_bytes_total{op="write",collection="users"}', text)
+        with patch('app.SLOW_REQUEST_MS', 0.0001), self.assertLogs(app.logger, 'WARNING') as logs:
+            self.client.get('/api/books/categories')
+        self.assertIn('慢请求 GET /api/books/categories', logs.output[0])
+        save_data('users.json', [u for u in load_data('users.json') if u['username'] != 'metrics_user'])
+
+
 class TestPasswordSecurity(unittest.TestCase):
     """密码安全测试"""
     
@@ -0,0 +1,94 @@
+"""
+图书馆管理系统 - 密码哈希单元测试
+"""
+import unittest
+import os
+import sys
+import tempfile
+import time
+from unittest.mock import patch
+sys.path.insert(0, os.path.dirname(__file__))
+
+from auth import (PASSWORD_ITERATIONS, RevocationList, TokenError, TokenSigner, legacy_hash, make_password, needs_upgrade,
+                  verify_password)
+
+
+class TestPasswordHashing(unittest.TestCase):
+    """密码哈希测试"""
+
+    def test_salted_hash(self):
+        """TC-058: 新格式哈希带随机盐，可以校验"""
+        first = make_password('test123', iterations=1000)
+        second = make_password('test123', iterations=1000)
+        self.assertNotEqual(first, second)
+        self.assertTrue(first.startswith('pbkdf2_sha256$1000$'))
+        self.assertTrue(verify_password('test123', first))
+        self.assertFalse(verify_password('test124', first))
+
+    def test_legacy_hash_and_upgrade(self):
+        """TC-059: 旧版哈希仍可校验，并判断为需要升级"""
+        stored = legacy_hash('admin123')
+        self.assertTrue(verify_password('admin123', stored))
+        self.assertFalse(verify_password('admin', stored))
+        self.assertTrue(needs_upgrade(stored))
+        self.assertTrue(needs_upgrade(make_password('admin123', iterations=1000)))
+        self.assertFalse(needs_upgrade(make_password('admin123', iterations=PASSWORD_ITERATIONS)))
+        self.assertFalse(verify_password('admin123', ''))
+
+
+
+class TestTokenSigner(unittest.TestCase):
+    """登录令牌测试"""
+
+    def setUp(self):
+        self.signer = TokenSigner(b'secret', ttl=60)
+        self.user = {'id': 7, 'role': 'user', 'name': '张三'}
+
+    def test_issue_and_verify(self):
+        """TC-061: 签发的令牌可以校验，篡改或换用其他密钥后无效"""
+        token, exp = self.signer.issue(self.user)
+        claims = self.signer.verify(token)
+        self.assertEqual((claims['uid'], claims['role'], claims['name'], claims['exp']), (7, 'user', '张三', exp))
+        payload, signature = token.split('.')
+        forged, _ = TokenSigner(b'other').issue(dict(self.user, role='admin'))
+        for bad in (payload + 'x.' + signature, forged.split('.')[0] + '.' + signature, forged, '', 'abc'):
+            with self.assertRaises(TokenError):
+                self.signer.verify(bad)
+
+    def test_expiry_and_revocation(self):
+        """TC-062: 过期和注销的令牌无效"""
+        token, exp = self.signer.issue(self.user)
+        with self.assertRaises(TokenError):
+            self.signer.verify(token, now=exp + 1)
+        self.signer.revoke(token)
+        with self.assertRaises(TokenError):
+            self.signer.verify(token)
+        other, _ = self.signer.issue(self.user, now=time.time())
+        self.assertEqual(self.signer.verify(other)['uid'], 7)
+
+    def test_revocation_shared_between_processes(self):
+        """TC-100: 注销记录保存在文件中，共用同一文件的其他签发器（其他 worker）也拒绝该令牌；过期条目过多时重写文件"""
+        with tempfile.TemporaryDirectory() as data_dir:
+            path = os.path.join(data_dir, '.revoked_tokens')
+            first = TokenSigner(b'secret', ttl=60, revoked=RevocationList(path))
+            second = TokenSigner(b'secret', ttl=60, revoked=RevocationList(path))
+            token, _ = first.issue(self.user)
+            self.assertEqual(second.verify(token)['uid'], 7)
+            first.revoke(token)
+            with self.assertRaises(TokenError):
+                second.verify(token)
+
+            revoked = RevocationList(path)
+            with patch.object(RevocationList, 'COMPACT_MIN', 4):
+                for i in range(4):
+                    revoked.add(f'old{i}', time.time() - 1)
+                revoked.add('live', time.time() + 60)
+            with open(path) as f:
+                self.assertEqual(len(f.read().splitlines()), 2)
+            self.assertIn('live', second.revoked)
+            with self.assertRaises(TokenError):
+                second.verify(token)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
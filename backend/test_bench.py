@@ -0,0 +1,51 @@
+"""
+图书馆管理系统 - 性能测试工具单元测试
+"""
+import unittest
+import json
+import os
+import shutil
+import sys
+import tempfile
+sys.path.insert(0, os.path.dirname(__file__))
+
+from bench.datagen import generate
+from bench.run import percentile
+
+
+class TestBenchTools(unittest.TestCase):
+    """性能测试数据生成与统计测试"""
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir)
+
+    def test_generated_data_is_consistent(self):
+        """TC-064: 生成的数据规模正确，库存与未归还的借阅一致"""
+        counts = generate(self.data_dir, books=50, users=10, records=500, password_hash='x')
+        self.assertEqual(counts, {'users': 10, 'books': 50, 'borrow_records': 500})
+        data = {}
+        for name in counts:
+            with open(os.path.join(self.data_dir, f'{name}.json'), encoding='utf-8') as f:
+                data[name] = json.load(f)
+        open_loans = {}
+        for record in data['borrow_records']:
+            if record['status'] != 'returned':
+                open_loans[record['bookId']] = open_loans.get(record['bookId'], 0) + 1
+        for book in data['books']:
+            self.assertEqual(book['stock'], book['total'] - open_loans.get(book['id'], 0))
+            self.assertGreaterEqual(book['stock'], 0)
+        self.assertEqual(data['users'][0]['role'], 'admin')
+
+    def test_percentile(self):
+        """TC-065: 分位数按线性插值计算"""
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50.5)
+        self.assertEqual(percentile(values, 100), 100)
+        self.assertIsNone(percentile([], 95))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,64 @@
+"""
+图书馆管理系统 - 批量导入导出单元测试
+"""
+import unittest
+import csv
+import io
+import os
+import sys
+sys.path.insert(0, os.path.dirname(__file__))
+
+from bulk import clean_book, export_rows, read_rows
+
+
+class TestBulk(unittest.TestCase):
+    """批量导入导出测试"""
+
+    def test_export_then_read_round_trip(self):
+        """TC-054: 导出的 CSV / JSON lines 可以重新解析导入"""
+        books = [{'id': i, 'isbn': f'isbn-{i}', 'title': f'图书{i}', 'author': '作者', 'price': 9.5, 'total': 2}
+                 for i in range(1, 1201)]
+        for fmt in ('csv', 'jsonl'):
+            data = ''.join(export_rows(iter(books), fmt)).encode('utf-8')
+            rows = [clean_book(row) for _, row in read_rows(io.BytesIO(data), fmt)]
+            self.assertEqual(len(rows), len(books))
+            self.assertEqual(rows[-1]['isbn'], 'isbn-1200')
+            self.assertEqual(rows[0]['price'], 9.5)
+            self.assertEqual(rows[0]['total'], 2)
+
+    def test_invalid_rows(self):
+        """TC-055: 缺少必填字段或格式错误的行报告行号"""
+        data = '{"isbn": "1", "title": "a", "author": "b"}\nnot json\n\n{"isbn": "2", "title": "c"}\n'
+        rows = list(read_rows(io.BytesIO(data.encode('utf-8')), 'jsonl'))
+        self.assertEqual([line_no for line_no, _ in rows], [1, 2, 4])
+        self.assertEqual(rows[1][1], 'JSON格式错误')
+        with self.assertRaises(ValueError):
+            clean_book(rows[2][1])
+        with self.assertRaises(ValueError):
+            clean_book({'isbn': '3', 'title': 'c', 'author': 'd', 'total': 'x'})
+
+
+    def test_unreadable_file_and_field_types(self):
+        """TC-096: 非 UTF-8 编码或 CSV 格式错误时抛出 ValueError，文本字段为数组、对象或价格、数量为负数、nan、inf 时该行无效"""
+        for fmt in ('csv', 'jsonl'):
+            data = 'isbn,title,author\n1,中文书名,作者\n' if fmt == 'csv' else '{"isbn": "1", "title": "中文书名"}\n'
+            with self.assertRaises(ValueError):
+                list(read_rows(io.BytesIO(data.encode('gbk')), fmt))
+        with self.assertRaises(ValueError):
+            long_field = b'a' * (csv.field_size_limit() + 1)
+            list(read_rows(io.BytesIO(b'isbn,title,author\n1,' + long_field + b',c\n'), 'csv'))
+        for row in ({'isbn': {'a': 1}, 'title': 't', 'author': 'a'},
+                    {'isbn': '1', 'title': ['t'], 'author': 'a'},
+                    {'isbn': '1', 'title': 't', 'author': {'name': 'a'}},
+                    {'isbn': '1', 'title': 't', 'author': 'a', 'publisher': [1]},
+                    {'isbn': True, 'title': 't', 'author': 'a'}):
+            with self.assertRaises(ValueError):
+                clean_book(row)
+        self.assertEqual(clean_book({'isbn': 9787111, 'title': 1984, 'author': 'a'})['isbn'], '9787111')
+        for price, total in (('nan', 1), ('inf', 1), ('-1', 1), ('1', '-2'), ('1', 2.5)):
+            with self.assertRaises(ValueError):
+                clean_book({'isbn': '1', 'title': 't', 'author': 'a', 'price': price, 'total': total})
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,45 @@
+"""
+图书馆管理系统 - 响应缓存单元测试
+"""
+import unittest
+import os
+import sys
+sys.path.insert(0, os.path.dirname(__file__))
+
+from cache import ResponseCache
+
+
+class TestResponseCache(unittest.TestCase):
+    """响应缓存测试"""
+
+    def test_version_and_lru_eviction(self):
+        """TC-052: 版本变化后失效，超出容量时淘汰最久未使用的响应"""
+        cache = ResponseCache(maxsize=2)
+        body, etag = cache.put('a', (1,), b'{"a":1}')
+        self.assertEqual(cache.get('a', (1,)), (body, etag))
+        self.assertIsNone(cache.get('a', (2,)))
+        cache.put('b', (1,), b'{"b":1}')
+        cache.get('a', (1,))
+        cache.put('c', (1,), b'{"c":1}')
+        self.assertIsNone(cache.get('b', (1,)))
+        self.assertIsNotNone(cache.get('a', (1,)))
+        self.assertEqual(len(cache), 2)
+        # 内容相同的响应 ETag 相同
+        self.assertEqual(cache.put('d', (1,), b'{"a":1}')[1], etag)
+
+
+    def test_encoded_variants(self):
+        """TC-089: 压缩后的响应体随响应缓存，版本变化后一起失效"""
+        cache = ResponseCache()
+        cache.put('a', (1,), b'{"a":1}')
+        calls = []
+        encode = lambda body: calls.append(body) or body[::-1]
+        self.assertEqual(cache.encoded('a', (1,), 'gzip', encode), b'}1:"a"{')
+        self.assertEqual(cache.encoded('a', (1,), 'gzip', encode), b'}1:"a"{')
+        self.assertEqual(len(calls), 1)
+        self.assertIsNone(cache.encoded('a', (2,), 'gzip', encode))
+        cache.put('a', (2,), b'{"a":2}')
+        self.assertEqual(cache.encoded('a', (2,), 'gzip', encode), b'}2:"a"{')
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
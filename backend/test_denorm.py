@@ -0,0 +1,45 @@
+"""
+图书馆管理系统 - 冗余字段一致性单元测试
+"""
+import unittest
+import os
+import shutil
+import sys
+import tempfile
+sys.path.insert(0, os.path.dirname(__file__))
+
+from manage import repair_records
+from storage import JsonStorage
+
+
+class TestRepairRecords(unittest.TestCase):
+    """冗余字段修正工具测试"""
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        storage = JsonStorage(self.data_dir)
+        storage.save('books', [{'id': 1, 'title': '三体（新版）'}, {'id': 2, 'title': '红楼梦'}])
+        storage.save('users', [{'id': 2, 'name': '张三'}])
+        storage.save('borrow_records', [
+            {'id': 1, 'userId': 2, 'bookId': 1, 'userName': '张三', 'bookTitle': '三体', 'status': 'returned'},
+            {'id': 2, 'userId': 2, 'bookId': 2, 'userName': '伪造的名字', 'bookTitle': '红楼梦', 'status': 'borrowed'},
+            {'id': 3, 'userId': 9, 'bookId': 9, 'userName': '已删除用户', 'bookTitle': '已删除图书', 'status': 'returned'},
+        ])
+        storage.save('holds', [{'id': 1, 'userId': 2, 'bookId': 1, 'userName': '', 'bookTitle': '三体', 'status': 'waiting'}])
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+    def test_repair_in_one_pass(self):
+        """TC-090: 按当前图书、用户信息修正书名和姓名，来源已删除的记录保持原值，再次运行没有修改"""
+        self.assertEqual(repair_records(self.data_dir), {'borrow_records': 2, 'holds': 1})
+        storage = JsonStorage(self.data_dir)
+        records = storage.load('borrow_records')
+        self.assertEqual([(r['bookTitle'], r['userName']) for r in records],
+                         [('三体（新版）', '张三'), ('红楼梦', '张三'), ('已删除图书', '已删除用户')])
+        self.assertEqual(storage.load('holds')[0]['userName'], '张三')
+        self.assertEqual(repair_records(self.data_dir), {'borrow_records': 0, 'holds': 0})
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
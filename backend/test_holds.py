@@ -0,0 +1,59 @@
+"""
+图书馆管理系统 - 预约队列单元测试
+"""
+import unittest
+import os
+import sys
+from datetime import datetime, timedelta
+sys.path.insert(0, os.path.dirname(__file__))
+
+from holds import HoldQueue
+
+
+def make_hold(hold_id, book_id, status='waiting', expires_at=None):
+    return {'id': hold_id, 'userId': hold_id, 'bookId': book_id, 'status': status,
+            'readyAt': None, 'expiresAt': expires_at.isoformat() if expires_at else None}
+
+
+class TestHoldQueue(unittest.TestCase):
+    """预约队列测试"""
+
+    def test_fifo_queue(self):
+        """TC-084: 每本书的预约按先后出队，取消的预约被跳过，撤销的预约回到原来的位置"""
+        queue = HoldQueue()
+        holds = {i: make_hold(i, 1 if i % 2 else 2) for i in range(1, 9)}
+        queue.rebuild(list(holds.values())[::-1])
+        self.assertEqual(queue.next_waiting(1), 1)
+        self.assertEqual(queue.queue_length(1), 4)
+        self.assertEqual(queue.position(7), 4)
+        # 队首到书、第二位取消
+        queue.apply(holds[1], dict(holds[1], status='ready', expiresAt=datetime.now().isoformat()))
+        queue.apply(holds[3], dict(holds[3], status='cancelled'))
+        self.assertEqual(queue.next_waiting(1), 5)
+        self.assertEqual(queue.position(7), 2)
+        self.assertIsNone(queue.position(3))
+        # 事务撤销后恢复排队
+        queue.apply(dict(holds[3], status='cancelled'), holds[3])
+        self.assertEqual(queue.next_waiting(1), 3)
+        self.assertEqual(queue.position(7), 3)
+        queue.apply(None, make_hold(9, 1))
+        self.assertEqual(queue.position(9), 4)
+        self.assertEqual(queue.next_waiting(2), 2)
+        self.assertIsNone(queue.next_waiting(3))
+
+    def test_expiry(self):
+        """TC-085: 到书保留期过后按截止时间取出过期的预约"""
+        now = datetime.now()
+        queue = HoldQueue()
+        queue.rebuild([make_hold(1, 1, 'ready', now + timedelta(hours=1)),
+                       make_hold(2, 1, 'ready', now - timedelta(hours=1)),
+                       make_hold(3, 2, 'fulfilled')])
+        self.assertEqual(queue.next_expiry(), now - timedelta(hours=1))
+        self.assertEqual(queue.expired(now), [2])
+        queue.apply(make_hold(2, 1, 'ready', now - timedelta(hours=1)), make_hold(2, 1, 'expired'))
+        self.assertEqual(queue.next_expiry(), now + timedelta(hours=1))
+        self.assertEqual(queue.expired(now + timedelta(days=1)), [1])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
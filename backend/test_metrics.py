@@ -0,0 +1,50 @@
+"""
+图书馆管理系统 - 运行指标单元测试
+"""
+import unittest
+import os
+import shutil
+import sys
+import tempfile
+sys.path.insert(0, os.path.dirname(__file__))
+
+from metrics import Histogram, Metrics
+from storage import JsonStorage
+
+
+class TestMetrics(unittest.TestCase):
+    """运行指标测试"""
+
+    def test_histogram_buckets(self):
+        """TC-066: 直方图按桶累计，输出 Prometheus 格式"""
+        histogram = Histogram((0.01, 0.1))
+        for value in (0.005, 0.01, 0.05, 3):
+            histogram.observe(value)
+        self.assertEqual(list(histogram.cumulative()), [(0.01, 2), (0.1, 3), (float('inf'), 4)])
+        metrics = Metrics(buckets=(0.01, 0.1))
+        metrics.observe_request('GET', '/api/books', 200, 0.05)
+        text = metrics.render([('library_collection_records', '集合记录数', {(('collection', 'books'),): 8})])
+        self.assertIn('library_http_requests_total{method="GET",route="/api/books",status="200"} 1', text)
+        self.assertIn('library_http_request_duration_seconds_bucket{method="GET",route="/api/books",le="+Inf"} 1', text)
+        self.assertIn('library_collection_records{collection="books"} 8', text)
+
+    def test_storage_observer(self):
+        """TC-067: 存储读写时上报耗时、字节数和记录数"""
+        data_dir = tempfile.mkdtemp()
+        try:
+            metrics = Metrics()
+            storage = JsonStorage(data_dir)
+            storage.observer = metrics.observe_storage
+            storage.save('books', [{'id': 1}, {'id': 2}])
+            self.assertEqual(storage.load('books'), [{'id': 1}, {'id': 2}])
+            size = os.path.getsize(storage.path('books'))
+            self.assertEqual(metrics.storage_bytes[('write', 'books')], size)
+            self.assertEqual(metrics.storage_bytes[('read', 'books')], size)
+            self.assertEqual(metrics.storage_records[('parse', 'books')], 2)
+            self.assertEqual(metrics.storage_time[('serialize', 'books')].count, 1)
+        finally:
+            shutil.rmtree(data_dir)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,99 @@
+"""
+图书馆管理系统 - 记录类型单元测试
+"""
+import unittest
+import json
+import os
+import shutil
+import sys
+import tempfile
+from datetime import datetime
+sys.path.insert(0, os.path.dirname(__file__))
+
+from models import MODELS, Book, BorrowRecord, json_default, record_json
+from repository import Repository
+from storage import JsonStorage, Journal
+
+
+def make_record(record_id, status='borrowed'):
+    return {'id': record_id, 'userId': 2, 'bookId': 1, 'userName': '张三', 'bookTitle': 'Python编程',
+            'borrowDate': '2024-05-01T10:00:00', 'dueDate': '2024-05-31T10:00:00', 'returnDate': None,
+            'status': status, 'fine': 0}
+
+
+class TestRecord(unittest.TestCase):
+    """记录对象测试"""
+
+    def test_behaves_like_dict(self):
+        """TC-071: 记录按字典方式读取，缺少的字段和额外字段保持原样"""
+        data = {'id': 1, 'isbn': '978-0', 'title': 'Python', 'category': ''.join(['计算机']), 'tags': ['入门']}
+        book = Book(data)
+        self.assertEqual(book['title'], 'Python')
+        self.assertEqual(book['tags'], ['入门'])
+        self.assertEqual(dict(book), data)
+        self.assertEqual(book.to_dict(), data)
+        self.assertEqual(len(book), 5)
+        self.assertNotIn('stock', book)
+        self.assertIsNone(book.get('stock'))
+        with self.assertRaises(KeyError):
+            book['stock']
+        self.assertFalse(hasattr(book, '__dict__'))
+        # 取值有限的字段驻留后共用同一个字符串对象
+        self.assertIs(book['category'], Book(dict(data, id=2, category=''.join(['计', '算机'])))['category'])
+        self.assertEqual(json.loads(json.dumps([book], default=json_default)), [data])
+
+    def test_due_date_parsed_once(self):
+        """TC-072: 借阅记录的应还日期解析后缓存"""
+        record = BorrowRecord(make_record(1))
+        self.assertEqual(record.due_at, datetime(2024, 5, 31, 10, 0))
+        self.assertIs(record.due_at, record.due_at)
+        self.assertEqual(record.to_dict(), make_record(1))
+
+
+    def test_json_fragment_cached(self):
+        """TC-088: 记录的 JSON 文本按字段组合缓存，输出与 json.dumps 结果一致"""
+        record = BorrowRecord(make_record(1))
+        text = record_json(record)
+        self.assertEqual(json.loads(text), make_record(1))
+        self.assertIs(record_json(record), text)
+        fields = ('id', 'status', 'fine')
+        self.assertEqual(json.loads(record_json(record, fields)), {'id': 1, 'status': 'borrowed', 'fine': 0})
+        self.assertEqual(json.loads(record_json(record, fields, row=True)), [1, 'borrowed', 0])
+        self.assertEqual(record_json(make_record(1), fields), record_json(record, fields))
+
+class TestRepositoryModels(unittest.TestCase):
+    """仓库使用记录类型"""
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        JsonStorage(self.data_dir).save('borrow_records', [make_record(i) for i in range(1, 4)])
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+    def test_records_converted_and_saved_as_json(self):
+        """TC-073: 加载、新增、修改后集合中都是记录对象，写回文件与日志的内容不变"""
+        repo = Repository(JsonStorage(self.data_dir, 'compact'), journal=Journal(os.path.join(self.data_dir, 'journal.log')),
+                          lock_dir=self.data_dir, models=MODELS)
+        records = repo.borrow_records
+        self.assertTrue(all(type(r) is BorrowRecord for r in records.all()))
+        old = records.get(1)
+        with repo.transaction('borrow_records'):
+            records.update(1, {'status': 'returned'})
+            records.insert(make_record(4))
+        self.assertEqual(old['status'], 'borrowed')
+        self.assertIsInstance(records.get(1), BorrowRecord)
+        self.assertIsInstance(records.get(4), BorrowRecord)
+
+        # 另一个进程重放日志、压缩后读到相同的数据
+        other = Repository(JsonStorage(self.data_dir, 'compact'), journal=Journal(os.path.join(self.data_dir, 'journal.log')),
+                           lock_dir=self.data_dir, models=MODELS)
+        self.assertEqual(other.borrow_records.get(1)['status'], 'returned')
+        self.assertIsInstance(other.borrow_records.get(4), BorrowRecord)
+        other.compact()
+        saved = JsonStorage(self.data_dir).load('borrow_records')
+        self.assertEqual(saved, [make_record(1, 'returned'), make_record(2), make_record(3), make_record(4)])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
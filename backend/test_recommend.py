@@ -0,0 +1,67 @@
+"""
+图书馆管理系统 - 图书推荐单元测试
+"""
+import unittest
+import os
+import random
+import sys
+sys.path.insert(0, os.path.dirname(__file__))
+
+from recommend import Recommender
+
+
+def make_records(seed=1, n_users=30, n_books=40, n_records=400):
+    rng = random.Random(seed)
+    return [{'id': i, 'userId': rng.randint(1, n_users), 'bookId': rng.randint(1, n_books), 'status': 'borrowed'}
+            for i in range(1, n_records + 1)]
+
+
+def reference_related(records, book_id, top_k):
+    """逐对计算共同读者数"""
+    readers = {}
+    for r in records:
+        readers.setdefault(r['bookId'], set()).add(r['userId'])
+    mine = readers.get(book_id, set())
+    counts = [(len(mine & users), other) for other, users in readers.items() if other != book_id and mine & users]
+    return sorted(counts, key=lambda e: (-e[0], e[1]))[:top_k]
+
+
+class TestRecommender(unittest.TestCase):
+    """共现推荐测试"""
+
+    def assertMatchesReference(self, recommender, records):
+        book_ids = {r['bookId'] for r in records} | {999}
+        for book_id in book_ids:
+            self.assertEqual(recommender.related(book_id), reference_related(records, book_id, recommender.top_k))
+
+    def test_related_matches_pairwise_count(self):
+        """TC-081: 相关图书与逐对计算的共同读者数一致，个人推荐不含已借过的图书"""
+        records = make_records()
+        recommender = Recommender(top_k=5)
+        recommender.rebuild(records)
+        self.assertMatchesReference(recommender, records)
+        borrowed = {r['bookId'] for r in records if r['userId'] == 3}
+        recommended = recommender.recommend(3)
+        self.assertTrue(recommended)
+        self.assertFalse(borrowed & {book_id for _, book_id in recommended})
+        self.assertEqual(recommended, sorted(recommended, key=lambda e: (-e[0], e[1])))
+        self.assertEqual(recommender.recommend(999), [])
+
+    def test_incremental_updates(self):
+        """TC-082: 借阅后已缓存的相关图书增量更新，删除记录后重新计算，结果都与逐条计算一致"""
+        records = make_records(seed=2)
+        recommender = Recommender(top_k=5)
+        recommender.rebuild(records[:100])
+        self.assertMatchesReference(recommender, records[:100])
+        for record in records[100:]:
+            recommender.apply(None, record)
+        recommender.apply(records[0], dict(records[0], status='returned'))
+        self.assertMatchesReference(recommender, records)
+        for record in records[::6]:
+            recommender.apply(record, None)
+        records = [r for r in records if r['id'] % 6 != 1]
+        self.assertMatchesReference(recommender, records)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,304 @@
+"""
+图书馆管理系统 - 数据仓库单元测试
+"""
+import unittest
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import threading
+sys.path.insert(0, os.path.dirname(__file__))
+
+from repository import Repository
+from storage import JsonStorage, Journal
+
+
+class TestRepository(unittest.TestCase):
+    """内存数据仓库测试"""
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.repo = Repository(JsonStorage(self.data_dir))
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir)
+
+    def write_file(self, name, items):
+        with open(os.path.join(self.data_dir, name + '.json'), 'w', encoding='utf-8') as f:
+            json.dump(items, f, ensure_ascii=False)
+
+    def test_collection_cached_until_file_changes(self):
+        """TC-021: 文件未变化时不重新加载，变化后自动重新加载"""
+        self.write_file('books', [{'id': 1, 'title': '红楼梦'}])
+        books = self.repo.books
+        first = books.get(1)
+        self.assertIs(self.repo.books.get(1), first)
+
+        self.write_file('books', [{'id': 1, 'title': '红楼梦'}, {'id': 2, 'title': '三体'}])
+        self.assertEqual(len(self.repo.books), 2)
+        self.assertEqual(self.repo.books.get(2)['title'], '三体')
+
+    def test_update_does_not_mutate_old_item(self):
+        """TC-022: update 生成新对象，旧对象保持不变"""
+        self.write_file('books', [{'id': 1, 'title': '红楼梦', 'stock': 3}])
+        books = self.repo.books
+        old = books.get(1)
+        new = books.update(1, {'stock': 2})
+        self.assertEqual(old['stock'], 3)
+        self.assertEqual(new['stock'], 2)
+        self.assertIs(books.get(1), new)
+
+    def test_save_persists_and_keeps_cache(self):
+        """TC-023: 保存后写回磁盘，且不会触发重复加载"""
+        books = self.repo.books
+        books.insert({'id': books.next_id(), 'title': '三体'})
+        self.repo.save('books')
+        item = self.repo.books.get(1)
+        self.assertIs(self.repo.books.get(1), item)
+
+        other = Repository(JsonStorage(self.data_dir))
+        self.assertEqual(other.books.get(1)['title'], '三体')
+        self.assertEqual(other.books.next_id(), 2)
+
+
+class TestJournal(unittest.TestCase):
+    """日志存储模式测试"""
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.journal_path = os.path.join(self.data_dir, 'journal.log')
+        self.repo = self.open_repo()
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir)
+
+    def open_repo(self, **kwargs):
+        return Repository(JsonStorage(self.data_dir), journal=Journal(self.journal_path), **kwargs)
+
+    def borrow(self, repo, record_id, book_id):
+        repo.borrow_records.insert({'id': record_id, 'bookId': book_id, 'status': 'borrowed'})
+        book = repo.books.get(book_id)
+        repo.books.update(book_id, {'stock': book['stock'] - 1})
+        repo.save('borrow_records', 'books')
+
+    def test_save_appends_one_line_without_rewriting_snapshot(self):
+        """TC-024: 日志模式下提交只追加一行日志"""
+        self.repo.books.insert({'id': 1, 'title': '三体', 'stock': 2})
+        self.repo.save('books')
+        self.repo.compact()
+        snapshot = os.path.join(self.data_dir, 'books.json')
+        mtime = os.stat(snapshot).st_mtime_ns
+
+        self.borrow(self.repo, 1, 1)
+        with open(self.journal_path, encoding='utf-8') as f:
+            lines = f.readlines()
+        self.assertEqual(len(lines), 1)
+        self.assertEqual([op[0] for op in json.loads(lines[0])['ops']], ['borrow_records', 'books'])
+        self.assertEqual(os.stat(snapshot).st_mtime_ns, mtime)
+        with open(os.path.join(self.data_dir, 'borrow_records.json'), encoding='utf-8') as f:
+            self.assertEqual(json.load(f), [])
+
+    def test_recovery_replays_journal_on_snapshot(self):
+        """TC-025: 重启时在快照之上重放日志"""
+        self.repo.books.insert({'id': 1, 'title': '三体', 'stock': 2})
+        self.repo.save('books')
+        self.borrow(self.repo, 1, 1)
+        self.repo.borrow_records.delete(1)
+        self.repo.save('borrow_records')
+
+        other = self.open_repo()
+        self.assertEqual(other.books.get(1)['stock'], 1)
+        self.assertEqual(len(other.borrow_records), 0)
+
+    def test_other_process_appends_are_replayed(self):
+        """TC-026: 其他进程追加的日志会被增量读取"""
+        self.repo.books.insert({'id': 1, 'title': '三体', 'stock': 2})
+        self.repo.save('books')
+        other = self.open_repo()
+        self.assertEqual(other.books.get(1)['stock'], 2)
+
+        self.borrow(self.repo, 1, 1)
+        self.assertEqual(other.books.get(1)['stock'], 1)
+        self.assertEqual(other.borrow_records.get(1)['status'], 'borrowed')
+
+    def test_threshold_compaction(self):
+        """TC-027: 日志超过阈值后压缩回快照文件"""
+        repo = self.open_repo(compact_threshold=1)
+        repo.books.insert({'id': 1, 'title': '三体', 'stock': 2})
+        repo.save('books')
+        self.assertEqual(os.path.getsize(self.journal_path), 0)
+        with open(os.path.join(self.data_dir, 'books.json'), encoding='utf-8') as f:
+            self.assertEqual(json.load(f)[0]['title'], '三体')
+        self.assertEqual(self.open_repo().books.get(1)['stock'], 2)
+
+    def test_flush_waits_for_transactions(self):
+        """TC-075: flush 等待进行中的事务提交完毕，并完成待执行的日志压缩"""
+        repo = self.open_repo(compact_threshold=1)
+        repo.books.insert({'id': 1, 'title': '三体', 'stock': 2})
+        repo.save('books')
+        started, release = threading.Event(), threading.Event()
+
+        def writer():
+            with repo.transaction('books'):
+                repo.books.update(1, {'stock': 1})
+                started.set()
+                release.wait(5)
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+        started.wait(5)
+        threading.Timer(0.1, release.set).start()
+        repo.flush()
+        self.assertEqual(self.open_repo().books.get(1)['stock'], 1)
+        self.assertEqual(os.path.getsize(self.journal_path), 0)
+        thread.join()
+
+
+
+class TestIndex(unittest.TestCase):
+    """二级索引测试"""
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.repo = Repository(JsonStorage(self.data_dir))
+        self.by_user = self.repo.create_index('borrow_records', 'userId')
+        self.open_loans = self.repo.create_index('borrow_records', lambda r: (r['userId'], r['bookId']),
+                                                 where=lambda r: r['status'] == 'borrowed')
+        with self.repo.transaction('borrow_records'):
+            for i, (user_id, book_id) in enumerate([(1, 1), (1, 2), (2, 1)], start=1):
+                self.repo.borrow_records.insert({'id': i, 'userId': user_id, 'bookId': book_id, 'status': 'borrowed'})
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir)
+
+    def test_index_follows_changes(self):
+        """TC-044: 索引随记录新增、修改、删除更新"""
+        self.assertEqual(self.by_user.get(1), {1, 2})
+        self.assertEqual(self.by_user.lookup(1), {1, 2})
+        self.assertEqual(self.by_user.intersect(1, {2, 3}), {2})
+        self.assertEqual(self.by_user.intersect(1, [3, 1]), {1})
+        self.assertEqual(self.by_user.lookup(9), set())
+        self.assertEqual(self.open_loans.first((1, 2)), 2)
+        with self.repo.transaction('borrow_records'):
+            self.repo.borrow_records.update(2, {'status': 'returned'})
+            self.repo.borrow_records.delete(3)
+        self.assertEqual(self.open_loans.count((1, 2)), 0)
+        self.assertEqual(self.by_user.get(2), set())
+        self.assertEqual(self.by_user.get(1), {1, 2})
+
+    def test_index_rebuilt_on_reload_and_rollback(self):
+        """TC-045: 重新加载和回滚后索引保持一致"""
+        with self.assertRaises(RuntimeError):
+            with self.repo.transaction('borrow_records'):
+                self.repo.borrow_records.insert({'id': 4, 'userId': 3, 'bookId': 1, 'status': 'borrowed'})
+                raise RuntimeError('模拟故障')
+        self.assertEqual(self.by_user.get(3), set())
+
+        other = Repository(JsonStorage(self.data_dir))
+        with other.transaction('borrow_records'):
+            other.borrow_records.insert({'id': 4, 'userId': 3, 'bookId': 1, 'status': 'borrowed'})
+        self.assertEqual(len(self.repo.borrow_records), 4)
+        self.assertEqual(self.by_user.get(3), {4})
+        self.assertEqual(self.open_loans.first((3, 1)), 4)
+
+    def test_ordered_index_scan(self):
+        """TC-047: 有序索引按分组排序，可从游标位置继续读取"""
+        by_date = self.repo.create_ordered_index('borrow_records', 'bookId', group='userId')
+        self.assertEqual(list(by_date.scan(1)), [(1, 1), (2, 2)])
+        self.assertEqual(list(by_date.scan(1, after=(1, 1))), [(2, 2)])
+        self.assertEqual(list(by_date.scan(1, reverse=True)), [(2, 2), (1, 1)])
+        self.assertEqual(list(by_date.scan(1, after=(2, 2), reverse=True)), [(1, 1)])
+        self.assertEqual(list(by_date.scan(1, offset=1, reverse=True)), [(1, 1)])
+        self.assertEqual(list(by_date.scan(1, offset=-1)), [(1, 1), (2, 2)])
+        with self.repo.transaction('borrow_records'):
+            self.repo.borrow_records.update(3, {'userId': 1})
+        self.assertEqual(list(by_date.scan(1)), [(1, 1), (1, 3), (2, 2)])
+        self.assertEqual(by_date.count(2), 0)
+
+
+def _borrow_in_process(data_dir, times):
+    """子进程中反复借同一本书（每次一个事务）"""
+    repo = Repository(JsonStorage(data_dir), lock_dir=data_dir)
+    for _ in range(times):
+        with repo.transaction('books', 'borrow_records'):
+            book = repo.books.get(1)
+            if book['stock'] > 0:
+                repo.borrow_records.insert({'id': repo.borrow_records.next_id(), 'bookId': 1})
+                repo.books.update(1, {'stock': book['stock'] - 1})
+
+
+class TestTransaction(unittest.TestCase):
+    """事务与并发测试"""
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.repo = Repository(JsonStorage(self.data_dir), lock_dir=self.data_dir)
+        with self.repo.transaction('books'):
+            self.repo.books.insert({'id': 1, 'title': '三体', 'stock': 10})
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir)
+
+    def borrow(self, repo):
+        with repo.transaction('books', 'borrow_records'):
+            book = repo.books.get(1)
+            if book['stock'] <= 0:
+                return False
+            repo.borrow_records.insert({'id': repo.borrow_records.next_id(), 'bookId': 1})
+            repo.books.update(1, {'stock': book['stock'] - 1})
+            return True
+
+    def test_concurrent_threads_do_not_overbook(self):
+        """TC-032: 多线程并发借阅同一本书不会超借"""
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.borrow(self.repo))) for _ in range(30)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(results.count(True), 10)
+        other = Repository(JsonStorage(self.data_dir))
+        self.assertEqual(other.books.get(1)['stock'], 0)
+        self.assertEqual(len(other.borrow_records), 10)
+
+    def test_concurrent_processes_do_not_overbook(self):
+        """TC-033: 多个进程共用数据目录时不会超借"""
+        ctx = multiprocessing.get_context('fork')
+        procs = [ctx.Process(target=_borrow_in_process, args=(self.data_dir, 5)) for _ in range(4)]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+        self.assertEqual(self.repo.books.get(1)['stock'], 0)
+        self.assertEqual(len(self.repo.borrow_records), 10)
+
+    def test_exception_rolls_back(self):
+        """TC-034: 事务中出错时回滚内存中的修改"""
+        with self.assertRaises(RuntimeError):
+            with self.repo.transaction('books', 'borrow_records'):
+                self.repo.borrow_records.insert({'id': 1, 'bookId': 1})
+                self.repo.books.update(1, {'stock': 9})
+                raise RuntimeError('模拟故障')
+        self.assertEqual(self.repo.books.get(1)['stock'], 10)
+        self.assertEqual(len(self.repo.borrow_records), 0)
+        self.assertEqual(Repository(JsonStorage(self.data_dir)).books.get(1)['stock'], 10)
+
+    def test_interrupted_commit_is_completed(self):
+        """TC-035: 多文件提交中途崩溃后按提交意图继续完成"""
+        with open(os.path.join(self.data_dir, 'books.json.tmp'), 'w', encoding='utf-8') as f:
+            json.dump([{'id': 1, 'title': '三体', 'stock': 9}], f)
+        with open(os.path.join(self.data_dir, 'borrow_records.json.tmp'), 'w', encoding='utf-8') as f:
+            json.dump([{'id': 1, 'bookId': 1}], f)
+        with open(os.path.join(self.data_dir, 'commit.intent'), 'w', encoding='utf-8') as f:
+            json.dump([['borrow_records.json.tmp', 'borrow_records.json'], ['books.json.tmp', 'books.json']], f)
+
+        repo = Repository(JsonStorage(self.data_dir))
+        self.assertEqual(repo.books.get(1)['stock'], 9)
+        self.assertEqual(len(repo.borrow_records), 1)
+        self.assertFalse(os.path.exists(os.path.join(self.data_dir, 'commit.intent')))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
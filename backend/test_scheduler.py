@@ -0,0 +1,53 @@
+"""
+图书馆管理系统 - 到期调度单元测试
+"""
+import unittest
+import os
+import sys
+from datetime import datetime, timedelta
+sys.path.insert(0, os.path.dirname(__file__))
+
+from scheduler import DueDateScheduler, compute_fine
+
+
+def make_record(record_id, user_id, due_date, status='borrowed', fine=0):
+    return {'id': record_id, 'userId': user_id, 'bookId': record_id, 'status': status, 'fine': fine,
+            'borrowDate': (due_date - timedelta(days=30)).isoformat(), 'dueDate': due_date.isoformat()}
+
+
+class TestDueDateScheduler(unittest.TestCase):
+    """到期调度器测试"""
+
+    def setUp(self):
+        self.now = datetime(2024, 6, 1, 12, 0)
+        self.scheduler = DueDateScheduler()
+        self.records = [make_record(i, 1 + i % 2, self.now + timedelta(days=5 - i)) for i in range(1, 11)]
+        self.scheduler.rebuild(self.records)
+
+    def test_due_returns_expired_loans_in_order(self):
+        """TC-049: 只返回已过应还日期的借阅，按应还日期排序"""
+        self.assertEqual(self.scheduler.due(self.now), [10, 9, 8, 7, 6])
+        self.assertEqual(self.scheduler.next_due(), self.now - timedelta(days=5))
+        # 归还或标记逾期后不再返回
+        self.scheduler.apply(self.records[9], dict(self.records[9], status='returned'))
+        self.scheduler.apply(self.records[8], dict(self.records[8], status='overdue'))
+        self.assertEqual(self.scheduler.due(self.now), [8, 7, 6])
+        self.assertEqual(self.scheduler.next_due(), self.now - timedelta(days=3))
+
+    def test_user_fines(self):
+        """TC-050: 按用户汇总逾期未还和已归还记录的罚款"""
+        for record in self.records[5:]:
+            self.scheduler.apply(record, dict(record, status='overdue'))
+        returned = dict(self.records[0], status='returned', fine=1.5)
+        self.scheduler.apply(self.records[0], returned)
+        fines = self.scheduler.user_fines(2, self.now)
+        # 用户 2：逾期 2、4 天的两笔，加上已归还记录上的 1.5
+        self.assertEqual(fines['overdueCount'], 2)
+        self.assertEqual(fines['accrued'], 3.0)
+        self.assertEqual(fines['settled'], 1.5)
+        self.assertEqual([f['userId'] for f in self.scheduler.fines(self.now)], [1, 2])
+        self.assertEqual(compute_fine(self.now + timedelta(days=1), self.now), 0)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
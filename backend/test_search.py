@@ -0,0 +1,53 @@
+"""
+图书馆管理系统 - 图书检索索引单元测试
+"""
+import unittest
+import os
+import sys
+sys.path.insert(0, os.path.dirname(__file__))
+
+from search import SearchIndex
+
+BOOKS = [
+    {'id': 1, 'title': 'JavaScript高级程序设计', 'author': 'Nicholas C. Zakas', 'publisher': '机械工业出版社', 'description': 'JavaScript经典教程'},
+    {'id': 2, 'title': '红楼梦', 'author': '曹雪芹', 'publisher': '人民文学出版社', 'description': '中国古典四大名著之一'},
+    {'id': 3, 'title': '红楼梦魇', 'author': '张爱玲', 'publisher': '北京十月文艺出版社', 'description': '张爱玲的红楼梦考据'},
+    {'id': 4, 'title': '三体', 'author': '刘慈欣', 'publisher': '重庆出版社', 'description': '中国科幻里程碑之作'},
+]
+
+
+class TestSearchIndex(unittest.TestCase):
+    """倒排索引测试"""
+
+    def setUp(self):
+        self.index = SearchIndex()
+        self.index.rebuild(BOOKS)
+
+    def test_partial_chinese_match(self):
+        """TC-036: 中文书名按任意片段匹配"""
+        self.assertEqual(self.index.match('title', '楼梦'), {2, 3})
+        self.assertEqual(self.index.match('title', '梦'), {2, 3})
+        self.assertEqual(self.index.match('title', '梦楼'), set())
+        self.assertEqual(self.index.match('author', 'zakas'), {1})
+
+    def test_incremental_update(self):
+        """TC-037: 图书增删改后索引增量更新"""
+        self.index.apply(None, {'id': 5, 'title': '梦的解析', 'author': '弗洛伊德'})
+        self.assertEqual(self.index.match('title', '梦'), {2, 3, 5})
+        self.index.apply(BOOKS[1], dict(BOOKS[1], title='石头记'))
+        self.assertEqual(self.index.match('title', '楼梦'), {3})
+        self.assertEqual(self.index.match('title', '石头'), {2})
+        self.index.apply(BOOKS[2], None)
+        self.assertEqual(self.index.match('title', '梦'), {5})
+
+    def test_ranked_search(self):
+        """TC-038: 综合搜索按相关度排序，多个关键词需同时命中"""
+        self.assertEqual(self.index.search('红楼梦'), [2, 3])
+        self.assertEqual(self.index.search('红楼梦 张爱玲'), [3])
+        self.assertEqual(self.index.search('中国'), [2, 4])
+        self.assertEqual(self.index.search('红楼梦', within={3}), [3])
+        self.assertEqual(self.index.search('哈利波特'), [])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
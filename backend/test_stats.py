@@ -0,0 +1,183 @@
+"""
+图书馆管理系统 - 借阅统计单元测试
+"""
+import unittest
+import os
+import random
+import sys
+from datetime import date, datetime, timedelta
+sys.path.insert(0, os.path.dirname(__file__))
+
+from stats import BorrowTimeline, StatisticsEngine, buckets
+
+
+def make_data(seed=1, n_books=20, n_records=300):
+    rng = random.Random(seed)
+    now = datetime.now()
+    books = [{'id': i, 'title': f'图书{i}', 'category': rng.choice(['计算机', '文学', '历史'])} for i in range(1, n_books + 1)]
+    records = []
+    for i in range(1, n_records + 1):
+        borrow = now - timedelta(days=rng.randint(0, 200), hours=rng.randint(0, 23))
+        status = rng.choice(['borrowed', 'returned'])
+        book_id = rng.randint(1, n_books + 2)   # 包含已删除图书的借阅记录
+        records.append({'id': i, 'userId': rng.randint(1, 5), 'bookId': book_id, 'bookTitle': f'图书{book_id}',
+                        'borrowDate': borrow.isoformat(), 'dueDate': (borrow + timedelta(days=30)).isoformat(),
+                        'status': status})
+    return books, records, now
+
+
+def reference_statistics(records, books, now):
+    """原 get_statistics 的逐条计算方式"""
+    book_count = {}
+    for r in records:
+        book_count[r['bookTitle']] = book_count.get(r['bookTitle'], 0) + 1
+    monthly = []
+    for i in range(5, -1, -1):
+        year, month = divmod(now.year * 12 + now.month - 1 - i, 12)
+        month += 1
+        count = len([r for r in records if datetime.fromisoformat(r['borrowDate']).year == year
+                     and datetime.fromisoformat(r['borrowDate']).month == month])
+        monthly.append({'month': f'{year}-{month:02d}', 'count': count})
+    category = {}
+    for r in records:
+        book = next((b for b in books if b['id'] == r['bookId']), None)
+        if book:
+            category[book['category']] = category.get(book['category'], 0) + 1
+    return {
+        'currentBorrowed': len([r for r in records if r['status'] != 'returned']),
+        'overdueCount': len([r for r in records if r['status'] == 'borrowed' and datetime.fromisoformat(r['dueDate']) < now]),
+        'bookRanking': sorted(book_count.values(), reverse=True)[:10],
+        'monthlyStats': monthly,
+        'categoryStats': category,
+    }
+
+
+class TestStatisticsEngine(unittest.TestCase):
+    """统计引擎测试"""
+
+    def assertMatchesReference(self, engine, records, books, now):
+        summary = engine.summary(now, len(records))
+        expected = reference_statistics(records, books, now)
+        self.assertEqual(summary['totalBorrows'], len(records))
+        self.assertEqual(summary['currentBorrowed'], expected['currentBorrowed'])
+        self.assertEqual(summary['overdueCount'], expected['overdueCount'])
+        self.assertEqual([r['count'] for r in summary['bookRanking']], expected['bookRanking'])
+        self.assertEqual(summary['monthlyStats'], expected['monthlyStats'])
+        self.assertEqual(summary['categoryStats'], expected['categoryStats'])
+
+    def test_rebuild_matches_full_scan(self):
+        """TC-041: 从历史重建的统计与逐条计算结果一致"""
+        books, records, now = make_data()
+        engine = StatisticsEngine()
+        engine.rebuild_books(books)
+        engine.rebuild_records(records)
+        self.assertMatchesReference(engine, records, books, now)
+
+    def test_incremental_matches_full_scan(self):
+        """TC-042: 借阅/归还事件增量更新后与逐条计算结果一致"""
+        books, records, now = make_data(seed=2)
+        engine = StatisticsEngine()
+        engine.rebuild_books(books)
+        engine.rebuild_records([])
+        current = {}
+        for record in records:
+            engine.apply_record(None, record)
+            current[record['id']] = record
+        for record in records[::3]:
+            returned = dict(record, status='returned')
+            engine.apply_record(current[record['id']], returned)
+            current[record['id']] = returned
+        for record in records[::7]:
+            engine.apply_record(current.pop(record['id']), None)
+        self.assertMatchesReference(engine, list(current.values()), books, now)
+
+    def test_book_changes_move_category_counts(self):
+        """TC-043: 图书改分类或删除后分类统计随之调整"""
+        books, records, now = make_data(seed=3)
+        engine = StatisticsEngine()
+        engine.rebuild_books(books)
+        engine.rebuild_records(records)
+        changed = dict(books[0], category='科幻')
+        engine.apply_book(books[0], changed)
+        engine.apply_book(books[1], None)
+        books = [changed] + books[2:]
+        self.assertMatchesReference(engine, records, books, now)
+
+    def test_ranking_uses_current_title(self):
+        """TC-092: 借阅排行按图书计数，图书改名后显示新书名，不会拆成两条"""
+        books, records, now = make_data(seed=6)
+        engine = StatisticsEngine()
+        engine.rebuild_books(books)
+        engine.rebuild_records(records)
+        top_id = max(range(1, 21), key=lambda i: (sum(r['bookId'] == i for r in records), -i))
+        count = sum(r['bookId'] == top_id for r in records)
+        renamed = dict(books[top_id - 1], title='新书名')
+        engine.apply_book(books[top_id - 1], renamed)
+        engine.apply_record(None, dict(records[0], id=10000, bookId=top_id, bookTitle='新书名'))
+        ranking = engine.summary(now, len(records) + 1)['bookRanking']
+        self.assertEqual([item for item in ranking if item['title'] == '新书名'], [{'title': '新书名', 'count': count + 1}])
+        self.assertNotIn(books[top_id - 1]['title'], [item['title'] for item in ranking])
+
+    def test_monthly_stats_use_calendar_months(self):
+        """TC-077: 月度统计按自然月倒推，月末时不会重复或跳过月份"""
+        engine = StatisticsEngine()
+        months = [item['month'] for item in engine.monthly_stats(datetime(2024, 3, 31), months=6)]
+        self.assertEqual(months, ['2023-10', '2023-11', '2023-12', '2024-01', '2024-02', '2024-03'])
+
+
+class TestBorrowTimeline(unittest.TestCase):
+    """借阅时间序列测试"""
+
+    def assertMatchesScan(self, timeline, records, books, first, last, granularity, category=None, user_id=None):
+        categories = {b['id']: b['category'] for b in books}
+        series = timeline.series(first, last, granularity, category, user_id)
+        expected = []
+        for label, start, end in buckets(first, last, granularity):
+            expected.append(len([r for r in records if start <= date.fromisoformat(r['borrowDate'][:10]) < end
+                                 and (category is None or categories.get(r['bookId']) == category)
+                                 and (user_id is None or r['userId'] == user_id)]))
+        self.assertEqual([item['count'] for item in series], expected)
+        return series
+
+    def test_series_matches_full_scan(self):
+        """TC-078: 任意区间按天/周/月汇总的次数与逐条计算一致，支持分类、用户筛选"""
+        books, records, now = make_data(seed=4)
+        timeline = BorrowTimeline()
+        timeline.rebuild_books(books)
+        timeline.rebuild_records(records)
+        today = now.date()
+        for granularity in ('day', 'week', 'month'):
+            for first, last in ((today - timedelta(days=250), today), (today - timedelta(days=45), today - timedelta(days=3))):
+                series = self.assertMatchesScan(timeline, records, books, first, last, granularity)
+                self.assertEqual(series[0]['start'], first.isoformat())
+                self.assertMatchesScan(timeline, records, books, first, last, granularity, category='文学')
+                self.assertMatchesScan(timeline, records, books, first, last, granularity, user_id=3)
+                self.assertMatchesScan(timeline, records, books, first, last, granularity, category='历史', user_id=2)
+        labels = [item['period'] for item in timeline.series(date(2024, 1, 30), date(2024, 3, 2), 'month')]
+        self.assertEqual(labels, ['2024-01', '2024-02', '2024-03'])
+
+    def test_incremental_updates(self):
+        """TC-079: 借阅、删除记录及图书改分类后时间序列随之更新"""
+        books, records, now = make_data(seed=5)
+        timeline = BorrowTimeline()
+        timeline.rebuild_records([])
+        timeline.rebuild_books(books)
+        for record in records:
+            timeline.apply_record(None, record)
+        for record in records[::4]:
+            timeline.apply_record(record, dict(record, status='returned'))
+        for record in records[::5]:
+            timeline.apply_record(record, None)
+        records = [r for r in records if r['id'] % 5 != 1]
+        changed = dict(books[0], category='科幻')
+        timeline.apply_book(books[0], changed)
+        books = [changed] + books[1:]
+        first, last = now.date() - timedelta(days=210), now.date()
+        for granularity in ('day', 'month'):
+            self.assertMatchesScan(timeline, records, books, first, last, granularity)
+            self.assertMatchesScan(timeline, records, books, first, last, granularity, category='科幻')
+            self.assertMatchesScan(timeline, records, books, first, last, granularity, category='计算机')
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
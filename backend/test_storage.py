@@ -0,0 +1,116 @@
+"""
+图书馆管理系统 - 存储后端单元测试
+"""
+import unittest
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+sys.path.insert(0, os.path.dirname(__file__))
+
+from manage import convert_format, migrate_sqlite
+from repository import Repository
+from storage import JsonStorage, SqliteStorage
+
+
+class TestSqliteStorage(unittest.TestCase):
+    """SQLite 存储测试"""
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.data_dir, 'library.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir)
+
+    def test_round_trip_keeps_data_model(self):
+        """TC-028: 写入 SQLite 后读出的记录与原数据一致"""
+        storage = SqliteStorage(self.db_path)
+        book = {'id': 1, 'isbn': '978-7-020-02308-4', 'title': '红楼梦', 'author': '曹雪芹', 'publisher': '人民文学出版社',
+                'category': '文学', 'price': 59.7, 'stock': 8, 'total': 15, 'publishDate': '1996-12-01',
+                'description': '中国古典四大名著之一', 'tags': ['古典']}
+        record = {'id': 1, 'userId': 1, 'bookId': 1, 'userName': '', 'bookTitle': '红楼梦', 'borrowDate': '2024-01-01T00:00:00',
+                  'dueDate': '2024-01-31T00:00:00', 'returnDate': None, 'status': 'borrowed', 'fine': 0}
+        storage.save('books', [book])
+        storage.save('borrow_records', [record])
+        self.assertEqual(storage.load('books'), [book])
+        loaded = storage.load('borrow_records')
+        self.assertEqual(loaded, [record])
+        self.assertIsInstance(loaded[0]['fine'], int)
+
+    def test_repository_commits_single_records(self):
+        """TC-029: 仓库提交按记录写入，其他进程通过版本号感知变化"""
+        repo = Repository(SqliteStorage(self.db_path))
+        other = Repository(SqliteStorage(self.db_path))
+        repo.books.insert({'id': 1, 'title': '三体', 'stock': 2})
+        repo.books.insert({'id': 2, 'title': '百年孤独', 'stock': 1})
+        repo.save('books')
+        self.assertEqual(len(other.books), 2)
+
+        repo.books.update(1, {'stock': 1})
+        repo.books.delete(2)
+        repo.save('books')
+        self.assertEqual(other.books.get(1)['stock'], 1)
+        self.assertNotIn(2, other.books)
+
+    def test_indexes_created(self):
+        """TC-030: 建立查询所需的索引"""
+        SqliteStorage(self.db_path)
+        db = sqlite3.connect(self.db_path)
+        indexes = {row[0]: row[1] for row in db.execute("SELECT name, tbl_name FROM sqlite_master WHERE type = 'index'")}
+        db.close()
+        self.assertEqual(indexes['idx_books_isbn'], 'books')
+        self.assertEqual(indexes['idx_users_username'], 'users')
+        self.assertEqual(indexes['idx_borrow_records_user_status'], 'borrow_records')
+
+    def test_migrate_from_json(self):
+        """TC-031: 迁移工具导入已有的 JSON 数据"""
+        books = [{'id': 1, 'title': '三体', 'stock': 7}, {'id': 2, 'title': '红楼梦', 'stock': 8}]
+        with open(os.path.join(self.data_dir, 'books.json'), 'w', encoding='utf-8') as f:
+            json.dump(books, f, ensure_ascii=False)
+        counts = migrate_sqlite(self.data_dir, self.db_path)
+        self.assertEqual(counts['books'], 2)
+        self.assertEqual(counts['users'], 0)
+        self.assertEqual(Repository(SqliteStorage(self.db_path)).books.get(2)['title'], '红楼梦')
+
+
+
+class TestJsonFormats(unittest.TestCase):
+    """JSON 数据文件格式测试"""
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.records = [{'id': i, 'userId': i % 3, 'bookTitle': f'图书{i % 2}', 'status': 'borrowed',
+                         'returnDate': None if i % 2 else '2024-01-01'} for i in range(1, 21)]
+        self.records[0]['tags'] = ['新书']
+        del self.records[1]['status']
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir)
+
+    def test_round_trip_each_format(self):
+        """TC-069: 各种格式写入后读出的数据一致，并能识别文件格式"""
+        for fmt in ('pretty', 'compact', 'columnar'):
+            storage = JsonStorage(self.data_dir, fmt)
+            storage.save('borrow_records', self.records)
+            self.assertEqual(storage.file_format('borrow_records'), fmt)
+            # 读取时按文件内容识别格式，与配置无关
+            self.assertEqual(JsonStorage(self.data_dir).load('borrow_records'), self.records)
+        loaded = JsonStorage(self.data_dir).load('borrow_records')
+        self.assertIs(loaded[2]['bookTitle'], loaded[4]['bookTitle'])
+        self.assertNotIn('tags', loaded[1])
+
+    def test_convert_legacy_files(self):
+        """TC-070: 把旧格式的数据文件转换为按列存储"""
+        JsonStorage(self.data_dir).save('borrow_records', self.records)
+        counts = convert_format(self.data_dir, 'columnar')
+        self.assertEqual(counts['borrow_records'], 20)
+        storage = JsonStorage(self.data_dir, 'columnar')
+        self.assertEqual(storage.file_format('borrow_records'), 'columnar')
+        self.assertEqual(storage.load('borrow_records'), self.records)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)